@@ -1,20 +1,64 @@
+import os
+
 import click
 
-from compare import compare_and_return_new_goal
-from generator import generate_ai_hint
+# Subcommands import what they need when they run, so `astHint logo` or `astHint compare` never loads the
+# OpenAI client, the server or the problem index
 
 fg_ast_hint = 'blue'
+approximate_hint_note = 'The search for the next state was cut short, this is the best hint it found.'
 
 
 @click.group()
 @click.option(
     "--log-level",
-    type=str,
+    type=click.Choice(["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL", "OFF"], case_sensitive=False),
     default="WARNING",
-    help="Log level: DEBUG|INFO|WARNING|ERROR|CRITICAL",
+    help="Log level: DEBUG|INFO|WARNING|ERROR|CRITICAL, or OFF to disable logging",
+)
+@click.option(
+    "--goal-cache",
+    type=click.Path(file_okay=False),
+    envvar="AST_HINT_GOAL_CACHE",
+    default=None,
+    help="Directory to keep canonicalized solutions in between runs. Its files are unpickled, so only use a "
+         "directory that no untrusted user can write to.",
+)
+@click.option(
+    "--goal-cache-size",
+    type=int,
+    default=64,
+    show_default=True,
+    help="Size cap of the goal cache in megabytes.",
+)
+@click.option(
+    "--normalize",
+    type=click.Choice(["none", "fast", "autopep8"]),
+    envvar="AST_HINT_NORMALIZE",
+    default="autopep8",
+    show_default=True,
+    help="How code is formatted before comparing, hints point at lines and columns of the formatted code.",
 )
-def ast_hint(log_level):
-    pass
+@click.option(
+    "--time-budget",
+    type=click.FloatRange(min=0, min_open=True),
+    envvar="AST_HINT_TIME_BUDGET",
+    default=None,
+    help="Seconds a comparison may take before it settles for the best hint found so far. Formatting, "
+         "canonicalization and the first diff of the submission run to their end, so a large submission can "
+         "overshoot the budget by as long as they take.",
+)
+def ast_hint(log_level, goal_cache, goal_cache_size, normalize, time_budget):
+    from comparison.utils.normalize import set_normalize_mode
+    from comparison.utils.tools import set_log_level
+    set_log_level(log_level)
+    set_normalize_mode(normalize)
+    if goal_cache:
+        from compare import use_goal_cache
+        use_goal_cache(goal_cache, goal_cache_size * 1024 * 1024)
+    if time_budget is not None:
+        from compare import set_time_budget
+        set_time_budget(time_budget)
 
 
 # Define the ASCII art by lines
@@ -49,14 +93,22 @@ def logo():
 @ast_hint.command()
 @click.argument('student_solution', type=click.File('r'))
 @click.argument('correct_solution', type=click.File('r'))
-def compare(student_solution, correct_solution):
+@click.option('--profile', is_flag=True, help='Report the time spent in each stage, call counts and peak memory.')
+def compare(student_solution, correct_solution, profile):
     """
     Compare the given files.
     """
     content1 = student_solution.read()
     content2 = correct_solution.read()
-    edit, ephemeral_goal = compare_internal(content1, content2)
+    if not profile:
+        edit, ephemeral_goal = compare_internal(content1, content2)
+        click.echo((click.style(f'Your hint is:\n{edit}', fg='green')))
+        return
+    from comparison.utils.profiling import profiling, format_report
+    with profiling() as hint_profile:
+        edit, ephemeral_goal = compare_internal(content1, content2)
     click.echo((click.style(f'Your hint is:\n{edit}', fg='green')))
+    click.echo(format_report(hint_profile.report()), err=True)
 
 
 @ast_hint.command()
@@ -71,6 +123,78 @@ def compare_using_strings(student_solution, correct_solution):
     click.echo(edit)
 
 
+@ast_hint.command()
+@click.argument('submissions_dir', type=click.Path(exists=True, file_okay=False))
+@click.argument('correct_solution', type=click.File('r'))
+@click.option('--workers', type=int, default=1, show_default=True,
+              help='Number of worker processes to spread the submissions over.')
+def compare_batch(submissions_dir, correct_solution, workers):
+    """
+    Compare every python file in the given directory to the same solution.
+    """
+    paths = sorted(os.path.join(submissions_dir, name) for name in os.listdir(submissions_dir) if name.endswith('.py'))
+    if len(paths) == 0:
+        raise click.ClickException(f'Error: no python files found in {submissions_dir}')
+    student_solutions = (read_file(path) for path in paths)
+    import compare
+    results = compare.compare_batch(student_solutions, correct_solution.read(), True, workers=workers)
+    for path, result in zip(paths, results):
+        click.echo(click.style(f'{os.path.basename(path)}:', fg=fg_ast_hint))
+        if result.error is not None:
+            click.echo(click.style(f'Error: {result.error}', fg='red'))
+        else:
+            click.echo(result.hint)
+            if compare.time_budget is not None and not result.complete:
+                click.echo(click.style(approximate_hint_note, fg='yellow'), err=True)
+
+
+@ast_hint.command('build-index')
+@click.argument('problems_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('--output', type=click.Path(file_okay=False), default=None,
+              help='Directory to write the index to, defaults to .index inside PROBLEMS_DIR.')
+@click.option('--force', is_flag=True, help='Rebuild every problem, even if its files did not change.')
+def build_index_command(problems_dir, output, force):
+    """
+    Precompile the goal of every problem directory into an index.
+    """
+    from problem_index import build_index
+    report = build_index(problems_dir, output, force)
+    for problem_id, error in report.failed.items():
+        click.echo(click.style(f'Error: {problem_id}: {error}', fg='red'))
+    click.echo(click.style(f'Built {len(report.built)}, unchanged {len(report.unchanged)}, '
+                           f'removed {len(report.removed)}, failed {len(report.failed)}', fg=fg_ast_hint))
+
+
+@ast_hint.command()
+@click.option('--host', default='127.0.0.1', show_default=True, help='Address to listen on.')
+@click.option('--port', type=int, default=8765, show_default=True, help='Port to listen on.')
+@click.option('--unix-socket', type=click.Path(dir_okay=False), default=None,
+              help='Listen on this Unix socket instead of a TCP port.')
+@click.option('--workers', type=int, default=os.cpu_count() or 1, show_default=True,
+              help='Number of worker processes that run the comparisons.')
+@click.option('--index', 'index_dir', type=click.Path(exists=True, file_okay=False), default=None,
+              help='Problem index made by build-index, lets requests name a problem_id instead of solution_code.')
+def serve(host, port, unix_socket, workers, index_dir):
+    """
+    Serve hints over HTTP, keeping goal states prepared between requests.
+    """
+    import asyncio
+    from server import serve as serve_hints
+
+    def on_start(address):
+        click.echo(click.style(f'Serving hints on {address}', fg=fg_ast_hint))
+
+    try:
+        asyncio.run(serve_hints(host, port, unix_socket, workers, index_dir, on_start))
+    except KeyboardInterrupt:
+        pass
+
+
+def read_file(path):
+    with open(path, 'r') as file:
+        return file.read()
+
+
 def compare_internal(student_solution, correct_solution):
     """
     Compare the given strings, internal function.
@@ -78,10 +202,13 @@ def compare_internal(student_solution, correct_solution):
     :param correct_solution: Correct solution
     :return: hint, new_goal (edit, ephemeral_goal)
     """
+    import compare
     try:
-        hint, new_goal = compare_and_return_new_goal(student_solution, correct_solution, True)
+        hint, new_goal = compare.compare_and_return_new_goal(student_solution, correct_solution, True)
     except FileNotFoundError as e:
         raise click.ClickException(f"Error: {e}")
+    if compare.time_budget is not None and not compare.hint_complete:
+        click.echo(click.style(approximate_hint_note, fg='yellow'), err=True)
     return hint, new_goal
 
 
@@ -89,7 +216,9 @@ def compare_internal(student_solution, correct_solution):
 @click.argument('student_solution', type=click.File('r'))
 @click.argument('correct_solution', type=click.File('r'))
 @click.argument('problem_description', type=click.File('r'))
-def generative_ai_hint(student_solution, correct_solution, problem_description):
+@click.option('--early-stopping', is_flag=True,
+              help='Stop scoring simulated students once the hint is clearly good or bad enough.')
+def generative_ai_hint(student_solution, correct_solution, problem_description, early_stopping):
     """
     Generate a hint using comparator & AI.
     """
@@ -106,7 +235,8 @@ def generative_ai_hint(student_solution, correct_solution, problem_description):
     problem_description = problem_description.read()
     edit, new_goal = compare_internal(student_solution, correct_solution)
     click.echo(click.style(text='Generating a hint from the AI...', fg=fg_ast_hint))
-    short_hint = generate_ai_hint(problem_description, student_solution, edit, new_goal)
+    from generator import generate_ai_hint
+    short_hint = generate_ai_hint(problem_description, student_solution, edit, new_goal, early_stopping)
     click.echo(click.style(text="Your hint is:", fg=fg_ast_hint))
     click.echo(click.style(short_hint, fg='green'))
 
@@ -115,20 +245,22 @@ def generative_ai_hint(student_solution, correct_solution, problem_description):
 @click.argument('student_solution', type=str)
 @click.argument('correct_solution', type=str)
 @click.argument('problem_description', type=str)
-def generative_using_strings_ai_hint(student_solution, correct_solution, problem_description):
+@click.option('--early-stopping', is_flag=True,
+              help='Stop scoring simulated students once the hint is clearly good or bad enough.')
+def generative_using_strings_ai_hint(student_solution, correct_solution, problem_description, early_stopping):
     """
     Generate a hint using comparator & AI.
     """
     student_solution = student_solution
     correct_solution = correct_solution
     problem_description = problem_description
+    from compare import student_syntax_error_hint, identical_code_hint, solution_syntax_error_hint
     edit, new_goal = compare_internal(student_solution, correct_solution)
-    if (edit == "Your code has syntax errors. You need to fix them before we can provide hints.") or (
-            edit == "No hint available, student code is identical to the goal code.") or (
-            edit == "The solution code has syntax errors. Please contact your instructor."):
+    if edit in [student_syntax_error_hint, identical_code_hint, solution_syntax_error_hint]:
         click.echo(edit)
         return
-    short_hint = generate_ai_hint(problem_description, student_solution, edit, new_goal)
+    from generator import generate_ai_hint
+    short_hint = generate_ai_hint(problem_description, student_solution, edit, new_goal, early_stopping)
     click.echo(short_hint)
     click.echo(edit)
 
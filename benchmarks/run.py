@@ -0,0 +1,161 @@
+"""Times the stages of hint generation on the example corpus and on generated programs, and writes the timings
+as JSON so runs on different commits can be compared.
+
+Run from the repository root:
+    python benchmarks/run.py --output before.json
+    python benchmarks/run.py --output after.json --baseline before.json
+"""
+import argparse
+import ast
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from benchmarks.tree_ordering import scale_program  # noqa: E402
+from compare import compare_solutions, prepare_goal  # noqa: E402
+from comparison.canonicalize.canon import get_canonical_form  # noqa: E402
+from comparison.path_construction.comparator import diff_asts  # noqa: E402
+from comparison.path_construction.state_creator import collect_attributes, create_student_state, \
+    get_next_state  # noqa: E402
+from comparison.structures.State import IntermediateState  # noqa: E402
+from comparison.utils.normalize import normalize  # noqa: E402
+
+resource_path = os.path.join(project_root, "tests", "resources")
+data_path = os.path.join(project_root, "data")
+multi_func_solution_path = os.path.join(resource_path, "multi_func_solution.py")
+# Student and solution files of the corpus, relative to the repository root
+corpus = [(os.path.join("tests", "resources", "multi_func_steps", f"multi_func{i}.py"),
+           os.path.join("tests", "resources", "multi_func_solution.py")) for i in range(8)] + [
+    (os.path.join("data", "leetBroken.py"), os.path.join("data", "leetSolution.py")),
+    (os.path.join("data", "multiFuncBroken.py"), os.path.join("data", "multiFunc.py")),
+]
+default_sizes = [50, 500, 5000]
+default_differences = [1, 5, 20]
+benchmarked_functions = ["compare_solutions", "get_canonical_form", "diff_asts", "get_next_state"]
+
+
+def read_file(path):
+    with open(os.path.join(project_root, path), "r") as file:
+        return file.read()
+
+
+def change_constants(code, differences):
+    """Add one to this many integer constants of the program, spread evenly over it"""
+    tree = ast.parse(code)
+    constants = [node for node in ast.walk(tree)
+                 if isinstance(node, ast.Constant) and type(node.value) is int]
+    differences = min(differences, len(constants))
+    for i in range(differences):
+        constants[i * len(constants) // differences].value += 1
+    return ast.unparse(tree)
+
+
+def canonical_state(code):
+    state = IntermediateState(tree=ast.parse(code))
+    return state, collect_attributes(state)
+
+
+def time_calls(function, setup, repeats):
+    """Seconds taken by each of repeats calls to function, with the arguments setup makes for it untimed"""
+    times = []
+    for _ in range(repeats):
+        arguments = setup()
+        start = time.perf_counter()
+        function(*arguments)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def benchmark_case(student_code, solution_code, functions, repeats):
+    """Timings of each function on one student and solution pair"""
+    student_code, solution_code = normalize(student_code), normalize(solution_code)
+    goal_code_state = prepare_goal(solution_code, True)
+    setups = {
+        "compare_solutions": (compare_solutions, lambda: (student_code, solution_code, True)),
+        "get_canonical_form": (lambda state, imports: get_canonical_form(state, imports=imports),
+                               lambda: canonical_state(student_code)),
+        "diff_asts": (diff_asts, lambda: (create_student_state(student_code, goal_code_state, True).tree,
+                                          goal_code_state.tree)),
+        "get_next_state": (get_next_state, lambda: (create_student_state(student_code, goal_code_state, True),)),
+    }
+    results = {}
+    for name in functions:
+        function, setup = setups[name]
+        times = time_calls(function, setup, repeats)
+        results[name] = {"min": min(times), "median": statistics.median(times), "repeats": repeats}
+    return results
+
+
+def cases(sizes, differences):
+    """The name, student code and solution code of every benchmark case"""
+    for student_path, solution_path in corpus:
+        yield student_path.replace(os.sep, "/"), read_file(student_path), read_file(solution_path)
+    solution = read_file(multi_func_solution_path)
+    for lines in sizes:
+        scaled_solution = scale_program(solution, lines)
+        for difference_count in differences:
+            yield (f"generated/{lines}_lines/{difference_count}_differences",
+                   change_constants(scaled_solution, difference_count), scaled_solution)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=project_root,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_to_baseline(results, baseline):
+    """Lines with the change in median time of every benchmark that is in both runs"""
+    lines = []
+    for case, timings in results["cases"].items():
+        for name, timing in timings.items():
+            baseline_timing = baseline["cases"].get(case, {}).get(name)
+            if baseline_timing:
+                ratio = timing["median"] / baseline_timing["median"]
+                lines.append(f"{case:<48} {name:<20} {1000 * baseline_timing['median']:>10.2f}ms -> "
+                             f"{1000 * timing['median']:>10.2f}ms  {ratio:6.2f}x")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="JSON file to write the results to, by default they are only printed")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare the median times to")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--sizes", type=int, nargs="*", default=default_sizes,
+                        help="Line counts of the generated programs")
+    parser.add_argument("--differences", type=int, nargs="*", default=default_differences,
+                        help="Numbers of differences between the generated student and solution programs")
+    parser.add_argument("--functions", nargs="*", choices=benchmarked_functions, default=benchmarked_functions)
+    parser.add_argument("--filter", default="", help="Only run the cases with this in their name")
+    args = parser.parse_args()
+
+    results = {"commit": git_commit(), "python": platform.python_version(), "cases": {}}
+    for name, student_code, solution_code in cases(args.sizes, args.differences):
+        if args.filter not in name:
+            continue
+        timings = benchmark_case(student_code, solution_code, args.functions, args.repeats)
+        results["cases"][name] = timings
+        print(f"{name:<48} " + "  ".join(f"{function} {1000 * timing['median']:.2f}ms"
+                                         for function, timing in timings.items()), flush=True)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        print(f"\nCompared to {baseline.get('commit')}:")
+        print("\n".join(compare_to_baseline(results, baseline)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Times ordering comparisons (compare_trees without check_equality) with and without cached node depths.
+
+Run from the repository root:
+    python benchmarks/tree_ordering.py
+"""
+import ast
+import functools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from comparison.utils import astTools  # noqa: E402
+
+solution_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "tests", "resources", "multi_func_solution.py")
+
+
+def uncached_depth_of_ast(node):
+    """depth_of_ast as it was before depths were cached, walks the whole subtree every time"""
+    if not isinstance(node, ast.AST):
+        return 0
+    current_deepest = 0
+    for child in ast.iter_child_nodes(node):
+        candidate_node_depth = uncached_depth_of_ast(child)
+        if candidate_node_depth > current_deepest:
+            current_deepest = candidate_node_depth
+    return current_deepest + 1
+
+
+def scale_program(code, lines):
+    """Repeat the functions in code, renaming each copy, until the program has about this many lines"""
+    tree = ast.parse(code)
+    functions = [node for node in tree.body if isinstance(node, ast.FunctionDef)]
+    body, copy_number = [], 0
+    while len(ast.unparse(ast.Module(body=body, type_ignores=[])).splitlines()) < lines:
+        for function in functions:
+            function_copy = ast.parse(ast.unparse(function)).body[0]
+            function_copy.name += "_" + str(copy_number)
+            body.append(function_copy)
+        copy_number += 1
+    return ast.unparse(ast.Module(body=body, type_ignores=[]))
+
+
+def sort_subtrees(code):
+    """Sort every statement and expression of the program with the ordering comparison"""
+    nodes = [node for node in ast.walk(ast.parse(code)) if isinstance(node, (ast.stmt, ast.expr))]
+    return sorted(nodes, key=functools.cmp_to_key(astTools.compare_trees))
+
+
+def time_sort(code, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        sort_subtrees(code)
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    with open(solution_path, "r") as file:
+        solution = file.read()
+    inputs = [("multi_func_solution.py", solution, 5), ("1000 lines", scale_program(solution, 1000), 1)]
+    cached_depth_of_ast = astTools.depth_of_ast
+    for name, code, repeats in inputs:
+        astTools.depth_of_ast = uncached_depth_of_ast
+        uncached = time_sort(code, repeats)
+        astTools.depth_of_ast = cached_depth_of_ast
+        cached = time_sort(code, repeats)
+        print(f"{name:<24} {len(code.splitlines()):>5} lines  uncached {uncached:8.3f}s  "
+              f"cached {cached:8.3f}s  speedup {uncached / cached:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
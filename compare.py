@@ -1,51 +1,232 @@
 # Entry point
-from typing import Tuple
-
-import autopep8
+import ast
+import copy
+import time
+from typing import Tuple, Iterable, Iterator, NamedTuple, Optional, List
 
 from comparison.canonicalize.deanonymizer import DeanonymizeNames
-from comparison.path_construction.comparator import *
+from comparison.path_construction.comparator import get_weight
 from comparison.path_construction.state_creator import get_next_state, create_state, desirability, \
-    create_canonical_intermediate_state
-from comparison.utils.generate_message import *
+    create_canonical_intermediate_state, create_goal_state, create_student_state
+from comparison.structures.State import State
+from comparison.structures.transformation_operation import ChangeOperation
+from comparison.utils import normalize as normalization, tools
+from comparison.utils.display import print_function
+from comparison.utils.generate_message import formatHints
+from comparison.utils.goal_cache import GoalCache
+from comparison.utils.normalize import normalize
+from comparison.utils.profiling import count, stage
+from comparison.utils.tools import log
 
 ephemeral_goal: str = ""
+# Whether the last hint came from a search that ran to its end, False when a budget or the deadline cut it short
+hint_complete: bool = True
+# Whether that search skipped a subset of changes on its estimated desirability alone, which may have been better
+hint_estimated: bool = False
+
+student_syntax_error_hint = "Your code has syntax errors. You need to fix them before we can provide hints."
+solution_syntax_error_hint = "The solution code has syntax errors. Please contact your instructor."
+identical_code_hint = "No hint available, student code is identical to the goal code."
+out_of_time_hint = "No hint could be found in time, please try again."
+
+
+# The prepared goal of a batch worker process, received once through init_batch_worker
+worker_goal_state: Optional[State] = None
+worker_canonicalize: bool = True
+
+# Where prepared goals are kept between runs, caching is off until use_goal_cache is called
+goal_cache: Optional[GoalCache] = None
+
+# Seconds a comparison may take before it settles for the best next state found so far, None for no limit
+time_budget: Optional[float] = None
+
+
+class BatchResult(NamedTuple):
+    hint: str
+    ephemeral_goal: str
+    error: Optional[str] = None
+    complete: bool = True  # False when the hint is the best one a cut short search found
+    estimated: bool = False  # True when the search skipped subsets on an estimate, see hint_estimated
 
 
 def compare_solutions(student_code, solution_code, canonicalize) -> str:
     # Format the code to ensure consistent format
-    student_code = autopep8.fix_code(student_code)
-    solution_code = autopep8.fix_code(solution_code)
+    with stage("format"):
+        student_code = normalize(student_code)
 
     # Check for syntax errors
     try:
-        ast.parse(student_code)
+        with stage("parse"):
+            ast.parse(student_code)
     except Exception as e:
-        return "Your code has syntax errors. You need to fix them before we can provide hints."
+        return student_syntax_error_hint
+
+    goal_code_state = prepare_goal(solution_code, canonicalize)
+    if goal_code_state is None:
+        return solution_syntax_error_hint
+
+    global ephemeral_goal
+    hint, ephemeral_goal = compare_to_goal(student_code, goal_code_state, canonicalize, formatted=True)
+    return hint
+
+
+def set_time_budget(seconds: Optional[float]):
+    global time_budget
+    if seconds is not None and seconds <= 0:
+        raise ValueError(f"The time budget must be positive, got {seconds}")
+    time_budget = seconds
 
+
+def use_goal_cache(directory: Optional[str], max_bytes: int = 64 * 1024 * 1024):
+    """Keep prepared goals in the given directory, or stop caching them when it is None"""
+    global goal_cache
+    goal_cache = GoalCache(directory, max_bytes) if directory else None
+
+
+def prepare_goal(solution_code: str, canonicalize: bool) -> Optional[State]:
+    """Format, parse, canonicalize and weigh the goal code once, so it can be shared by many students.
+    Returns None if the solution code has syntax errors."""
+    if goal_cache is not None:
+        key = goal_cache.key(solution_code, canonicalize)
+        goal_code_state = goal_cache.get(key)
+        if goal_code_state is not None:
+            return goal_code_state
+    with stage("format"):
+        formatted_code = normalize(solution_code)
     try:
-        ast.parse(solution_code)
+        goal_code_state = create_goal_state(formatted_code, canonicalize)
+    except (SyntaxError, ValueError):
+        return None
+    # Weighing caches treeWeight on every node of the goal tree
+    with stage("weigh"):
+        goal_code_state.treeWeight = get_weight(goal_code_state.tree)
+    if goal_cache is not None:
+        goal_cache.put(key, goal_code_state)
+    return goal_code_state
+
+
+def compare_to_goal(student_code: str, goal_code_state: State, canonicalize: bool,
+                    formatted: bool = False, budget: Optional[float] = None) -> Tuple[str, str]:
+    """Compare the student code to a prepared goal state, returns the hint and the ephemeral goal.
+    The goal state is left untouched, so it can be reused for the next student.
+    Past the budget in seconds (the time_budget by default) the best hint found so far is given, or
+    out_of_time_hint when none was found yet. hint_complete is set to False when the budget or the deadline cut the
+    search for the next state short, hint_estimated to True when it skipped a subset on its estimate alone."""
+    global hint_complete, hint_estimated
+    budget = budget if budget is not None else time_budget
+    deadline = time.perf_counter() + budget if budget is not None else None
+    hint_complete, hint_estimated = True, False
+    if not formatted:
+        with stage("format"):
+            student_code = normalize(student_code)
+    try:
+        with stage("parse"):
+            ast.parse(student_code)
     except Exception as e:
-        return "The solution code has syntax errors. Please contact your instructor."
+        return student_syntax_error_hint, ""
 
     # Create initial state and generate next state
-    student_code_state = create_state(student_code, solution_code, canonicalize)
-    get_next_state(student_code_state)
+    student_code_state = create_student_state(student_code, goal_code_state, canonicalize)
+    get_next_state(student_code_state, deadline)
+    hint_complete = student_code_state.search_complete
+    hint_estimated = student_code_state.search_estimated
 
     if student_code_state.next is None:
-        return "No hint available, student code is identical to the goal code."
+        if not hint_complete:
+            return out_of_time_hint, ""
+        return identical_code_hint, ""
 
+    change_vectors = student_code_state.change_vectors
+    next_tree = student_code_state.next.tree
     # De-anonymize if canonicalize is enabled
     if canonicalize:
-        deanonymizer = DeanonymizeNames(reverse_map=student_code_state.reverse_map)
-        deanonymizer.visit(student_code_state.tree)
-        deanonymizer.visit(student_code_state.next.tree)
+        # The next tree and the change vectors share nodes with the goal tree, so de-anonymize copies of them
+        with stage("deanonymize"):
+            copies = {}
+            count("deepcopy")
+            next_tree = copy.deepcopy(next_tree, copies)
+            deanonymizer = DeanonymizeNames(reverse_map=student_code_state.reverse_map)
+            deanonymizer.visit(student_code_state.tree)
+            deanonymizer.visit(next_tree)
+            change_vectors = [detach_change_vector(change, copies, deanonymizer) for change in change_vectors]
     # We should check the change vectors next_tree here to ensure if something new is added, we use a reverse map to convert back to the original code in the goal_ast.
-    global ephemeral_goal
-    ephemeral_goal = print_function(student_code_state.next.tree)
-    log(f"Ephemeral goal generated:\n{ephemeral_goal}", "goals")
+    with stage("hints"):
+        new_goal = print_function(next_tree)
+        hint = formatHints(change_vectors, 2)
+    log(f"Ephemeral goal generated:\n{new_goal}", "goals")
+
+    return hint, new_goal
+
+
+def detach_change_vector(change: ChangeOperation, copies: dict, deanonymizer: DeanonymizeNames) -> ChangeOperation:
+    """Copy a change vector, pointing its new subtree at the de-anonymized copy instead of the goal's node"""
+    detached = copy.copy(change)
+    if isinstance(change.new_subtree, ast.AST):
+        if id(change.new_subtree) in copies:
+            detached.new_subtree = copies[id(change.new_subtree)]
+        else:
+            count("deepcopy")
+            detached.new_subtree = deanonymizer.visit(copy.deepcopy(change.new_subtree))
+    return detached
+
+
+def compare_batch(student_codes: Iterable[str], solution_code: str, canonicalize: bool,
+                  workers: int = 1) -> Iterator[BatchResult]:
+    """Compare many student submissions against the same goal, the goal is only prepared once.
+    With more than one worker the submissions are spread over a process pool.
+    Results are streamed back in submission order, a failing submission is reported in its result's error."""
+    goal_code_state = prepare_goal(solution_code, canonicalize)
+    if goal_code_state is None:
+        for _ in student_codes:
+            yield BatchResult(solution_syntax_error_hint, "")
+        return
+    if workers is None or workers <= 1:
+        for student_code in student_codes:
+            yield safe_compare_to_goal(student_code, goal_code_state, canonicalize)
+        return
+    # Only batches with several workers pay for importing multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    # The goal is shipped to each worker once by the initializer, rather than once per submission
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_batch_worker,
+                             initargs=(goal_code_state, canonicalize, *worker_settings())) as executor:
+        futures = [executor.submit(compare_in_batch_worker, student_code) for student_code in student_codes]
+        for future in futures:
+            try:
+                yield future.result()
+            except Exception as e:  # the worker itself died, e.g. a BrokenProcessPool
+                log(f"Batch worker failed: {e!r}", "bug")
+                yield BatchResult("", "", f"{type(e).__name__}: {e}")
+
+
+def safe_compare_to_goal(student_code: str, goal_code_state: State, canonicalize: bool) -> BatchResult:
+    """compare_to_goal, reporting any failure in the result instead of raising it"""
+    try:
+        hint, new_goal = compare_to_goal(student_code, goal_code_state, canonicalize)
+        return BatchResult(hint, new_goal, complete=hint_complete, estimated=hint_estimated)
+    except Exception as e:
+        log(f"Batch comparison failed: {e!r}", "bug")
+        return BatchResult("", "", f"{type(e).__name__}: {e}")
+
+
+def worker_settings() -> tuple:
+    """The settings a worker process needs from its parent, spawned workers start with the defaults"""
+    return normalization.normalize_mode, tools.log_threshold, time_budget
+
+
+def apply_worker_settings(normalize_mode: str, log_threshold: int, budget: Optional[float]):
+    normalization.set_normalize_mode(normalize_mode)
+    tools.log_threshold = log_threshold
+    set_time_budget(budget)
 
-    return formatHints(student_code_state.change_vectors, 2)
+
+def init_batch_worker(goal_code_state: State, canonicalize: bool, *settings):
+    global worker_goal_state, worker_canonicalize
+    apply_worker_settings(*settings)
+    worker_goal_state, worker_canonicalize = goal_code_state, canonicalize
+
+
+def compare_in_batch_worker(student_code: str) -> BatchResult:
+    return safe_compare_to_goal(student_code, worker_goal_state, worker_canonicalize)
 
 
 def compare_and_return_new_goal(student_code, solution_code, canonicalize) -> Tuple[str, str]:
@@ -55,25 +236,71 @@ def compare_and_return_new_goal(student_code, solution_code, canonicalize) -> Tu
     return hint, ephemeral_goal
 
 
-def validate_student_attempts(student_attempts: List[str], goal_code: str, student_code: str) -> float:
-    """Compare student attempts to the goal code, returns a score based on the comparison of the student attempts."""
-    # First we must use pep8 to format the code to ensure we have a consistent format
-    goal_code_ast = autopep8.fix_code(goal_code)
-    student_code_ast = autopep8.fix_code(student_code)
-    scores = {}
-    for generative_attempt in student_attempts:
+class AttemptScores(NamedTuple):
+    scores: List[Optional[float]]  # the score of each attempt in order, None for attempts with syntax errors
+    average: float  # the average of the scores that are not None, 0 if there are none
+
+
+class AttemptScorer:
+    """Scores generated student attempts by their desirability as the next state between the student code and
+    the goal code. Those two are normalized and canonicalized once, and identical attempts are scored once."""
+
+    def __init__(self, goal_code: str, student_code: str):
         try:
-            generative_attempt = autopep8.fix_code(generative_attempt)
-            student_code_state = create_canonical_intermediate_state(student_code_ast)
-            generative_attempt_state = create_canonical_intermediate_state(generative_attempt)
-            goal_code_state = create_canonical_intermediate_state(goal_code_ast)
-            scores[student_code_state] = desirability(student_state=student_code_state,
-                                                      candidate_state=generative_attempt_state,
-                                                      goal_state=goal_code_state)
+            self.student_code_state = create_canonical_intermediate_state(normalize(student_code))
+            self.goal_code_state = create_canonical_intermediate_state(normalize(goal_code))
         except SyntaxError:
-            log("Syntax error in one of the student attempts.")
+            log("Syntax error in the student or goal code, no attempt can be scored.")
+            self.student_code_state = self.goal_code_state = None
+        # Scores by normalized attempt
+        self.scores = {}
+
+    def score(self, generative_attempt: str) -> Optional[float]:
+        """The desirability of one student attempt, or None if the attempt has syntax errors"""
+        if self.goal_code_state is None:
+            return None
+        generative_attempt = normalize(generative_attempt)
+        if generative_attempt not in self.scores:
+            try:
+                generative_attempt_state = create_canonical_intermediate_state(generative_attempt)
+                self.scores[generative_attempt] = desirability(student_state=self.student_code_state,
+                                                               candidate_state=generative_attempt_state,
+                                                               goal_state=self.goal_code_state)
+            except SyntaxError:
+                log("Syntax error in one of the student attempts.")
+                self.scores[generative_attempt] = None
+        return self.scores[generative_attempt]
+
+    def score_all(self, student_attempts: Iterable[str], workers: int = 1) -> AttemptScores:
+        """Score every attempt, with more than one worker the distinct attempts are spread over a process pool"""
+        student_attempts = list(student_attempts)
+        distinct_attempts = [attempt for attempt in dict.fromkeys(student_attempts)
+                             if normalize(attempt) not in self.scores]
+        if workers is not None and workers > 1 and len(distinct_attempts) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_scoring_worker,
+                                     initargs=(self, *worker_settings())) as pool:
+                for attempt, score in zip(distinct_attempts, pool.map(score_in_worker, distinct_attempts)):
+                    self.scores[normalize(attempt)] = score
+        scores = [self.score(attempt) for attempt in student_attempts]
+        valid_scores = [score for score in scores if score is not None]
+        return AttemptScores(scores, sum(valid_scores) / len(valid_scores) if valid_scores else 0)
+
+
+# The scorer of a scoring worker process, received once through init_scoring_worker
+worker_scorer: Optional[AttemptScorer] = None
+
 
-    # Now we have the distances, this will be used for now. Desirability would be useful here too.
-    if len(scores) == 0:
-        return 0
-    return sum(scores.values()) / len(scores)
+def init_scoring_worker(scorer: AttemptScorer, *settings):
+    global worker_scorer
+    apply_worker_settings(*settings)
+    worker_scorer = scorer
+
+
+def score_in_worker(generative_attempt: str) -> Optional[float]:
+    return worker_scorer.score(generative_attempt)
+
+
+def validate_student_attempts(student_attempts: List[str], goal_code: str, student_code: str) -> float:
+    """Compare student attempts to the goal code, returns a score based on the comparison of the student attempts."""
+    return AttemptScorer(goal_code, student_code).score_all(student_attempts).average
@@ -1,21 +1,27 @@
 import ast
 
 
+def remove_constant_if(node, context=None):
+    if isinstance(node.test, ast.Constant):
+        return node.body if node.test.value else node.orelse
+    return node
+
+
+def remove_constant_while(node, context=None):
+    if isinstance(node.test, ast.Constant):
+        return node.body if node.test.value else []
+    return node
+
+
 class ConditionalRedundancyTransformer(ast.NodeTransformer):
     def visit_If(self, node):
         self.generic_visit(node)
-        if isinstance(node.test, ast.Constant):
-            return node.body if node.test.value else node.orelse
-        return node
+        return remove_constant_if(node)
 
     def visit_IfExp(self, node):
         self.generic_visit(node)
-        if isinstance(node.test, ast.Constant):
-            return node.body if node.test.value else node.orelse
-        return node
+        return remove_constant_if(node)
 
     def visit_While(self, node):
         self.generic_visit(node)
-        if isinstance(node.test, ast.Constant):
-            return node.body if node.test.value else []
-        return node
+        return remove_constant_while(node)
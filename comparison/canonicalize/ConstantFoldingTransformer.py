@@ -3,52 +3,72 @@ import contextlib
 import io
 
 
+def fold_bin_op(node, context=None):
+    if isinstance(node.left, ast.Constant) and isinstance(node.right, ast.Constant):
+        try:
+            return ast.Constant(eval(compile(ast.Expression(node), '', 'eval')))
+        except:
+            pass
+    return node
+
+
+def fold_bool_op(node, context=None):
+    if all(isinstance(value, ast.Constant) for value in node.values):
+        try:
+            return ast.Constant(eval(compile(ast.Expression(node), '', 'eval')))
+        except:
+            pass
+    return node
+
+
+def fold_compare(node, context=None):
+    if isinstance(node.left, ast.Constant) and all(isinstance(comp, ast.Constant) for comp in node.comparators):
+        try:
+            with io.StringIO() as buf, contextlib.redirect_stdout(buf), contextlib.redirect_stderr(buf):
+                return ast.Constant(eval(compile(ast.Expression(node), '', 'eval')))
+        except:
+            pass
+    return node
+
+
+def fold_if_exp(node, context=None):
+    if isinstance(node.test, ast.Constant):
+        return node.body if node.test.value else node.orelse
+    return node
+
+
+def fold_call(node, context=None):
+    if all(isinstance(arg, ast.Constant) for arg in node.args):
+        try:
+            if node.func.id == 'print':
+                return node
+            with io.StringIO() as buf, contextlib.redirect_stdout(buf), contextlib.redirect_stderr(buf):
+                return ast.Constant(eval(compile(ast.Expression(node), '', 'eval')))
+        except:
+            pass
+    return node
+
+
 class ConstantFoldingTransformer(ast.NodeTransformer):
     def visit_BinOp(self, node):
         self.generic_visit(node)
-        if isinstance(node.left, ast.Constant) and isinstance(node.right, ast.Constant):
-            try:
-                return ast.Constant(eval(compile(ast.Expression(node), '', 'eval')))
-            except:
-                pass
-        return node
+        return fold_bin_op(node)
 
     def visit_BoolOp(self, node):
         self.generic_visit(node)
-        if all(isinstance(value, ast.Constant) for value in node.values):
-            try:
-                return ast.Constant(eval(compile(ast.Expression(node), '', 'eval')))
-            except:
-                pass
-        return node
+        return fold_bool_op(node)
 
     def visit_Compare(self, node):
         self.generic_visit(node)
-        if isinstance(node.left, ast.Constant) and all(isinstance(comp, ast.Constant) for comp in node.comparators):
-            try:
-                with io.StringIO() as buf, contextlib.redirect_stdout(buf), contextlib.redirect_stderr(buf):
-                    return ast.Constant(eval(compile(ast.Expression(node), '', 'eval')))
-            except:
-                pass
-        return node
+        return fold_compare(node)
 
     def visit_IfExp(self, node):
         self.generic_visit(node)
-        if isinstance(node.test, ast.Constant):
-            return node.body if node.test.value else node.orelse
-        return node
+        return fold_if_exp(node)
 
     def visit_Call(self, node):
         self.generic_visit(node)
-        if all(isinstance(arg, ast.Constant) for arg in node.args):
-            try:
-                if node.func.id == 'print':
-                    return node
-                with io.StringIO() as buf, contextlib.redirect_stdout(buf), contextlib.redirect_stderr(buf):
-                    return ast.Constant(eval(compile(ast.Expression(node), '', 'eval')))
-            except:
-                pass
-        return node
+        return fold_call(node)
 
     def visit_Attribute(self, node):
         self.generic_visit(node)
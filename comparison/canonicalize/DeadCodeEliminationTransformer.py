@@ -1,5 +1,45 @@
 import ast
 
+# Statements that make the code after them reachable again, as in DeadCodeEliminationTransformer
+block_types = (ast.FunctionDef, ast.AsyncFunctionDef, ast.If, ast.While, ast.For, ast.With, ast.ExceptHandler,
+               ast.Try)
+
+statement_types = tuple(ast.stmt.__subclasses__())
+
+
+def enter_block(node, context):
+    # A return only makes the rest of its own block unreachable, not the code after the block
+    context.setdefault("reachable_before", []).append(context.get("reachable", True))
+    context["reachable"] = True
+    # An else or finally branch is reachable even when the body before it returns
+    branch_starts = context.setdefault("branch_starts", set())
+    for branch in (getattr(node, "orelse", []), getattr(node, "finalbody", [])):
+        if branch:
+            branch_starts.add(id(branch[0]))
+    return node
+
+
+def enter_statement(node, context):
+    if id(node) in context.get("branch_starts", ()):
+        context["reachable"] = True
+    return node
+
+
+def leave_block(node, context):
+    context["reachable"] = context["reachable_before"].pop()
+    return node
+
+
+def leave_return(node, context):
+    context["reachable"] = False
+    return node
+
+
+def remove_unreachable_assign(node, context):
+    if node.targets and isinstance(node.targets[0], ast.Name) and not context.get("reachable", True):
+        return None  # Remove unreachable assignment
+    return node
+
 
 class DeadCodeEliminationTransformer(ast.NodeTransformer):
     def __init__(self, *args, **kwargs):
@@ -11,9 +51,11 @@ class DeadCodeEliminationTransformer(ast.NodeTransformer):
 
     def visit_FunctionDef(self, node):
         self._live_vars_stack.append(set())
+        reachable_before = self._reachable
         self._reachable = True
         self.generic_visit(node)
         self._live_vars_stack.pop()
+        self._reachable = reachable_before
         return node
 
     def visit_Assign(self, node):
@@ -42,48 +84,60 @@ class DeadCodeEliminationTransformer(ast.NodeTransformer):
         else:
             self._live_vars_stack.append(set(self._live_vars_stack[-1]))
 
+        reachable_before = self._reachable
         self._reachable = True
         node.body = [self.visit(n) for n in node.body if self.visit(n) is not None]
         node.orelse = [self.visit(n) for n in node.orelse if self.visit(n) is not None]
         self._live_vars_stack.pop()
+        self._reachable = reachable_before
         return node
 
     def visit_While(self, node):
         self._live_vars_stack.append(set(self._live_vars_stack[-1]))
+        reachable_before = self._reachable
         self._reachable = True
         self.visit(node.test)
         node.body = [self.visit(n) for n in node.body if self.visit(n) is not None]
         node.orelse = [self.visit(n) for n in node.orelse if self.visit(n) is not None]
         self._live_vars_stack.pop()
+        self._reachable = reachable_before
         return node
 
     def visit_For(self, node):
         self._live_vars_stack.append(set(self._live_vars_stack[-1]))
+        reachable_before = self._reachable
         self._reachable = True
         node.body = [self.visit(n) for n in node.body if self.visit(n) is not None]
         node.orelse = [self.visit(n) for n in node.orelse if self.visit(n) is not None]
         self._live_vars_stack.pop()
+        self._reachable = reachable_before
         return node
 
     def visit_With(self, node):
         self._live_vars_stack.append(set(self._live_vars_stack[-1]))
+        reachable_before = self._reachable
         self._reachable = True
         node.body = [self.visit(n) for n in node.body if self.visit(n) is not None]
         self._live_vars_stack.pop()
+        self._reachable = reachable_before
         return node
 
     def visit_ExceptHandler(self, node):
         self._live_vars_stack.append(set(self._live_vars_stack[-1]))
+        reachable_before = self._reachable
         self._reachable = True
         node.body = [self.visit(n) for n in node.body if self.visit(n) is not None]
         self._live_vars_stack.pop()
+        self._reachable = reachable_before
         return node
 
     def visit_Try(self, node):
         self._live_vars_stack.append(set(self._live_vars_stack[-1]))
+        reachable_before = self._reachable
         self._reachable = True
         node.body = [self.visit(n) for n in node.body if self.visit(n) is not None]
         node.orelse = [self.visit(n) for n in node.orelse if self.visit(n) is not None]
         node.finalbody = [self.visit(n) for n in node.finalbody if self.visit(n) is not None]
         self._live_vars_stack.pop()
+        self._reachable = reachable_before
         return node
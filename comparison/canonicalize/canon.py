@@ -1,41 +1,76 @@
 import ast
 import copy
-import uuid
+import random
 
-from comparison.canonicalize.ConditionalRedundancyTransformer import ConditionalRedundancyTransformer
-from comparison.canonicalize.ConstantFoldingTransformer import ConstantFoldingTransformer
-from comparison.canonicalize.DeadCodeEliminationTransformer import DeadCodeEliminationTransformer
+from comparison.canonicalize.ConditionalRedundancyTransformer import remove_constant_if, remove_constant_while
+from comparison.canonicalize.ConstantFoldingTransformer import fold_bin_op, fold_bool_op, fold_call, fold_compare, \
+    fold_if_exp
+from comparison.canonicalize.DeadCodeEliminationTransformer import block_types, enter_block, enter_statement, \
+    leave_block, leave_return, remove_unreachable_assign, statement_types
 from comparison.canonicalize.anonymizer import AnonymizeNames
-from comparison.canonicalize.deMorganizeTransformer import DeMorganizeTransformer
-from comparison.utils.tools import log
+from comparison.canonicalize.deMorganizeTransformer import demorganize
+from comparison.canonicalize.rewriter import RewritePipeline
+from comparison.utils.astTools import context_types
 
-id_counter = 0
+# Bump this whenever a change to canonicalization changes its output, it invalidates cached goal states
+canonical_form_version = 5
 
+# The rules of ConstantFoldingTransformer, DeadCodeEliminationTransformer, DeMorganizeTransformer and
+# ConditionalRedundancyTransformer, registered in the order the transformers used to run in
+canonical_rules = RewritePipeline()
+canonical_rules.register([ast.BinOp], fold_bin_op)
+canonical_rules.register([ast.BoolOp], fold_bool_op)
+canonical_rules.register([ast.Compare], fold_compare)
+canonical_rules.register([ast.IfExp], fold_if_exp)
+canonical_rules.register([ast.Call], fold_call)
+canonical_rules.on_enter(statement_types, enter_statement)
+canonical_rules.on_enter(block_types, enter_block)
+canonical_rules.register(block_types, leave_block)
+canonical_rules.register([ast.Assign], remove_unreachable_assign)
+canonical_rules.register([ast.Return], leave_return)
+canonical_rules.register([ast.UnaryOp], demorganize)
+canonical_rules.register([ast.If], remove_constant_if)
+canonical_rules.register([ast.While], remove_constant_while)
 
-def give_ids(node):
-    global id_counter
-    if isinstance(node, ast.AST):
-        if type(node) in [ast.Load, ast.Store, ast.Del, ast.AugLoad, ast.AugStore, ast.Param]:
-            return  # skip these
-        node.global_id = uuid.uuid1()
-        id_counter += 1
-        for field in node.__getattribute__("_fields"):
-            if hasattr(node, field):
-                child = getattr(node, field)
-            else:
-                continue
+
+# The id give_ids numbers the next tree from. It starts at random so that trees numbered in different processes,
+# like a cached goal and a student, don't share ids either.
+next_global_id = random.getrandbits(62)
+
+
+def give_ids(tree):
+    """Number the nodes of the tree in preorder, from where the last tree numbered stopped, and return the list
+    that maps each number, less the root's, to its node. No two trees share an id."""
+    global next_global_id
+    first_id = next_global_id
+    node_index = []
+    seen = set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        node.global_id = first_id + len(node_index)
+        node_index.append(node)
+        seen.add(id(node))
+        children = []
+        for field, child in ast.iter_fields(node):
             if type(child) is list:
                 for i in range(len(child)):
-                    # Get rid of aliased items
-                    if hasattr(child[i], "global_id"):
-                        child[i] = copy.deepcopy(child[i])
-                    give_ids(child[i])
-            else:
+                    if isinstance(child[i], ast.AST) and type(child[i]) not in context_types:
+                        # Get rid of aliased items
+                        if id(child[i]) in seen:
+                            child[i] = copy.deepcopy(child[i])
+                        seen.add(id(child[i]))
+                        children.append(child[i])
+            elif isinstance(child, ast.AST) and type(child) not in context_types:
                 # Get rid of aliased items
-                if hasattr(child, "global_id"):
+                if id(child) in seen:
                     child = copy.deepcopy(child)
                     setattr(node, field, child)
-                give_ids(child)
+                seen.add(id(child))
+                children.append(child)
+        stack.extend(reversed(children))
+    next_global_id = first_id + len(node_index)
+    return node_index
 
 
 def get_canonical_form(student_state, given_names=None, imports=None):
@@ -45,20 +80,10 @@ def get_canonical_form(student_state, given_names=None, imports=None):
         given_names = {}
     if imports is None:
         imports = []
-    give_ids(student_state.tree)
-    transformations = [ConstantFoldingTransformer(), DeadCodeEliminationTransformer(), DeMorganizeTransformer(),
-                       ConditionalRedundancyTransformer()]
+    student_state.node_index = give_ids(student_state.tree)
+    student_state.tree = canonical_rules.run(student_state.tree)
 
     anonymizer_instance = AnonymizeNames()
-
-    for transformation in transformations:
-        try:
-            copy_of_tree = copy.deepcopy(student_state.tree)
-            transformation.visit(copy_of_tree)
-            student_state.tree = copy_of_tree
-        except Exception as e:
-            log(f"Error in applying transformation {transformation.__class__.__name__}: {e}", "canonicalize")
-
     temp_tree = anonymizer_instance.visit(student_state.tree)
     student_state.anonymized_code = ast.unparse(temp_tree)
     student_state.reverse_map = anonymizer_instance.reverse_name_map
@@ -1,25 +1,26 @@
 import ast
 
 
+def demorganize(node, context=None):
+    if isinstance(node.op, ast.Not) and isinstance(node.operand, ast.BoolOp):
+        # Apply De Morgan's law based on the type of BoolOp
+        if isinstance(node.operand.op, ast.And):
+            # not (a and b) -> not a or not b
+            return ast.BoolOp(op=ast.Or(),
+                              values=[ast.UnaryOp(op=ast.Not(), operand=value) for value in node.operand.values])
+        elif isinstance(node.operand.op, ast.Or):
+            # not (a or b) -> not a and not b
+            return ast.BoolOp(op=ast.And(),
+                              values=[ast.UnaryOp(op=ast.Not(), operand=value) for value in node.operand.values])
+    return node
+
+
 class DeMorganizeTransformer(ast.NodeTransformer):
     def visit_UnaryOp(self, node):
-        if isinstance(node.op, ast.Not):
-            if isinstance(node.operand, ast.BoolOp):
-                # Apply De Morgan's law based on the type of BoolOp
-                if isinstance(node.operand.op, ast.And):
-                    # not (a and b) -> not a or not b
-                    return ast.BoolOp(
-                        op=ast.Or(),
-                        values=[self.visit(ast.UnaryOp(op=ast.Not(), operand=value))
-                                for value in node.operand.values]
-                    )
-                elif isinstance(node.operand.op, ast.Or):
-                    # not (a or b) -> not a and not b
-                    return ast.BoolOp(
-                        op=ast.And(),
-                        values=[self.visit(ast.UnaryOp(op=ast.Not(), operand=value))
-                                for value in node.operand.values]
-                    )
+        result = demorganize(node)
+        if result is not node:
+            result.values = [self.visit(value) for value in result.values]
+            return result
         # Visit other nodes normally
         return self.generic_visit(node)
 
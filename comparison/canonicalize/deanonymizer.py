@@ -1,23 +1,45 @@
 import ast
 
+from comparison.utils.astTools import clear_subtree_properties
+
 
 class DeanonymizeNames(ast.NodeTransformer):
-    def __init__(self, original_tree=None, reverse_map=None):
+    def __init__(self, original_tree=None, reverse_map=None, node_index=None):
         self.original_tree = original_tree
         self.reverse_map = reverse_map
-        self.global_id_map = self._create_global_id_map(original_tree) if original_tree else {}
+        if node_index is None:
+            node_index = self._create_node_index(original_tree) if original_tree else []
+        self.node_index = node_index
+        # The root is numbered first, and the rest of the tree follows it
+        self.first_id = getattr(node_index[0], 'global_id', None) if node_index else None
 
     @staticmethod
-    def _create_global_id_map(tree):
-        global_id_map = {}
-        for node in ast.walk(tree):
-            if hasattr(node, 'global_id'):
-                global_id_map[node.global_id] = node
-        return global_id_map
+    def _create_node_index(tree):
+        """Rebuild the list give_ids returns, for trees whose list was not kept"""
+        if not hasattr(tree, 'global_id'):
+            return []
+        # Nodes carried over from other trees have ids outside the tree's range
+        nodes = [node for node in ast.walk(tree) if hasattr(node, 'global_id')]
+        node_index = [None] * len(nodes)
+        for node in nodes:
+            position = node.global_id - tree.global_id
+            if 0 <= position < len(node_index):
+                node_index[position] = node
+        return node_index
+
+    def visit(self, node):
+        # Renaming happens in place, so values cached on the visited nodes no longer hold
+        clear_subtree_properties(node)
+        return super().visit(node)
 
     def _get_original_name(self, node):
-        if hasattr(node, 'global_id') and node.global_id in self.global_id_map:
-            original_node = self.global_id_map[node.global_id]
+        global_id = getattr(node, 'global_id', None)
+        if global_id is None or self.first_id is None:
+            return None
+        # Ids are unique across trees, so a node numbered in another tree falls outside the index
+        position = global_id - self.first_id
+        if 0 <= position < len(self.node_index):
+            original_node = self.node_index[position]
             if isinstance(original_node, ast.FunctionDef):
                 return original_node.name
             elif isinstance(original_node, ast.Name):
@@ -0,0 +1,82 @@
+import ast
+
+from comparison.utils.tools import log
+
+
+class RewritePipeline:
+    """Runs rewrite rules registered per node type in a single bottom-up traversal.
+
+    A rule is called as rule(node, context) once the node's children have been rewritten, and returns the node,
+    a replacement node, a list of statements to splice in its place, or None to drop it. Replacements are
+    rewritten in turn until no rule changes them. Enter rules run before a node's children are visited and
+    only update the context shared by one run. A rule that raises is logged and leaves its own node unchanged.
+    """
+
+    def __init__(self):
+        self.enter_rules = {}
+        self.rules = {}
+
+    def on_enter(self, node_types, rule):
+        for node_type in node_types:
+            self.enter_rules.setdefault(node_type, []).append(rule)
+
+    def register(self, node_types, rule):
+        for node_type in node_types:
+            self.rules.setdefault(node_type, []).append(rule)
+
+    def run(self, tree):
+        # Rewritten nodes are kept alive here so that their ids cannot be reused during the run
+        return self.rewrite(tree, {}, {})
+
+    def apply(self, rule, node, context):
+        try:
+            return rule(node, context)
+        except Exception as e:
+            log(f"Error in applying transformation {rule.__name__}: {e}", "canonicalize")
+            return node
+
+    def rewrite_children(self, node, context, done):
+        for field, old_value in ast.iter_fields(node):
+            if isinstance(old_value, list):
+                new_values = []
+                for value in old_value:
+                    if isinstance(value, ast.AST):
+                        value = self.rewrite(value, context, done)
+                        if value is None:
+                            continue
+                        elif not isinstance(value, ast.AST):
+                            new_values.extend(value)
+                            continue
+                    new_values.append(value)
+                old_value[:] = new_values
+            elif isinstance(old_value, ast.AST):
+                new_node = self.rewrite(old_value, context, done)
+                if new_node is None:
+                    delattr(node, field)
+                else:
+                    setattr(node, field, new_node)
+
+    def rewrite(self, node, context, done):
+        if id(node) in done:
+            return node
+        for rule in self.enter_rules.get(type(node), []):
+            self.apply(rule, node, context)
+        self.rewrite_children(node, context, done)
+        done[id(node)] = node
+        for rule in self.rules.get(type(node), []):
+            result = self.apply(rule, node, context)
+            if result is node:
+                continue
+            if isinstance(result, ast.AST):
+                return self.rewrite(result, context, done)
+            if isinstance(result, list):
+                rewritten = []
+                for statement in result:
+                    statement = self.rewrite(statement, context, done)
+                    if isinstance(statement, ast.AST):
+                        rewritten.append(statement)
+                    elif statement is not None:
+                        rewritten.extend(statement)
+                return rewritten
+            return result
+        return node
@@ -1,100 +1,94 @@
+import bisect
+import difflib
+
 from comparison.structures.State import *
 from comparison.structures.transformation_operation import *
 from comparison.utils.astTools import *
 
 
-def match_lists(list_x, list_y):
-    """For each line in x, determine which line it best maps to in y"""
-    list_x = [(list_x[i], i) for i in range(len(list_x))]
-    list_y = [(list_y[i], i) for i in range(len(list_y))]
-    # First, separate out all the lines based on their types, as we only match between types
-    type_map = {}
-    for i in range(len(list_x)):
-        candidate_type = type(list_x[i][0])
-        if candidate_type in type_map:
-            pass
-        x_subset = list(filter(lambda tmp: type(tmp[0]) is candidate_type, list_x))
-        y_subset = list(filter(lambda tmp: type(tmp[0]) is candidate_type, list_y))
-        type_map[candidate_type] = (x_subset, y_subset)
+def line_key(line):
+    """Lines can only be equal when their keys are, used to align lists by their structural hashes"""
+    return type(line), structural_hash(line)
+
+
+def match_lists(list_x, list_y, diff_cache: dict = None):
+    """For each line in x, determine which line it best maps to in y.
+    The diffs between lines are kept in the diff_cache, if there is one."""
+    x_keys = [line_key(line) for line in list_x]
+    y_keys = [line_key(line) for line in list_y]
+    # Lines are only matched within their type, keep the types in order of first appearance
+    type_order = {}
+    for key in x_keys + y_keys:
+        type_order.setdefault(key[0], [[], [], []])
+
+    matched_x = [False] * len(list_x)
+    matched_y = [False] * len(list_y)
+
+    def match(i, j, phase):
+        matched_x[i] = matched_y[j] = True
+        type_order[x_keys[i][0]][phase].append((j, i))
+
+    def is_exact_match(i, j):
+        return not matched_x[i] and not matched_y[j] and x_keys[i] == y_keys[j] and \
+            compare_trees(list_x[i], list_y[j], check_equality=True) == 0
+
+    # First, find exact matches
+    # Give preference to items on the same line, then we won't need to do an edit
+    for i in range(min(len(list_x), len(list_y))):
+        if is_exact_match(i, i):
+            match(i, i, 0)
+    # Then anchor on the longest runs of equal lines, this is near linear when the lists are mostly equal
+    matcher = difflib.SequenceMatcher(None, x_keys, y_keys, autojunk=False)
+    for block in matcher.get_matching_blocks():
+        for k in range(block.size):
+            if is_exact_match(block.a + k, block.b + k):
+                match(block.a + k, block.b + k, 1)
+    # Then look for matches anywhere, these lines were moved
+    y_buckets = {}
     for j in range(len(list_y)):
-        candidate_type = type(list_y[j][0])
-        if candidate_type in type_map:
-            pass
-        x_subset = list(filter(lambda tmp: type(tmp[0]) is candidate_type, list_x))
-        y_subset = list(filter(lambda tmp: type(tmp[0]) is candidate_type, list_y))
-        type_map[candidate_type] = (x_subset, y_subset)
-
-    map_set = {}
-    for candidate_type in type_map:
-        # For each type, find the optimal matching
-        (x_subset, y_subset) = type_map[candidate_type]
-        # First, find exact matches and remove them
-        # Give preference to items on the same line, then we won't need to do an edit
-        i = 0
-        while i < len(x_subset):
-            j = 0
-            while j < len(y_subset):
-                if x_subset[i][1] == y_subset[j][1]:
-                    if (
-                            compare_trees(x_subset[i][0], y_subset[j][0], check_equality=True)
-                            == 0
-                    ):
-                        map_set[y_subset[j][1]] = x_subset[i][1]
-                        x_subset.pop(i)
-                        y_subset.pop(j)
-                        break
-                j += 1
-            else:
-                i += 1
-        # Then look for matches anywhere
-        i = 0
-        while i < len(x_subset):
-            j = 0
-            while j < len(y_subset):
-                if compare_trees(x_subset[i][0], y_subset[j][0], check_equality=True) == 0:
-                    map_set[y_subset[j][1]] = x_subset[i][1]
-                    x_subset.pop(i)
-                    y_subset.pop(j)
-                    break
-                j += 1
-            else:
-                i += 1  # if we break, don't increment!
-        # TODO - check for subsets/supersets in here?
-        # Then, look for the 'best we can do' matches
+        if not matched_y[j]:
+            y_buckets.setdefault(y_keys[j], []).append(j)
+    for i in range(len(list_x)):
+        for j in y_buckets.get(x_keys[i], []):
+            if is_exact_match(i, j):
+                match(i, j, 1)
+                y_buckets[x_keys[i]].remove(j)
+                break
+    # TODO - check for subsets/supersets in here?
+    # Then, look for the 'best we can do' matches
+    for candidate_type in type_order:
+        x_subset = [i for i in range(len(list_x)) if not matched_x[i] and x_keys[i][0] is candidate_type]
+        y_subset = [j for j in range(len(list_y)) if not matched_y[j] and y_keys[j][0] is candidate_type]
         distance_list = []
-        for i in range(len(x_subset)):  # Identify the best matches across all pairs
+        for i in x_subset:  # Identify the best matches across all pairs
             candidate_state = State()
-            candidate_state.tree = x_subset[i][0]
-            for j in range(len(y_subset)):
+            candidate_state.tree = list_x[i]
+            for j in y_subset:
                 inner_candidate_state = State()
-                inner_candidate_state.tree = y_subset[j][0]
-                inner_distance, _ = distance(candidate_state, inner_candidate_state)
-                inner_distance = int(inner_distance * 1000)
-                distance_list.append((inner_distance, x_subset[i][1], y_subset[j][1]))
+                inner_candidate_state.tree = list_y[j]
+                inner_distance, _ = distance(candidate_state, inner_candidate_state, diff_cache=diff_cache)
+                distance_list.append((int(inner_distance * 1000), i, j))
         # Compare first based on distance, then based on how close the lines are to each other
         distance_list.sort(key=lambda x: (x[0], x[1] - x[2]))
-        line_distance = min(len(x_subset), len(y_subset))
         # Now pick the best pairs 'til we run out of them
-        while line_distance > 0:
-            (inner_distance, xLine, yLine) = distance_list[0]
-            map_set[yLine] = xLine
-            distance_list = list(
-                filter(lambda pair: pair[1] != xLine and pair[2] != yLine, distance_list)
-            )
-            line_distance -= 1
+        for (inner_distance, x_line, y_line) in distance_list:
+            if not matched_x[x_line] and not matched_y[y_line]:
+                match(x_line, y_line, 2)
+
+    map_set = {}
+    for same_line, exact, closest in type_order.values():
+        for (y_line, x_line) in same_line + sorted(exact, key=lambda pair: pair[1]) + closest:
+            map_set[y_line] = x_line
     # Now, look for matches across different types
-    leftover_y = list(filter(lambda tmp: tmp not in map_set, range(len(list_y))))
-    leftover_x = list(filter(lambda tmp: tmp not in map_set.values(), range(len(list_x))))
+    leftover_y = [j for j in range(len(list_y)) if not matched_y[j]]
+    leftover_x = [i for i in range(len(list_x)) if not matched_x[i]]
     # First, look for exact line matches
-    i = 0
-    while i < len(leftover_x):
-        line = leftover_x[i]
-        if line in leftover_y:
+    same_lines = set(leftover_x).intersection(leftover_y)
+    for line in leftover_x:
+        if line in same_lines:
             map_set[line] = line
-            leftover_x.remove(line)
-            leftover_y.remove(line)
-        else:
-            i += 1
+    leftover_x = [line for line in leftover_x if line not in same_lines]
+    leftover_y = [line for line in leftover_y if line not in same_lines]
     # Then, just put the rest in place
     for i in range(min(len(leftover_y), len(leftover_x))):  # map together all equal parts
         map_set[leftover_y[i]] = leftover_x[i]
@@ -107,58 +101,83 @@ def match_lists(list_x, list_y):
     return map_set
 
 
-# Recursively generate all moves by working from the outside of the list inwards.
-def generate_move_pairs(start_list, end_list):
-    # Base case: If either list has 1 or 0 elements, no moves are needed.
-    if len(start_list) <= 1:
-        return []
-
-    # If the first elements match, no move is needed for the first element.
-    if start_list[0] == end_list[0]:
-        return generate_move_pairs(start_list[1:], end_list[1:])
-
-    # If the last elements match, no move is needed for the last element.
-    if start_list[-1] == end_list[-1]:
-        return generate_move_pairs(start_list[:-1], end_list[:-1])
-
-    # If the first element of start_list matches the last of end_list and vice versa, swap them.
-    if start_list[0] == end_list[-1] and start_list[-1] == end_list[0]:
-        return [("swap", start_list[0], start_list[-1])] + generate_move_pairs(start_list[1:-1], end_list[1:-1])
-
-    # If the first element of start_list is at the end of end_list, move it to the front.
-    if start_list[0] == end_list[-1]:
-        return [("move", start_list[0])] + generate_move_pairs(start_list[1:], end_list[:-1])
+def longest_increasing_subsequence(values):
+    """The positions of a longest strictly increasing subsequence of values"""
+    tails, tail_positions, previous = [], [], [-1] * len(values)
+    for i, value in enumerate(values):
+        k = bisect.bisect_left(tails, value)
+        if k == len(tails):
+            tails.append(value)
+            tail_positions.append(i)
+        else:
+            tails[k] = value
+            tail_positions[k] = i
+        previous[i] = tail_positions[k - 1] if k > 0 else -1
+    result = set()
+    i = tail_positions[-1] if tail_positions else -1
+    while i != -1:
+        result.add(i)
+        i = previous[i]
+    return result
 
-    # If the last element of start_list is at the beginning of end_list, move it to the back.
-    if start_list[-1] == end_list[0]:
-        return [("move", start_list[-1])] + generate_move_pairs(start_list[:-1], end_list[1:])
 
-    # For other cases, find the position of the first element of start_list in end_list and move it.
-    i = end_list.index(start_list[0])
-    return [("move", start_list[0])] + generate_move_pairs(start_list[1:], end_list[:i] + end_list[i + 1:])
+def generate_move_pairs(start_list, end_list):
+    """Generate the moves and swaps that turn start_list into end_list, working from the outside of the lists inwards.
+    The lists hold the same distinct items, only the index range still being worked on is tracked."""
+    move_pairs = []
+    start_low, start_high = 0, len(start_list)
+    end_low, end_high = 0, len(end_list)
+    # If there are 1 or 0 elements left, no moves are needed.
+    while start_high - start_low > 1:
+        first, last = start_list[start_low], start_list[start_high - 1]
+        if first == end_list[end_low]:
+            # If the first elements match, no move is needed for the first element.
+            start_low, end_low = start_low + 1, end_low + 1
+        elif last == end_list[end_high - 1]:
+            # If the last elements match, no move is needed for the last element.
+            start_high, end_high = start_high - 1, end_high - 1
+        elif first == end_list[end_high - 1] and last == end_list[end_low]:
+            # If the first element of start_list matches the last of end_list and vice versa, swap them.
+            move_pairs.append(("swap", first, last))
+            start_low, start_high = start_low + 1, start_high - 1
+            end_low, end_high = end_low + 1, end_high - 1
+        elif first == end_list[end_high - 1]:
+            # If the first element of start_list is at the end of end_list, move it to the front.
+            move_pairs.append(("move", first))
+            start_low, end_high = start_low + 1, end_high - 1
+        elif last == end_list[end_low]:
+            # If the last element of start_list is at the beginning of end_list, move it to the back.
+            move_pairs.append(("move", last))
+            start_high, end_low = start_high - 1, end_low + 1
+        else:
+            # Otherwise keep the longest run of elements that are already in order and move everything else,
+            # that's the fewest moves that will do.
+            end_positions = {item: i for i, item in enumerate(end_list)}
+            remaining = start_list[start_low:start_high]
+            in_order = longest_increasing_subsequence([end_positions[item] for item in remaining])
+            move_pairs += [("move", item) for i, item in enumerate(remaining) if i not in in_order]
+            break
+    return move_pairs
 
 
 def find_move_vectors(map_set, list_x, list_y):
     change_vectors = []
     # First, get all the added and deleted lines
-    deleted_lines = map_set[-1] if -1 in map_set else []
-    for line in sorted(deleted_lines):
+    deleted_lines = sorted(map_set[-1]) if -1 in map_set else []
+    for line in deleted_lines:
         change_vectors.append(DeleteOperation([line], list_x[line], None))
 
-    added_lines = list(filter(lambda tmp: map_set[tmp] == -1, map_set.keys()))
+    added_lines = sorted(line for line in map_set if map_set[line] == -1)
     added_offset = 0  # Because added lines don't start in the list, we need
     # to offset their positions for each new one that's added
-    for line in sorted(added_lines):
+    for line in added_lines:
         change_vectors.append(AddOperation([line - added_offset], None, list_y[line]))
         added_offset += 1
     """We'll find all the moved lines by recreating the mapSet from a tmpSet using actions"""
-    start_list = list(range(len(list_x)))
-    end_list = [map_set[i] for i in range(len(list_y))]
-    # Remove deletes from start_list and adds from end_list.
-    for line in deleted_lines:
-        start_list.remove(line)
-    while -1 in end_list:
-        end_list.remove(-1)
+    # Leave out deletes from start_list and adds from end_list.
+    deleted = set(deleted_lines)
+    start_list = [line for line in range(len(list_x)) if line not in deleted]
+    end_list = [map_set[i] for i in range(len(list_y)) if map_set[i] != -1]
     if len(start_list) != len(end_list):
         log(
             "diffAsts\tfindMovedLines\tUnequal lists: "
@@ -169,41 +188,31 @@ def find_move_vectors(map_set, list_x, list_y):
         )
         return []
     if start_list != end_list:
+        end_positions = {line: i for i, line in enumerate(end_list)}
         move_pairs = generate_move_pairs(start_list, end_list)
         for pair in move_pairs:
             if pair[0] == "move":
-                change_vectors.append(MoveOperation([-1], pair[1], end_list.index(pair[1])))
+                change_vectors.append(MoveOperation([-1], pair[1], end_positions[pair[1]]))
             elif pair[0] == "swap":
                 change_vectors.append(SwapOperation([-1], pair[1], pair[2]))
             else:
                 log("Missing movePair type: " + str(pair[0]), "bug")
     # We need to make sure the indices start at the appropriate numbers, since they're referring to the original tree
-    if len(deleted_lines) > 0:
-        for action in change_vectors:
-            if isinstance(action, MoveOperation):
-                add_to_count = 0
-                for deleteAction in deleted_lines:
-                    if deleteAction <= action.new_subtree:
-                        add_to_count += 1
-                action.new_subtree += add_to_count
-    if len(added_lines) > 0:
-        for action in change_vectors:
-            if isinstance(action, MoveOperation):
-                add_to_count = 0
-                for addAction in added_lines:
-                    if addAction <= action.new_subtree:
-                        add_to_count += 1
-                action.new_subtree += add_to_count
+    for shifting_lines in (deleted_lines, added_lines):
+        if len(shifting_lines) > 0:
+            for action in change_vectors:
+                if isinstance(action, MoveOperation):
+                    action.new_subtree += bisect.bisect_right(shifting_lines, action.new_subtree)
     return change_vectors
 
 
-def diff_lists(list_x: List, list_y: List) -> List[ChangeOperation]:
+def diff_lists(list_x: List, list_y: List, diff_cache: dict = None) -> List[ChangeOperation]:
     if len(list_x) == 0 and len(list_y) == 0:
         return []
     # Check identical lists
     if list_x == list_y:
         return []
-    map_set = match_lists(list_x, list_y)
+    map_set = match_lists(list_x, list_y, diff_cache)
     change_vectors = []
 
     # Now, find all the required moves
@@ -215,15 +224,18 @@ def diff_lists(list_x: List, list_y: List) -> List[ChangeOperation]:
         i = map_set[j]
         # Not a delete move or an add move.
         if j != -1 and i != -1:
-            temp_vectors = diff_asts(list_x[i], list_y[j])
+            temp_vectors = diff_asts(list_x[i], list_y[j], diff_cache)
             for change in temp_vectors:
                 change.path.append(i)
             change_vectors += temp_vectors
     return change_vectors
 
 
-def diff_asts(ast_x, ast_y):
-    """Find all change vectors between x and y"""
+def diff_asts(ast_x, ast_y, diff_cache: dict = None):
+    """Find all change vectors between x and y.
+    A diff_cache remembers the diffs between the lines of lists that are matched by their distance. Subtrees that
+    the candidates of one search don't change are shared with the student tree, so the same pairs of lines are
+    matched again for every candidate."""
     if isinstance(ast_x, ast.AST) and isinstance(ast_y, ast.AST):
         if type(ast_x) is not type(ast_y):  # different node types
             if occurs_in(ast_x, ast_y):
@@ -244,17 +256,19 @@ def diff_asts(ast_x, ast_y):
         # For every field, like body, or value, etc.
         for field in ast_x.__getattribute__("_fields"):
             try:
-                current_diffs = diff_asts(getattr(ast_x, field), getattr(ast_y, field))
+                current_diffs = diff_asts(getattr(ast_x, field), getattr(ast_y, field), diff_cache)
                 if current_diffs:
                     for change in current_diffs:
                         change.path.append((field, astNames[type(ast_x)]))
                     found_differences += current_diffs
             except AttributeError:
-                setattr(ast_x, field, None)
+                # One of the trees is missing the field (e.g. a copied Module without type_ignores),
+                # skip it rather than patching the node, as ast_x may be a shared goal tree
+                continue
         return found_differences
     elif not isinstance(ast_x, ast.AST) and not isinstance(ast_y, ast.AST):
         if type(ast_x) is list and type(ast_y) is list:
-            return diff_lists(ast_x, ast_y)
+            return diff_lists(ast_x, ast_y, diff_cache)
         elif ast_x is not ast_y or type(ast_x) is not type(ast_y):
             # Check if they are both primitive types, if they are, and are the same value, return nothing
             if type(ast_x) in [int, float, str, bool] and type(ast_y) in [int, float, str, bool]:
@@ -268,7 +282,174 @@ def diff_asts(ast_x, ast_y):
 
 
 def sum_weight(bases):
-    return sum(map(lambda x: get_weight(x), bases))
+    return get_weight(bases)
+
+
+def field_weight(value, count_tokens=True):
+    """The weight of a field of a node, its children have to be weighed already"""
+    if value is None:
+        return 0
+    elif type(value) is list:
+        return sum([field_weight(item, count_tokens) for item in value])
+    elif not isinstance(value, ast.AST):
+        return 1
+    if "treeWeight" not in value.__dict__:
+        weigh_tree(value)
+    if count_tokens:
+        return value.treeWeight
+    return value.__dict__.get("treeWeightNoTokens", value.treeWeight)
+
+
+def at_least_one(weight):
+    return weight if weight > 0 else 1
+
+
+def else_weight(orelse, weigh):
+    # add 1 for else
+    return 1 + weigh(orelse) if len(orelse) > 0 else 0
+
+
+# How to weigh each node type from the weights of its fields, weigh gives the weight of a field
+weight_rules = {
+    ast.Module: lambda node, weigh: weigh(node.body),
+    ast.Interactive: lambda node, weigh: weigh(node.body),
+    ast.Suite: lambda node, weigh: weigh(node.body),
+    ast.Expression: lambda node, weigh: weigh(node.body),
+    # add 1 for function name
+    ast.FunctionDef: lambda node, weigh: 1 + weigh(node.args) + weigh(node.body) + weigh(node.decorator_list) +
+                                         weigh(node.returns),
+    # add 1 for class name
+    ast.ClassDef: lambda node, weigh: 1 + field_weight(node.bases) + field_weight(node.keywords) +
+                                      weigh(node.body) + weigh(node.decorator_list),
+    # add 1 for action name
+    ast.Return: lambda node, weigh: 1 + weigh(node.value),
+    ast.Yield: lambda node, weigh: 1 + weigh(node.value),
+    ast.Attribute: lambda node, weigh: 1 + weigh(node.value),
+    ast.Starred: lambda node, weigh: 1 + weigh(node.value),
+    # add 1 for del
+    ast.Delete: lambda node, weigh: 1 + weigh(node.targets),
+    # add 1 for =
+    ast.Assign: lambda node, weigh: 1 + weigh(node.targets) + weigh(node.value),
+    ast.AugAssign: lambda node, weigh: weigh(node.target) + weigh(node.op) + weigh(node.value),
+    # add 1 for 'for' and 1 for 'in'
+    ast.For: lambda node, weigh: 2 + weigh(node.target) + weigh(node.iter) + weigh(node.body) + weigh(node.orelse),
+    # add 1 for while/if
+    ast.While: lambda node, weigh: 1 + weigh(node.test) + weigh(node.body) + else_weight(node.orelse, weigh),
+    ast.If: lambda node, weigh: 1 + weigh(node.test) + weigh(node.body) + else_weight(node.orelse, weigh),
+    # add 1 for with
+    ast.With: lambda node, weigh: 1 + weigh(node.items) + weigh(node.body),
+    # add 1 for raise
+    ast.Raise: lambda node, weigh: 1 + weigh(node.exc) + weigh(node.cause),
+    # add 1 for try, and 1 for finally
+    ast.Try: lambda node, weigh: 1 + weigh(node.body) + weigh(node.handlers) + else_weight(node.orelse, weigh) +
+                                 else_weight(node.finalbody, weigh),
+    # add 1 for assert
+    ast.Assert: lambda node, weigh: 1 + weigh(node.test) + weigh(node.msg),
+    ast.Import: lambda node, weigh: 1 + weigh(node.names),
+    ast.Global: lambda node, weigh: 1 + weigh(node.names),
+    # add 3 for from module import
+    ast.ImportFrom: lambda node, weigh: 3 + weigh(node.names),
+    ast.Expr: lambda node, weigh: at_least_one(weigh(node.value)),
+    ast.Index: lambda node, weigh: at_least_one(weigh(node.value)),
+    # add 1 for each op
+    ast.BoolOp: lambda node, weigh: (len(node.values) - 1) + weigh(node.values),
+    ast.BinOp: lambda node, weigh: 1 + weigh(node.left) + weigh(node.right),
+    ast.UnaryOp: lambda node, weigh: 1 + weigh(node.operand),
+    # add 1 for lambda
+    ast.Lambda: lambda node, weigh: 1 + weigh(node.args) + weigh(node.body),
+    # add 2 for if and else
+    ast.IfExp: lambda node, weigh: 2 + weigh(node.test) + weigh(node.body) + weigh(node.orelse),
+    # 1 even if it's an empty dictionary
+    ast.Dict: lambda node, weigh: 1 + weigh(node.keys) + weigh(node.values),
+    ast.Set: lambda node, weigh: 1 + weigh(node.elts),
+    ast.List: lambda node, weigh: 1 + weigh(node.elts),
+    ast.Tuple: lambda node, weigh: 1 + weigh(node.elts),
+    ast.ListComp: lambda node, weigh: 1 + weigh(node.elt) + weigh(node.generators),
+    ast.SetComp: lambda node, weigh: 1 + weigh(node.elt) + weigh(node.generators),
+    ast.GeneratorExp: lambda node, weigh: 1 + weigh(node.elt) + weigh(node.generators),
+    ast.DictComp: lambda node, weigh: 1 + weigh(node.key) + weigh(node.value) + weigh(node.generators),
+    ast.Compare: lambda node, weigh: len(node.ops) + weigh(node.left) + weigh(node.comparators),
+    ast.Call: lambda node, weigh: at_least_one(weigh(node.func)) + at_least_one(weigh(node.args) +
+                                                                                  weigh(node.keywords)),
+    ast.Subscript: lambda node, weigh: at_least_one(weigh(node.value)) + at_least_one(weigh(node.slice)),
+    ast.Slice: lambda node, weigh: at_least_one(weigh(node.lower) + weigh(node.upper) + weigh(node.step)),
+    ast.ExtSlice: lambda node, weigh: weigh(node.dims),
+    # add 2 for for and in, and each of the if tokens
+    ast.comprehension: lambda node, weigh: 2 + len(node.ifs) + weigh(node.target) + weigh(node.iter) +
+                                           weigh(node.ifs),
+    # add 1 for except, and 1 for as (if needed)
+    ast.ExceptHandler: lambda node, weigh: 1 + weigh(node.type) + (1 if node.name is not None else 0) +
+                                           weigh(node.name) + weigh(node.body),
+    ast.arguments: lambda node, weigh: weigh(node.args) + weigh(node.vararg) + weigh(node.kwonlyargs) +
+                                       weigh(node.kw_defaults) + weigh(node.kwarg) + weigh(node.posonlyargs),
+    ast.arg: lambda node, weigh: 1 + weigh(node.annotation),
+    # add 1 for identifier
+    ast.keyword: lambda node, weigh: 1 + weigh(node.value),
+    # 1 for name, 1 for as, 1 for asname
+    ast.alias: lambda node, weigh: 1 + (2 if node.asname is not None else 0),
+    ast.withitem: lambda node, weigh: weigh(node.context_expr) + weigh(node.optional_vars),
+    ast.JoinedStr: lambda node, weigh: weigh(node.values),
+    ast.FormattedValue: lambda node, weigh: weigh(node.value),
+}
+for leaf_type in [ast.Pass, ast.Break, ast.Continue, ast.Constant, ast.Name,
+                  ast.And, ast.Or, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod, ast.Pow,
+                  ast.LShift, ast.RShift, ast.BitOr, ast.BitXor, ast.BitAnd, ast.FloorDiv,
+                  ast.Invert, ast.Not, ast.UAdd, ast.USub,
+                  ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Is, ast.IsNot, ast.In, ast.NotIn,
+                  ast.Load, ast.Store, ast.Del, ast.AugLoad, ast.AugStore, ast.Param]:
+    weight_rules[leaf_type] = lambda node, weigh: 1
+
+
+def is_placeholder(node):
+    """Hint templates stand in strings like ~program~ for code, they aren't counted unless counting tokens"""
+    return type(node) is ast.Constant and type(node.value) is str and len(node.value) >= 2 and \
+        node.value[0] == "~" and node.value[-1] == "~"
+
+
+def child_nodes(node):
+    """The AST children of a node, like ast.iter_child_nodes but as a list"""
+    children = []
+    for field in node._fields:
+        value = getattr(node, field, None)
+        if isinstance(value, ast.AST):
+            children.append(value)
+        elif type(value) is list:
+            children += [item for item in value if isinstance(item, ast.AST)]
+    return children
+
+
+def weigh_node(node, children):
+    """Weigh a node whose children are weighed, caching its weights, depth and structural hash"""
+    rule = weight_rules.get(type(node))
+    if rule is None:
+        log("diffAsts\tgetWeight\tMissing type in diffAsts: " + str(type(node)), "bug")
+        node.treeWeight = 1
+    else:
+        node.treeWeight = rule(node, field_weight)
+        # Without counting tokens the weight only differs when there's a placeholder in the subtree
+        if is_placeholder(node):
+            node.treeWeightNoTokens = 0
+        elif any("treeWeightNoTokens" in child.__dict__ for child in children):
+            no_tokens_weight = rule(node, lambda value: field_weight(value, count_tokens=False))
+            if no_tokens_weight != node.treeWeight:
+                node.treeWeightNoTokens = no_tokens_weight
+    node.treeDepth = 1 + max([depth_of_ast(child) for child in children], default=0)
+    structural_hash(node)
+
+
+def weigh_tree(tree):
+    """Weigh every node of the tree in one iterative post-order pass, nodes that are already weighed are skipped"""
+    stack = [(tree, None)]
+    while len(stack) > 0:
+        node, children = stack.pop()
+        if "treeWeight" in node.__dict__:
+            continue
+        if children is not None:
+            weigh_node(node, children)
+        else:
+            children = child_nodes(node)
+            stack.append((node, children))
+            stack += [(child, None) for child in children if "treeWeight" not in child.__dict__]
 
 
 def get_weight(given_tree, count_tokens=True):
@@ -276,195 +457,26 @@ def get_weight(given_tree, count_tokens=True):
     if given_tree is None:
         return 0
     elif type(given_tree) is list:
-        return sum(map(lambda token: get_weight(token, count_tokens), given_tree))
+        return sum([get_weight(token, count_tokens) for token in given_tree])
     elif not isinstance(given_tree, ast.AST):
         return 1
-    else:  # Otherwise, it's an AST node
-        if hasattr(given_tree, "treeWeight"):
-            return given_tree.treeWeight
-        weight = 0
-        if type(given_tree) in [ast.Module, ast.Interactive, ast.Suite]:
-            weight = get_weight(given_tree.body, count_tokens=count_tokens)
-        elif type(given_tree) is ast.Expression:
-            weight = get_weight(given_tree.body, count_tokens=count_tokens)
-        elif type(given_tree) is ast.FunctionDef:
-            # add 1 for function name
-            weight = 1 + get_weight(given_tree.args, count_tokens=count_tokens) + \
-                     get_weight(given_tree.body, count_tokens=count_tokens) + \
-                     get_weight(given_tree.decorator_list, count_tokens=count_tokens) + \
-                     get_weight(given_tree.returns, count_tokens=count_tokens)
-        elif type(given_tree) is ast.ClassDef:
-            # add 1 for class name
-            weight = 1 + sum_weight(given_tree.bases) + \
-                     sum_weight(given_tree.keywords) + \
-                     get_weight(given_tree.body, count_tokens=count_tokens) + \
-                     get_weight(given_tree.decorator_list, count_tokens=count_tokens)
-        elif type(given_tree) in [ast.Return, ast.Yield, ast.Attribute, ast.Starred]:
-            # add 1 for action name
-            weight = 1 + get_weight(given_tree.value, count_tokens=count_tokens)
-        elif type(given_tree) is ast.Delete:  # add 1 for del
-            weight = 1 + get_weight(given_tree.targets, count_tokens=count_tokens)
-        elif type(given_tree) is ast.Assign:  # add 1 for =
-            weight = 1 + get_weight(given_tree.targets, count_tokens=count_tokens) + \
-                     get_weight(given_tree.value, count_tokens=count_tokens)
-        elif type(given_tree) is ast.AugAssign:
-            weight = get_weight(given_tree.target, count_tokens=count_tokens) + \
-                     get_weight(given_tree.op, count_tokens=count_tokens) + \
-                     get_weight(given_tree.value, count_tokens=count_tokens)
-        elif type(given_tree) is ast.For:  # add 1 for 'for' and 1 for 'in'
-            weight = 2 + get_weight(given_tree.target, count_tokens=count_tokens) + \
-                     get_weight(given_tree.iter, count_tokens=count_tokens) + \
-                     get_weight(given_tree.body, count_tokens=count_tokens) + \
-                     get_weight(given_tree.orelse, count_tokens=count_tokens)
-        elif type(given_tree) in [ast.While, ast.If]:
-            # add 1 for while/if
-            weight = 1 + get_weight(given_tree.test, count_tokens=count_tokens) + \
-                     get_weight(given_tree.body, count_tokens=count_tokens)
-            if len(given_tree.orelse) > 0:  # add 1 for else
-                weight += 1 + get_weight(given_tree.orelse, count_tokens=count_tokens)
-        elif type(given_tree) is ast.With:  # add 1 for with
-            weight = 1 + get_weight(given_tree.items, count_tokens=count_tokens) + \
-                     get_weight(given_tree.body, count_tokens=count_tokens)
-        elif type(given_tree) is ast.Raise:  # add 1 for raise
-            weight = 1 + get_weight(given_tree.exc, count_tokens=count_tokens) + \
-                     get_weight(given_tree.cause, count_tokens=count_tokens)
-        elif type(given_tree) is ast.Try:  # add 1 for try
-            weight = 1 + get_weight(given_tree.body, count_tokens=count_tokens) + \
-                     get_weight(given_tree.handlers, count_tokens=count_tokens)
-            if len(given_tree.orelse) > 0:  # add 1 for else
-                weight += 1 + get_weight(given_tree.orelse, count_tokens=count_tokens)
-            if len(given_tree.finalbody) > 0:  # add 1 for finally
-                weight += 1 + get_weight(given_tree.finalbody, count_tokens=count_tokens)
-        elif type(given_tree) is ast.Assert:  # add 1 for assert
-            weight = 1 + get_weight(given_tree.test, count_tokens=count_tokens) + \
-                     get_weight(given_tree.msg, count_tokens=count_tokens)
-        elif type(given_tree) in [ast.Import, ast.Global]:  # add 1 for function name
-            weight = 1 + get_weight(given_tree.names, count_tokens=count_tokens)
-        elif type(given_tree) is ast.ImportFrom:  # add 3 for from module import
-            weight = 3 + get_weight(given_tree.names, count_tokens=count_tokens)
-        elif type(given_tree) in [ast.Expr, ast.Index]:
-            weight = get_weight(given_tree.value, count_tokens=count_tokens)
-            if weight == 0:
-                weight = 1
-        elif type(given_tree) is ast.BoolOp:  # add 1 for each op
-            weight = (len(given_tree.values) - 1) + \
-                     get_weight(given_tree.values, count_tokens=count_tokens)
-        elif type(given_tree) is ast.BinOp:  # add 1 for op
-            weight = 1 + get_weight(given_tree.left, count_tokens=count_tokens) + \
-                     get_weight(given_tree.right, count_tokens=count_tokens)
-        elif type(given_tree) is ast.UnaryOp:  # add 1 for operator
-            weight = 1 + get_weight(given_tree.operand, count_tokens=count_tokens)
-        elif type(given_tree) is ast.Lambda:  # add 1 for lambda
-            weight = 1 + get_weight(given_tree.args, count_tokens=count_tokens) + \
-                     get_weight(given_tree.body, count_tokens=count_tokens)
-        elif type(given_tree) is ast.IfExp:  # add 2 for if and else
-            weight = 2 + get_weight(given_tree.test, count_tokens=count_tokens) + \
-                     get_weight(given_tree.body, count_tokens=count_tokens) + \
-                     get_weight(given_tree.orelse, count_tokens=count_tokens)
-        elif type(given_tree) is ast.Dict:  # return 1 if empty dictionary
-            weight = 1 + get_weight(given_tree.keys, count_tokens=count_tokens) + \
-                     get_weight(given_tree.values, count_tokens=count_tokens)
-        elif type(given_tree) in [ast.Set, ast.List, ast.Tuple]:
-            weight = 1 + get_weight(given_tree.elts, count_tokens=count_tokens)
-        elif type(given_tree) in [ast.ListComp, ast.SetComp, ast.GeneratorExp]:
-            weight = 1 + get_weight(given_tree.elt, count_tokens=count_tokens) + \
-                     get_weight(given_tree.generators, count_tokens=count_tokens)
-        elif type(given_tree) is ast.DictComp:
-            weight = 1 + get_weight(given_tree.key, count_tokens=count_tokens) + \
-                     get_weight(given_tree.value, count_tokens=count_tokens) + \
-                     get_weight(given_tree.generators, count_tokens=count_tokens)
-        elif type(given_tree) is ast.Compare:
-            weight = len(given_tree.ops) + get_weight(given_tree.left, count_tokens=count_tokens) + \
-                     get_weight(given_tree.comparators, count_tokens=count_tokens)
-        elif type(given_tree) is ast.Call:
-            function_weight = get_weight(given_tree.func, count_tokens=count_tokens)
-            function_weight = function_weight if function_weight > 0 else 1
-            args_weight = get_weight(given_tree.args, count_tokens=count_tokens) + \
-                          get_weight(given_tree.keywords, count_tokens=count_tokens)
-            args_weight = args_weight if args_weight > 0 else 1
-            weight = function_weight + args_weight
-        elif type(given_tree) is ast.Subscript:
-            value_weight = get_weight(given_tree.value, count_tokens=count_tokens)
-            value_weight = value_weight if value_weight > 0 else 1
-            slice_weight = get_weight(given_tree.slice, count_tokens=count_tokens)
-            slice_weight = slice_weight if slice_weight > 0 else 1
-            weight = value_weight + slice_weight
-
-        elif type(given_tree) is ast.Slice:
-            weight = get_weight(given_tree.lower, count_tokens=count_tokens) + \
-                     get_weight(given_tree.upper, count_tokens=count_tokens) + \
-                     get_weight(given_tree.step, count_tokens=count_tokens)
-            if weight == 0:
-                weight = 1
-        elif type(given_tree) is ast.ExtSlice:
-            weight = get_weight(given_tree.dims, count_tokens=count_tokens)
-
-        elif type(given_tree) is ast.comprehension:  # add 2 for for and in
-            # and each of the if tokens
-            weight = 2 + len(given_tree.ifs) + \
-                     get_weight(given_tree.target, count_tokens=count_tokens) + \
-                     get_weight(given_tree.iter, count_tokens=count_tokens) + \
-                     get_weight(given_tree.ifs, count_tokens=count_tokens)
-        elif type(given_tree) is ast.ExceptHandler:  # add 1 for except
-            weight = 1 + get_weight(given_tree.type, count_tokens=count_tokens)
-            # add 1 for as (if needed)
-            weight += (1 if given_tree.name is not None else 0) + \
-                      get_weight(given_tree.name, count_tokens=count_tokens)
-            weight += get_weight(given_tree.body, count_tokens=count_tokens)
-        elif type(given_tree) is ast.arguments:
-            weight = get_weight(given_tree.args, count_tokens=count_tokens) + \
-                     get_weight(given_tree.vararg, count_tokens=count_tokens) + \
-                     get_weight(given_tree.kwonlyargs, count_tokens=count_tokens) + \
-                     get_weight(given_tree.kw_defaults, count_tokens=count_tokens) + \
-                     get_weight(given_tree.kwarg, count_tokens=count_tokens) + \
-                     get_weight(given_tree.posonlyargs, count_tokens=count_tokens)
-
-        elif type(given_tree) is ast.arg:
-            weight = 1 + get_weight(given_tree.annotation, count_tokens=count_tokens)
-        elif type(given_tree) is ast.keyword:  # add 1 for identifier
-            weight = 1 + get_weight(given_tree.value, count_tokens=count_tokens)
-        elif type(given_tree) is ast.alias:  # 1 for name, 1 for as, 1 for asname
-            weight = 1 + (2 if given_tree.asname is not None else 0)
-        elif type(given_tree) is ast.withitem:
-            weight = get_weight(given_tree.context_expr, count_tokens=count_tokens) + \
-                     get_weight(given_tree.optional_vars, count_tokens=count_tokens)
-        elif type(given_tree) is ast.Str:
-            if count_tokens:
-                weight = 1
-            elif len(given_tree.s) >= 2 and given_tree.s[0] == "~" and given_tree.s[-1] == "~":
-                weight = 0
-            else:
-                weight = 1
-        elif type(given_tree) in [ast.Pass, ast.Break, ast.Continue,
-                                  ast.Constant, ast.Name,
-                                  ]:
-            weight = 1
-        elif type(given_tree) in [ast.And, ast.Or,
-                                  ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod, ast.Pow,
-                                  ast.LShift, ast.RShift, ast.BitOr, ast.BitXor,
-                                  ast.BitAnd, ast.FloorDiv,
-                                  ast.Invert, ast.Not, ast.UAdd, ast.USub,
-                                  ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
-                                  ast.Is, ast.IsNot, ast.In, ast.NotIn,
-                                  ast.Load, ast.Store, ast.Del, ast.AugLoad,
-                                  ast.AugStore, ast.Param]:
-            weight = 1
-
-        elif type(given_tree) is ast.JoinedStr:
-            weight = get_weight(given_tree.values, count_tokens=count_tokens)
-        elif type(given_tree) is ast.FormattedValue:
-            weight = get_weight(given_tree.value, count_tokens=count_tokens)
-        else:
-            log("diffAsts\tgetWeight\tMissing type in diffAsts: " + str(type(given_tree)), "bug")
-            return 1
-        setattr(given_tree, "treeWeight", weight)
-        return weight
-
-
-def get_changes(student_code_tree: ast.AST, candidate_code_tree: ast.AST):
-    changes = diff_asts(student_code_tree, candidate_code_tree)
+    if "treeWeight" not in given_tree.__dict__:
+        weigh_tree(given_tree)
+    return field_weight(given_tree, count_tokens)
+
+
+def get_changes(student_code_tree: ast.AST, candidate_code_tree: ast.AST, diff_cache: dict = None):
+    """The changes that turn the student tree into the candidate tree.
+    A diff_cache dict remembers them by the identity of both trees, it holds on to the trees so the ids stay valid."""
+    if diff_cache is not None:
+        key = (id(student_code_tree), id(candidate_code_tree))
+        if key in diff_cache:
+            return diff_cache[key][2]
+    changes = diff_asts(student_code_tree, candidate_code_tree, diff_cache)
     for change in changes:
         change.start = student_code_tree
+    if diff_cache is not None:
+        diff_cache[key] = (student_code_tree, candidate_code_tree, changes)
     return changes
 
 
@@ -491,7 +503,7 @@ def get_changes_weight(changes, countTokens=True):
     return weight
 
 
-def distance(student_state: State, candidate: State, given_changes=None, forceReweight=False):
+def distance(student_state: State, candidate: State, given_changes=None, forceReweight=False, diff_cache=None):
     """A method for comparing solution states, which returns a number between
         0 (identical solutions) and 1 (completely different)
   returns a tuple of (distance, changes)
@@ -514,7 +526,7 @@ def distance(student_state: State, candidate: State, given_changes=None, forceRe
     if given_changes is not None:
         changes = given_changes
     else:
-        changes = get_changes(student_state.tree, candidate.tree)
+        changes = get_changes(student_state.tree, candidate.tree, diff_cache)
 
     change_weight = get_changes_weight(changes)
     return 1.0 * change_weight / base_weight, changes
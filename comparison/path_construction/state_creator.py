@@ -1,16 +1,20 @@
-from typing import Tuple
+import heapq
+import time
+from typing import Optional, Tuple
 
 from comparison.canonicalize.canon import get_canonical_form
 from comparison.path_construction.comparator import *
+from comparison.utils import profiling
+from comparison.utils.profiling import stage
 from comparison.utils.tools import *
 
 
-def desirability(student_state: State, candidate_state: State, goal_state: State):
+def desirability(student_state: State, candidate_state: State, goal_state: State, diff_cache: dict = None):
     score = 0
     d = 0
 
     # Minimize the distance from current to next
-    b = 1 - distance(student_state, candidate_state)[0]
+    b = 1 - distance(student_state, candidate_state, diff_cache=diff_cache)[0]
     candidate_state.distance_to_original = b
     score += 4 * b
 
@@ -21,7 +25,7 @@ def desirability(student_state: State, candidate_state: State, goal_state: State
 
     # Minimize the distance from the next state to the final state
     if candidate_state is not goal_state:
-        d = 1 - distance(goal_state, candidate_state)[0]
+        d = 1 - distance(goal_state, candidate_state, diff_cache=diff_cache)[0]
     candidate_state.distance_to_goal = d
     score += 2 * d
 
@@ -32,7 +36,7 @@ def desirability(student_state: State, candidate_state: State, goal_state: State
 def map_differences(start: ast.AST, end: ast.AST):
     diff_map = {"start": {}}
     all_changes = get_changes(start, end)
-    start_copy = deepcopy(start)
+    start_copy = start  # apply_change copies the path it edits, start itself is never modified
     for change in all_changes:
         change.update(start_copy, diff_map)
         start_copy = change.apply_change()
@@ -72,7 +76,7 @@ def update_change_vectors(changes, old_start, new_start):
     # We need new CVs here because they're going to change
     changes = [quick_deep_copy(change) for change in changes]
     map_dict = map_differences(old_start, new_start)
-    new_state = deepcopy(new_start)
+    new_state = new_start
     for change in changes:
         change.update(new_state, map_dict)  # map_dict gets updated each time
         new_state = change.apply_change()
@@ -134,7 +138,7 @@ def optimize_goal(student_state: CodeState, changes: list[ChangeOperation]):
         student_state.goal, student_state.distance_to_goal, = current_goal, current_diff
 
 
-def is_valid_next_state(student_state, new_state, goal_state):
+def is_valid_next_state(student_state, new_state, goal_state, diff_cache=None):
     """Checks the three rules for valid next states"""
 
     # We can't use the state itself!
@@ -162,7 +166,7 @@ def is_valid_next_state(student_state, new_state, goal_state):
 
     # We check if the distance is less than the current distance to the goal
     # If it's not, we don't want to use it
-    new_distance, _ = distance(student_state, new_state)
+    new_distance, _ = distance(student_state, new_state, diff_cache=diff_cache)
     if new_distance > student_state.distance_to_goal:
         return False
 
@@ -171,16 +175,16 @@ def is_valid_next_state(student_state, new_state, goal_state):
 
 
 def generate_states_in_path(student_state: CodeState,
-                            valid_combinations: list[tuple[list[ChangeOperation], CodeState]]):
+                            valid_combinations: list[tuple[list[ChangeOperation], CodeState, float]]):
+    """Pick the most desirable of the valid candidates, scored by the search, as the next state"""
     best_score, best_state = -1, None
     ideal_changes = None
 
-    for (change_vector, candidate_state) in valid_combinations:
+    for (change_vector, candidate_state, score) in valid_combinations:
         filtered_changes = [change for change in change_vector if
                             compare_trees(change.old_subtree, change.new_subtree, check_equality=True) != 0]
 
         if filtered_changes:
-            score = desirability(student_state, candidate_state, student_state.goal)
             if score > best_score:
                 best_score = score
                 best_state = candidate_state
@@ -190,61 +194,178 @@ def generate_states_in_path(student_state: CodeState,
     student_state.next = best_state
 
 
-def get_all_combinations(student_state: CodeState, changes: list[ChangeOperation]):
-    if len(changes) < 5:
-        all_changes = power_set(changes)
-    else:
-        all_changes = fastPowerSet(changes)
-    # Also find the solution states associated with the changes
-    all_combinations = []
-    for change in all_changes:
-        all_combinations.append((change, apply_change_vectors(student_state, change)))
-    return all_combinations
-
-
-def get_next_state(student_state: CodeState):
-    """Generates the next state in the solution space for the student state"""
-    (student_state.distance_to_goal, changes) = distance(student_state,
-                                                         student_state.goal)  # now get the actual changes
+def estimate_desirability(changes_weight: float, all_changes_weight: float, base_weight: float) -> float:
+    """A cheap estimate of desirability for a candidate made of changes weighing changes_weight,
+    assuming the distances to the student and to the goal are made up of the change weights alone."""
+    distance_to_original = changes_weight / base_weight
+    distance_to_goal = (all_changes_weight - changes_weight) / base_weight
+    return (4 * (1 - distance_to_original) + 2 * (1 - distance_to_goal)) / 6.0
+
+
+def desirability_bound(changes_weight: float, student_weight: float) -> float:
+    """An upper bound on the desirability of a candidate made of changes weighing changes_weight.
+    A change never adds more to the tree's weight than its own weight, so the candidate weighs at most
+    student_weight + changes_weight, which bounds its distance to the student from below. Its closeness to the goal
+    is at most 1. The bound shrinks as changes are added, so it also bounds every superset of the changes."""
+    distance_to_original = changes_weight / (student_weight + changes_weight)
+    return (4 * (1 - distance_to_original) + 2) / 6.0
+
+
+def get_all_combinations(student_state: CodeState, changes: list[ChangeOperation], beam_width: int = 8,
+                         node_budget: int = 64, diff_cache: dict = None, deadline: Optional[float] = None):
+    """Best-first search over the subsets of the changes, instead of building their whole power set.
+    Subsets are tried in order of their estimated desirability while that estimate can still beat the best
+    candidate found. At most beam_width larger subsets wait in the frontier, and no more than node_budget candidate
+    states are built, so with a small node_budget not even every single change is tried.
+    The search also stops at the deadline, a time.perf_counter() value, even before it found a valid candidate.
+    student_state.search_complete is left False when the beam, the node budget or the deadline cut off a subset
+    the estimate still expected to beat the best candidate. The estimate is not a bound on desirability, so
+    student_state.search_estimated is set when it gave up on a subset that an upper bound says could have won.
+    Returns the changes, candidate state and desirability of every candidate built, the desirability is None
+    for candidates that are not valid next states.
+    The subset each candidate was built from is put in the diff_cache as its changes from the student state,
+    so its distance doesn't need another diff."""
+    if diff_cache is None:
+        diff_cache = {}
+    change_weights = [get_changes_weight([change]) for change in changes]
+    all_changes_weight = sum(change_weights)
+    base_weight = max(get_weight(student_state.tree), get_weight(student_state.goal.tree), 1)
+    student_weight = max(get_weight(student_state.tree), 1)
+
+    def enumeration_order(subset):
+        # Where the power set (or the fast power set, from 5 changes) used to put the subset.
+        # Desirability ties between candidates are still settled by this order.
+        if len(changes) >= 5 and len(subset) == 1:
+            return 0, subset[0]
+        return 1, sum(1 << (len(changes) - 1 - i) for i in subset)
+
+    def entry(subset, weight):
+        # heapq pops the smallest entry first
+        estimate = estimate_desirability(weight, all_changes_weight, base_weight)
+        return -estimate, enumeration_order(subset), subset, weight
+
+    def promising(item):
+        # The estimate isn't a bound, subsets it gives up on are counted apart from the ones a budget cuts off
+        return -item[0] > best_score
+
+    def possible(item):
+        return desirability_bound(item[3], student_weight) > best_score
+
+    frontier = [entry([i], change_weights[i]) for i in range(len(changes))]
+    heapq.heapify(frontier)
+    best_score = -1
+    found = []
+    cut = False
+    estimated = False
+    while len(frontier) > 0 and len(found) < node_budget:
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        item = heapq.heappop(frontier)
+        _, _, subset, weight = item
+        if not promising(item):
+            estimated = estimated or possible(item)
+            continue  # not expected to beat the best candidate we already have
+        subset_changes = [changes[i] for i in subset]
+        # Also find the solution state associated with the changes
+        candidate_state = apply_change_vectors(student_state, subset_changes)
+        profiling.count("candidates")
+        if candidate_state is not None and candidate_state.tree is not None:
+            diff_cache[(id(student_state.tree), id(candidate_state.tree))] = \
+                (student_state.tree, candidate_state.tree, subset_changes)
+        score = None
+        with stage("validate"):
+            if is_valid_next_state(student_state, candidate_state, student_state.goal, diff_cache):
+                score = desirability(student_state, candidate_state, student_state.goal, diff_cache)
+                best_score = max(best_score, score)
+        found.append((subset, subset_changes, candidate_state, score))
+        for i in range(subset[-1] + 1, len(changes)):
+            extension = entry(subset + [i], weight + change_weights[i])
+            if promising(extension):
+                heapq.heappush(frontier, extension)
+            else:
+                estimated = estimated or possible(extension)
+        singles = [item for item in frontier if len(item[2]) == 1]
+        if len(frontier) - len(singles) > beam_width:
+            # Keep every single change, and the beam_width most promising larger subsets
+            larger = heapq.nsmallest(beam_width, [item for item in frontier if len(item[2]) > 1])
+            kept = {id(item) for item in larger}
+            cut = cut or any(promising(item) for item in frontier if len(item[2]) > 1 and id(item) not in kept)
+            frontier = singles + larger
+            heapq.heapify(frontier)
+    student_state.search_complete = not cut and not any(promising(item) for item in frontier)
+    student_state.search_estimated = estimated
+    found.sort(key=lambda item: enumeration_order(item[0]))
+    return [(subset_changes, candidate_state, score) for _, subset_changes, candidate_state, score in found]
+
+
+def get_next_state(student_state: CodeState, deadline: Optional[float] = None, node_budget: int = 64):
+    """Generates the next state in the solution space for the student state.
+    The search for it stops at the deadline (a time.perf_counter() value) or after building node_budget candidates,
+    with the best next state found so far, or none when no valid one was found by then. When the deadline already
+    passed, for instance during canonicalization, the diff isn't even started. student_state.search_complete tells
+    whether the budget or the deadline cut the search short."""
+    student_state.search_complete = True
+    student_state.search_estimated = False
+    if deadline is not None and time.perf_counter() >= deadline:
+        student_state.search_complete = False
+        student_state.next = None
+        return
+    # Every diff made while looking for the next state is kept here, so no pair of trees is diffed twice
+    diff_cache = {}
+    with stage("diff"):
+        (student_state.distance_to_goal, changes) = distance(student_state, student_state.goal,
+                                                             diff_cache=diff_cache)  # now get the actual changes
     # if the distance is 0, we're done
     if student_state.distance_to_goal == 0 or len(changes) == 0:
         student_state.next = None
         return
-    changes = get_changes(student_state.tree, student_state.goal.tree)
-    all_combinations = get_all_combinations(student_state, changes)
+    with stage("search"):
+        all_combinations = get_all_combinations(student_state, changes, node_budget=node_budget,
+                                                diff_cache=diff_cache, deadline=deadline)
     # Filtering changes that don't actually change anything.
     changes = [change for change in changes if
                compare_trees(change.old_subtree, change.new_subtree, check_equality=True) != 0]
 
     student_state.changesToGoal = len(changes)
 
-    # Now check for the required properties of a next state. Filter before sorting to save time
-    valid_combinations = filter(lambda candidate: is_valid_next_state(student_state, candidate[1], student_state.goal),
-                                all_combinations)
-    # Order based on the longest-changes first, but with edits in order
-    valid_combinations = sorted(valid_combinations, key=lambda x: len(x))
+    with stage("select"):
+        # The search already checked which candidates are valid next states, and scored those
+        valid_combinations = [candidate for candidate in all_combinations if candidate[2] is not None]
 
-    if len(valid_combinations) == 0:
-        # No possible changes
-        student_state.next = None
-        return
+        if len(valid_combinations) == 0:
+            # No possible changes
+            student_state.next = None
+            return
 
-    generate_states_in_path(student_state, valid_combinations)
+        generate_states_in_path(student_state, valid_combinations)
 
 
 def create_state(student_code: str, goal_code: str, canonicalize: bool) -> CodeState:
-    student_code_state = CodeState(tree=ast.parse(student_code))
-    goal_code_state = IntermediateState(tree=ast.parse(goal_code))
-    # Canonicalize
+    goal_code_state = create_goal_state(goal_code, canonicalize)
+    return create_student_state(student_code, goal_code_state, canonicalize)
+
+
+def create_goal_state(goal_code: str, canonicalize: bool) -> IntermediateState:
+    """Parse (and canonicalize) the goal code, this state can be shared by many student states"""
+    with stage("parse"):
+        goal_code_state = IntermediateState(tree=ast.parse(goal_code))
     if not canonicalize:
-        student_code_state.goal = goal_code_state
-        return student_code_state
-    # Student imports & names
-    student_imports = collect_attributes(student_code_state)
-    student_code_state = get_canonical_form(student_code_state, imports=student_imports)
-    # Goal imports & names
-    goal_imports = collect_attributes(goal_code_state)
-    goal_code_state = get_canonical_form(goal_code_state, imports=goal_imports)
+        return goal_code_state
+    with stage("canonicalize"):
+        # Goal imports & names
+        goal_imports = collect_attributes(goal_code_state)
+        return get_canonical_form(goal_code_state, imports=goal_imports)
+
+
+def create_student_state(student_code: str, goal_code_state: State, canonicalize: bool) -> CodeState:
+    with stage("parse"):
+        student_code_state = CodeState(tree=ast.parse(student_code))
+    # Canonicalize
+    if canonicalize:
+        with stage("canonicalize"):
+            # Student imports & names
+            student_imports = collect_attributes(student_code_state)
+            student_code_state = get_canonical_form(student_code_state, imports=student_imports)
     student_code_state.goal = goal_code_state
     return student_code_state
 
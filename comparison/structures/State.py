@@ -19,6 +19,7 @@ class State:
     fun = None
     loadedFun = None
     tree = None
+    node_index = None  # node_index[i] is the node of tree with global_id node_index[0].global_id + i
     anonymized_code = None
 
     count = 0
@@ -76,6 +77,8 @@ class CanonicalState(State):
 class CodeState(State):
     anonymized_code = None
     next: State = None
+    search_complete = True  # False when a budget or the deadline cut the search for the next state short
+    search_estimated = False  # True when the search skipped a subset on its estimated desirability alone
     original_ast: ast = None
     goal: State = None  # the eventual goal state for this student
     distance_to_goal: int = -1
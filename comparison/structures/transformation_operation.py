@@ -1,8 +1,10 @@
 import ast
+import copy
 
-from comparison.utils.astTools import compare_trees, deepcopy, cmp
+from comparison.utils import profiling
+from comparison.utils.astTools import compare_trees, deepcopy, cmp, clear_subtree_properties
 from comparison.utils.display import print_function
-from comparison.utils.tools import log
+from comparison.utils.tools import log, log_enabled
 
 
 def create_map_dict(map_dict, tree_spot):
@@ -20,6 +22,43 @@ def create_map_dict(map_dict, tree_spot):
         map_dict[i] = {}
 
 
+def shallow_copy_once(node, copied):
+    """Shallow copy a node or list, unless it is already one of the copies in copied"""
+    if id(node) in copied:
+        return node
+    if type(node) is list:
+        node_copy = list(node)
+    elif isinstance(node, ast.AST):
+        node_copy = copy.copy(node)
+        clear_subtree_properties(node_copy)
+    else:
+        return node
+    copied.add(id(node_copy))
+    return node_copy
+
+
+def copy_along_path(tree, path, copied=None):
+    """Copy only the nodes (and lists) on the way down the path to the tree spot, every other subtree is shared
+    with the original tree. Applying a change to the copy then costs O(depth) instead of O(tree size).
+    Pass the same copied set for several paths into one tree, so they share their copied prefix."""
+    if copied is None:
+        copied = set()
+    tree = shallow_copy_once(tree, copied)
+    tree_spot = tree
+    for i in range(len(path) - 1, 0, -1):
+        move = path[i]
+        if type(move) is tuple and isinstance(tree_spot, ast.AST) and hasattr(tree_spot, move[0]):
+            child = shallow_copy_once(getattr(tree_spot, move[0]), copied)
+            setattr(tree_spot, move[0], child)
+        elif type(move) is int and type(tree_spot) is list and 0 <= move < len(tree_spot):
+            child = shallow_copy_once(tree_spot[move], copied)
+            tree_spot[move] = child
+        else:
+            break  # traverse_tree will report the broken path
+        tree_spot = child
+    return tree
+
+
 class ChangeOperation:
     start = None
     path = None
@@ -107,29 +146,34 @@ class ChangeOperation:
                 if hasattr(tree_spot, move[0]):
                     tree_spot = getattr(tree_spot, move[0])
                 else:
-                    log("Change Vector\ttraverseTree\t\tMissing attr: " + str(move[0]) + "\n" + print_function(tree),
-                        "bug")
+                    if log_enabled("bug"):
+                        log("Change Vector\ttraverseTree\t\tMissing attr: " + str(move[0]) + "\n" +
+                            print_function(tree), "bug")
                     return -99
             elif type(move) is int:
                 if type(tree_spot) is list:
                     if 0 <= move < len(tree_spot):
                         tree_spot = tree_spot[move]
                     else:
-                        log("Change Vector\ttraverseTree\t\tMissing position: " + str(move) + "," + str(
-                            tree_spot) + "\n" + print_function(tree), "bug")
+                        if log_enabled("bug"):
+                            log("Change Vector\ttraverseTree\t\tMissing position: " + str(move) + "," + str(
+                                tree_spot) + "\n" + print_function(tree), "bug")
                         return -99
                 else:
-                    log("Change Vector\ttraverseTree\t\tNot a list: " + str(tree_spot) + "\n" + print_function(tree),
-                        "bug")
+                    if log_enabled("bug"):
+                        log("Change Vector\ttraverseTree\t\tNot a list: " + str(tree_spot) + "\n" +
+                            print_function(tree), "bug")
                     return -99
 
             else:  # wat?
-                log("Change Vector\ttraverseTree\t\tBad Path: " + str(move) + "\n" + print_function(tree), "bug")
+                if log_enabled("bug"):
+                    log("Change Vector\ttraverseTree\t\tBad Path: " + str(move) + "\n" + print_function(tree), "bug")
                 return -99
         return tree_spot
 
     def apply_change(self, caller=None):
-        tree = deepcopy(self.start)
+        profiling.count("apply_change")
+        tree = copy_along_path(self.start, self.path)
         tree_spot = self.traverse_tree(tree)
         if tree_spot == -99:
             return None
@@ -145,8 +189,9 @@ class ChangeOperation:
                 if hasattr(old_spot, "col_offset"):
                     self.new_subtree.col_offset = old_spot.col_offset
             if compare_trees(old_spot, self.old_subtree, check_equality=True) != 0:
-                log("ChangeVector\tapplyChange\t" + str(caller) + "\t" + "Change old values don't match: " + str(
-                    self) + "\n" + str(print_function(self.start)), "bug")
+                if log_enabled("bug"):
+                    log("ChangeVector\tapplyChange\t" + str(caller) + "\t" + "Change old values don't match: " + str(
+                        self) + "\n" + str(print_function(self.start)), "bug")
             setattr(tree_spot, location[0], self.new_subtree)
             # SPECIAL CASE. If we're changing the variable name, get rid of metadata
             if type(tree_spot) is ast.Name and location[0] == "id":
@@ -172,8 +217,9 @@ class ChangeOperation:
                     self.new_subtree.col_offset = tree_spot[location].col_offset
                 tree_spot[location] = self.new_subtree
             else:
-                log("ChangeVector\tapplyChange\tDoesn't fit in list: " + str(location) + "\n" + print_function(
-                    self.start), "bug")
+                if log_enabled("bug"):
+                    log("ChangeVector\tapplyChange\tDoesn't fit in list: " + str(location) + "\n" + print_function(
+                        self.start), "bug")
         else:
             log("ChangeVector\tapplyChange\t\tBroken at: " + str(location), "bug")
         return tree
@@ -258,7 +304,8 @@ class AddOperation(ChangeOperation):
         return c
 
     def apply_change(self, caller=None):
-        tree = deepcopy(self.start)
+        profiling.count("apply_change")
+        tree = copy_along_path(self.start, self.path)
         tree_spot = self.traverse_tree(tree)
         if tree_spot == -99:
             return None
@@ -332,7 +379,8 @@ class DeleteOperation(ChangeOperation):
         return c
 
     def apply_change(self, caller=None):
-        tree = deepcopy(self.start)
+        profiling.count("apply_change")
+        tree = copy_along_path(self.start, self.path)
         tree_spot = self.traverse_tree(tree)
         if tree_spot == -99:
             return None
@@ -403,7 +451,13 @@ class SwapOperation(ChangeOperation):
         return c
 
     def apply_change(self, caller=None):
-        tree = deepcopy(self.start)
+        profiling.count("apply_change")
+        if self.old_path is None:
+            tree = copy_along_path(self.start, self.path)
+        else:
+            copied = set()
+            tree = copy_along_path(self.start, self.old_path, copied)
+            tree = copy_along_path(tree, self.new_path, copied)
 
         if self.old_path is None:
             tree_spot = self.traverse_tree(tree)
@@ -486,10 +540,10 @@ class SwapOperation(ChangeOperation):
                     self.new_subtree < len(tree_spot):
                 return tree_spot[self.old_subtree], tree_spot[self.new_subtree]
             else:
-                log("SwapVector\tgetSwaps\tBroken: \n" + print_function(tree_spot, 0) + "," + print_function(
-                    self.old_subtree, 0) + "," + print_function(self.new_subtree, 0) + "\n" + print_function(self.start,
-                                                                                                             0),
-                    "bug")
+                if log_enabled("bug"):
+                    log("SwapVector\tgetSwaps\tBroken: \n" + print_function(tree_spot, 0) + "," + print_function(
+                        self.old_subtree, 0) + "," + print_function(self.new_subtree, 0) + "\n" + print_function(
+                        self.start, 0), "bug")
         else:
             old_tree_spot = self.traverse_tree(self.start, path=self.old_path)
             new_tree_spot = self.traverse_tree(self.start, path=self.new_path)
@@ -542,7 +596,8 @@ class MoveOperation(ChangeOperation):
         return c
 
     def apply_change(self, caller=None):
-        tree = deepcopy(self.start)
+        profiling.count("apply_change")
+        tree = copy_along_path(self.start, self.path)
         tree_spot = self.traverse_tree(tree)
         if tree_spot == -99:
             return None
@@ -580,7 +635,8 @@ class MoveOperation(ChangeOperation):
             while (map_dict["len"] < next_pos) and (next_pos in map_dict["moved"] or next_pos not in map_dict["pos"]):
                 next_pos += 1
             if next_pos >= map_dict["len"]:
-                log("ChangeVector\tMoveVector\tupdate\tBad Position!! " + str(self) + ";" + str(map_dict), "bug")
+                if log_enabled("bug"):
+                    log("ChangeVector\tMoveVector\tupdate\tBad Position!! " + str(self) + ";" + str(map_dict), "bug")
             else:
                 self.new_subtree = next_pos
         else:
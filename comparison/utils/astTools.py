@@ -1,7 +1,9 @@
 import copy
+import hashlib
 import pickle
 
 from comparison.structures.namesets import *
+from comparison.utils import profiling
 from comparison.utils.display import *
 from comparison.utils.tools import *
 
@@ -58,10 +60,12 @@ def imported_name(id, importList):
                             if id == name.name:
                                 return True
                 else:
-                    log("astTools\timportedName\tUnsupported library: " + print_function(imp), "bug")
+                    if log_enabled("bug"):
+                        log("astTools\timportedName\tUnsupported library: " + print_function(imp), "bug")
 
             else:
-                log("astTools\timportedName\tWhy no module? " + print_function(imp), "bug")
+                if log_enabled("bug"):
+                    log("astTools\timportedName\tWhy no module? " + print_function(imp), "bug")
     return False
 
 
@@ -191,8 +195,9 @@ def gather_all_variables(node, keep_orig=True):
                         all_ids.remove(existing)
                         all_ids.add((current_id, orig_name))
                     elif orig_name is not None:
-                        log(f"astTools\\gatherAllVariables\\tConflicting originalIds? {existing[0]} : {existing[1]} , {orig_name}\n{print_function(node)}",
-                            "bug")
+                        if log_enabled("bug"):
+                            log(f"astTools\\gatherAllVariables\\tConflicting originalIds? {existing[0]} : {existing[1]} , {orig_name}\n{print_function(node)}",
+                                "bug")
                 else:
                     all_ids.add((current_id, orig_name))
     return all_ids
@@ -822,19 +827,199 @@ def eventual_type(node):
 
 
 def depth_of_ast(node):
-    """Determine the depth of the AST"""
+    """Determine the depth of the AST, cached on each node as treeDepth"""
     if not isinstance(node, ast.AST):
         return 0
+    if "treeDepth" in node.__dict__:
+        return node.treeDepth
     current_deepest = 0
     for child in ast.iter_child_nodes(node):
         candidate_node_depth = depth_of_ast(child)
         if candidate_node_depth > current_deepest:
             current_deepest = candidate_node_depth
-    return current_deepest + 1
+    node.treeDepth = current_deepest + 1
+    return node.treeDepth
+
+
+# Cached values that describe a node's whole subtree, they have to be dropped when the subtree changes in place
+subtree_properties = ["treeWeight", "treeWeightNoTokens", "treeDepth", "structuralHash"]
+
+# Expression contexts are interchangeable when comparing trees
+context_types = (ast.Load, ast.Store, ast.Del, ast.AugLoad, ast.AugStore, ast.Param)
+
+# The order of node types when comparing nodes of different types
+ordered_types = [ast.Module, ast.Interactive, ast.Expression, ast.Suite,
+                 ast.Break, ast.Continue, ast.Pass, ast.Global,
+                 ast.Expr, ast.Assign, ast.AugAssign, ast.Return,
+                 ast.Assert, ast.Delete, ast.If, ast.For, ast.While,
+                 ast.With, ast.Import, ast.ImportFrom, ast.Raise,
+                 ast.Try, ast.FunctionDef, ast.ClassDef,
+                 ast.BinOp, ast.BoolOp, ast.Compare, ast.UnaryOp,
+                 ast.DictComp, ast.ListComp, ast.SetComp, ast.GeneratorExp,
+                 ast.Yield, ast.Lambda, ast.IfExp, ast.Call, ast.Subscript,
+                 ast.Attribute, ast.Dict, ast.List, ast.Tuple,
+                 ast.Set, ast.Name, ast.Str, ast.Bytes, ast.Num,
+                 ast.NameConstant, ast.Starred, ast.Constant,
+                 ast.Ellipsis, ast.Index, ast.Slice, ast.ExtSlice,
+                 ast.And, ast.Or, ast.Add, ast.Sub, ast.Mult, ast.Div,
+                 ast.Mod, ast.Pow, ast.LShift, ast.RShift, ast.BitOr,
+                 ast.BitXor, ast.BitAnd, ast.FloorDiv, ast.Invert, ast.Not,
+                 ast.UAdd, ast.USub, ast.Eq, ast.NotEq, ast.Lt, ast.LtE,
+                 ast.Gt, ast.GtE, ast.Is, ast.IsNot, ast.In, ast.NotIn,
+                 ast.alias, ast.keyword, ast.arguments, ast.arg, ast.comprehension,
+                 ast.ExceptHandler, ast.withitem, ast.JoinedStr, ast.FormattedValue]
+
+# Nodes of these types are equal whenever their types are
+leaf_types = (ast.And, ast.Or, ast.Add, ast.Sub, ast.Mult, ast.Div,
+              ast.Mod, ast.Pow, ast.LShift, ast.RShift, ast.BitOr,
+              ast.BitXor, ast.BitAnd, ast.FloorDiv, ast.Invert,
+              ast.Not, ast.UAdd, ast.USub, ast.Eq, ast.NotEq, ast.Lt,
+              ast.LtE, ast.Gt, ast.GtE, ast.Is, ast.IsNot, ast.In,
+              ast.NotIn, ast.Load, ast.Store, ast.Del, ast.AugLoad,
+              ast.AugStore, ast.Param, ast.Ellipsis, ast.Pass,
+              ast.Break, ast.Continue)
+
+# The fields that are compared for each node type
+attr_map = {
+    ast.Module: ["body"], ast.Interactive: ["body"], ast.Expression: ["body"], ast.Suite: ["body"],
+    ast.FunctionDef: ["name", "args", "body", "decorator_list", "returns"],
+    ast.ClassDef: ["name", "bases", "keywords", "body", "decorator_list"],
+    ast.Return: ["value"], ast.Delete: ["targets"], ast.Assign: ["targets", "value"],
+    ast.AugAssign: ["target", "op", "value"], ast.For: ["target", "iter", "body", "orelse"],
+    ast.While: ["test", "body", "orelse"], ast.If: ["test", "body", "orelse"],
+    ast.With: ["items", "body"], ast.Raise: ["exc", "cause"], ast.Try: ["body", "handlers", "orelse", "finalbody"],
+    ast.Assert: ["test", "msg"], ast.Import: ["names"], ast.ImportFrom: ["module", "names", "level"],
+    ast.Global: ["names"], ast.Expr: ["value"], ast.BoolOp: ["op", "values"], ast.BinOp: ["left", "op", "right"],
+    ast.UnaryOp: ["op", "operand"], ast.Lambda: ["args", "body"], ast.IfExp: ["test", "body", "orelse"],
+    ast.Dict: ["keys", "values"], ast.Set: ["elts"], ast.ListComp: ["elt", "generators"],
+    ast.SetComp: ["elt", "generators"], ast.DictComp: ["key", "value", "generators"],
+    ast.GeneratorExp: ["elt", "generators"], ast.Yield: ["value"], ast.Compare: ["left", "ops", "comparators"],
+    ast.Call: ["func", "args", "keywords"], ast.Num: ["n"], ast.Str: ["s"], ast.Bytes: ["s"],
+    ast.NameConstant: ["value"], ast.Constant: ["value"], ast.Attribute: ["value", "attr"],
+    ast.Subscript: ["value", "slice"], ast.List: ["elts"], ast.Tuple: ["elts"], ast.Starred: ["value"],
+    ast.Slice: ["lower", "upper", "step"], ast.ExtSlice: ["dims"], ast.Index: ["value"],
+    ast.comprehension: ["target", "iter", "ifs"], ast.ExceptHandler: ["type", "name", "body"],
+    ast.arguments: ["posonlyargs", "args", "vararg", "kwonlyargs", "kw_defaults", "kwarg", "defaults"],
+    ast.arg: ["arg", "annotation"], ast.keyword: ["arg", "value"], ast.alias: ["name", "asname"],
+    ast.withitem: ["context_expr", "optional_vars"], ast.JoinedStr: ["values"], ast.FormattedValue: ["value"],
+}
+
+
+def clear_subtree_properties(node):
+    """Drop the cached subtree values from a single node"""
+    for prop in subtree_properties:
+        if prop in node.__dict__:
+            delattr(node, prop)
+
+
+def stable_hash(s):
+    """A 64 bit hash of a string that is the same in every process, unlike hash() it survives pickling"""
+    return stable_bytes_hash(s.encode("utf-8", "surrogatepass"))
+
+
+def stable_bytes_hash(b):
+    return int.from_bytes(hashlib.blake2b(b, digest_size=8).digest(), "little")
+
+
+type_hashes = {}
+
+
+def type_hash(node_type):
+    if node_type not in type_hashes:
+        type_hashes[node_type] = stable_hash(node_type.__name__)
+    return type_hashes[node_type]
+
+
+def value_hash(value):
+    """Hash a primitive field, None if compare_trees can't tell it apart from other values by hashing"""
+    value_type = type(value)
+    if value is None or value is Ellipsis:
+        return type_hash(value_type)
+    if value_type is str:
+        return hash((type_hash(str), stable_hash(value)))
+    if value_type is bytes:
+        return hash((type_hash(bytes), stable_bytes_hash(value)))
+    if value_type is int or value_type is bool:
+        # hash() of an int is only taken mod 2**61 - 1, and hash(-1) == hash(-2)
+        return hash((type_hash(value_type), stable_hash(repr(value))))
+    if value_type is float:
+        # NaN is neither above nor below any float, so compare_trees finds it equal to all of them.
+        # Adding 0.0 turns -0.0, which compares equal to 0.0, into 0.0
+        return hash((type_hash(float), stable_hash(repr(value + 0.0)))) if value == value else None
+    if value_type is complex:
+        # Complex numbers are only compared by their real part
+        return hash((type_hash(complex), stable_hash(repr(value.real + 0.0)))) if value.real == value.real else None
+    return None
+
+
+hash_rules = {}
+
+
+def hash_rule(node_type):
+    """How structural_hash treats a node type: a fixed hash, "name", the fields to hash, or None if it can't"""
+    if node_type not in hash_rules:
+        if issubclass(node_type, context_types):
+            rule = type_hash(ast.Load)
+        elif node_type not in ordered_types:
+            # compare_trees treats unknown types as equal to anything
+            rule = None
+        elif issubclass(node_type, ast.Name):
+            rule = "name"
+        elif issubclass(node_type, leaf_types):
+            rule = type_hash(node_type)
+        elif node_type in attr_map:
+            rule = tuple(attr_map[node_type])
+        else:
+            rule = None
+        hash_rules[node_type] = rule
+    return hash_rules[node_type]
+
+
+def structural_hash(node):
+    """A Merkle style hash of the subtree, trees that compare_trees finds equal always hash the same.
+    The hash is cached on each node as structuralHash. None means the subtree holds something
+    the hash can't speak for, so it must be compared in full."""
+    if type(node) is list:
+        child_hashes = [structural_hash(child) for child in node]
+        if None in child_hashes:
+            return None
+        return hash((len(child_hashes), *child_hashes))
+    if not isinstance(node, ast.AST):
+        return value_hash(node)
+    if "structuralHash" in node.__dict__:
+        return node.structuralHash
+
+    node_type = type(node)
+    rule = hash_rule(node_type)
+    if type(rule) is tuple:
+        field_hashes = [type_hash(node_type)]
+        for attr in rule:
+            field_hashes.append(structural_hash(getattr(node, attr, None)))
+        result = None if None in field_hashes else hash(tuple(field_hashes))
+    elif rule == "name":
+        result = hash((type_hash(node_type), stable_hash(node.id)))
+    else:
+        result = rule
+    node.structuralHash = result
+    return result
 
 
 def compare_trees(node_a, node_b, check_equality=False):
     """A comparison function for ASTs"""
+    profiling.count("compare_trees")
+    if check_equality and isinstance(node_a, ast.AST) and isinstance(node_b, ast.AST):
+        # Different hashes settle inequality right away, equal ones still need the walk in case of a collision
+        hash_a, hash_b = structural_hash(node_a), structural_hash(node_b)
+        if hash_a is not None and hash_b is not None:
+            if hash_a != hash_b:
+                return -1 if hash_a < hash_b else 1
+            if node_a is node_b:
+                return 0
+    return compare_trees_fully(node_a, node_b, check_equality)
+
+
+def compare_trees_fully(node_a, node_b, check_equality=False):
+    """Compare two ASTs field by field, without any shortcuts"""
     if node_a == node_b is None:
         return 0
     elif node_a is None or node_b is None:
@@ -844,7 +1029,7 @@ def compare_trees(node_a, node_b, check_equality=False):
         if len(node_a) != len(node_b):
             return len(node_a) - len(node_b)
         for i in range(len(node_a)):
-            result = compare_trees(node_a[i], node_b[i], check_equality=check_equality)
+            result = compare_trees_fully(node_a[i], node_b[i], check_equality=check_equality)
             if result != 0:
                 return result
         return 0
@@ -860,38 +1045,18 @@ def compare_trees(node_a, node_b, check_equality=False):
         return -1 if isinstance(node_a, ast.AST) else 1
 
     if type(node_a) is not type(node_b):
-        important_types = [ast.Load, ast.Store, ast.Del, ast.AugLoad, ast.AugStore, ast.Param]
-        if type(node_a) in important_types and type(node_b) in important_types:
+        if type(node_a) in context_types and type(node_b) in context_types:
             return 0
-        elif type(node_a) in important_types or type(node_b) in important_types:
-            return -1 if type(node_a) in important_types else 1
+        elif type(node_a) in context_types or type(node_b) in context_types:
+            return -1 if type(node_a) in context_types else 1
 
-        types = [ast.Module, ast.Interactive, ast.Expression, ast.Suite,
-                 ast.Break, ast.Continue, ast.Pass, ast.Global,
-                 ast.Expr, ast.Assign, ast.AugAssign, ast.Return,
-                 ast.Assert, ast.Delete, ast.If, ast.For, ast.While,
-                 ast.With, ast.Import, ast.ImportFrom, ast.Raise,
-                 ast.Try, ast.FunctionDef, ast.ClassDef,
-                 ast.BinOp, ast.BoolOp, ast.Compare, ast.UnaryOp,
-                 ast.DictComp, ast.ListComp, ast.SetComp, ast.GeneratorExp,
-                 ast.Yield, ast.Lambda, ast.IfExp, ast.Call, ast.Subscript,
-                 ast.Attribute, ast.Dict, ast.List, ast.Tuple,
-                 ast.Set, ast.Name, ast.Str, ast.Bytes, ast.Num,
-                 ast.NameConstant, ast.Starred, ast.Constant,
-                 ast.Ellipsis, ast.Index, ast.Slice, ast.ExtSlice,
-                 ast.And, ast.Or, ast.Add, ast.Sub, ast.Mult, ast.Div,
-                 ast.Mod, ast.Pow, ast.LShift, ast.RShift, ast.BitOr,
-                 ast.BitXor, ast.BitAnd, ast.FloorDiv, ast.Invert, ast.Not,
-                 ast.UAdd, ast.USub, ast.Eq, ast.NotEq, ast.Lt, ast.LtE,
-                 ast.Gt, ast.GtE, ast.Is, ast.IsNot, ast.In, ast.NotIn,
-                 ast.alias, ast.keyword, ast.arguments, ast.arg, ast.comprehension,
-                 ast.ExceptHandler, ast.withitem, ast.JoinedStr, ast.FormattedValue]
-        if type(node_a) not in types or type(node_b) not in types:
+        if type(node_a) not in ordered_types or type(node_b) not in ordered_types:
             log("astTools\tcompareASTs\tmissing type:" + str(type(node_a)) + "," + str(type(node_b)), "bug")
             return 0
-        return types.index(type(node_a)) - types.index(type(node_b))
+        return ordered_types.index(type(node_a)) - ordered_types.index(type(node_b))
 
     if not check_equality:
+        # Depths are cached on the nodes, so this doesn't walk the subtrees again at every level
         depth_a = depth_of_ast(node_a)
         depth_b = depth_of_ast(node_b)
         if depth_a != depth_b:
@@ -903,7 +1068,7 @@ def compare_trees(node_a, node_b, check_equality=False):
                 return -1 if type(node_a.value).__name__ < type(node_b.value).__name__ else 1
             else:
                 if isinstance(node_a.value, ast.Constant) and isinstance(node_b.value, ast.Constant):
-                    return compare_trees(node_a.value, node_b.value, check_equality=check_equality)
+                    return compare_trees_fully(node_a.value, node_b.value, check_equality=check_equality)
         else:
             return 0
 
@@ -917,42 +1082,11 @@ def compare_trees(node_a, node_b, check_equality=False):
     if isinstance(node_a, ast.Name):
         return cmp(node_a.id, node_b.id)
 
-    if isinstance(node_a, (ast.And, ast.Or, ast.Add, ast.Sub, ast.Mult, ast.Div,
-                           ast.Mod, ast.Pow, ast.LShift, ast.RShift, ast.BitOr,
-                           ast.BitXor, ast.BitAnd, ast.FloorDiv, ast.Invert,
-                           ast.Not, ast.UAdd, ast.USub, ast.Eq, ast.NotEq, ast.Lt,
-                           ast.LtE, ast.Gt, ast.GtE, ast.Is, ast.IsNot, ast.In,
-                           ast.NotIn, ast.Load, ast.Store, ast.Del, ast.AugLoad,
-                           ast.AugStore, ast.Param, ast.Ellipsis, ast.Pass,
-                           ast.Break, ast.Continue)):
+    if isinstance(node_a, leaf_types):
         return 0
 
-    attr_map = {
-        ast.Module: ["body"], ast.Interactive: ["body"], ast.Expression: ["body"], ast.Suite: ["body"],
-        ast.FunctionDef: ["name", "args", "body", "decorator_list", "returns"],
-        ast.ClassDef: ["name", "bases", "keywords", "body", "decorator_list"],
-        ast.Return: ["value"], ast.Delete: ["targets"], ast.Assign: ["targets", "value"],
-        ast.AugAssign: ["target", "op", "value"], ast.For: ["target", "iter", "body", "orelse"],
-        ast.While: ["test", "body", "orelse"], ast.If: ["test", "body", "orelse"],
-        ast.With: ["items", "body"], ast.Raise: ["exc", "cause"], ast.Try: ["body", "handlers", "orelse", "finalbody"],
-        ast.Assert: ["test", "msg"], ast.Import: ["names"], ast.ImportFrom: ["module", "names", "level"],
-        ast.Global: ["names"], ast.Expr: ["value"], ast.BoolOp: ["op", "values"], ast.BinOp: ["left", "op", "right"],
-        ast.UnaryOp: ["op", "operand"], ast.Lambda: ["args", "body"], ast.IfExp: ["test", "body", "orelse"],
-        ast.Dict: ["keys", "values"], ast.Set: ["elts"], ast.ListComp: ["elt", "generators"],
-        ast.SetComp: ["elt", "generators"], ast.DictComp: ["key", "value", "generators"],
-        ast.GeneratorExp: ["elt", "generators"], ast.Yield: ["value"], ast.Compare: ["left", "ops", "comparators"],
-        ast.Call: ["func", "args", "keywords"], ast.Num: ["n"], ast.Str: ["s"], ast.Bytes: ["s"],
-        ast.NameConstant: ["value"], ast.Constant: ["value"], ast.Attribute: ["value", "attr"],
-        ast.Subscript: ["value", "slice"], ast.List: ["elts"], ast.Tuple: ["elts"], ast.Starred: ["value"],
-        ast.Slice: ["lower", "upper", "step"], ast.ExtSlice: ["dims"], ast.Index: ["value"],
-        ast.comprehension: ["target", "iter", "ifs"], ast.ExceptHandler: ["type", "name", "body"],
-        ast.arguments: ["posonlyargs", "args", "vararg", "kwonlyargs", "kw_defaults", "kwarg", "defaults"],
-        ast.arg: ["arg", "annotation"], ast.keyword: ["arg", "value"], ast.alias: ["name", "asname"],
-        ast.withitem: ["context_expr", "optional_vars"], ast.JoinedStr: ["values"], ast.FormattedValue: ["value"],
-    }
-
     for attr in attr_map[type(node_a)]:
-        result = compare_trees(getattr(node_a, attr), getattr(node_b, attr), check_equality=check_equality)
+        result = compare_trees_fully(getattr(node_a, attr), getattr(node_b, attr), check_equality=check_equality)
         if result != 0:
             return result
 
@@ -977,6 +1111,7 @@ def deepcopy_list(target_list):
 
 def deepcopy(node):
     """Let's try to keep this as quick as possible"""
+    profiling.count("deepcopy")
     if node is None:
         return None
     if isinstance(node, list):
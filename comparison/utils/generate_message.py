@@ -1,3 +1,5 @@
+import copy
+
 from comparison.structures.State import State
 from comparison.structures.transformation_operation import *
 from comparison.utils.astTools import *
@@ -1787,7 +1789,8 @@ def formatHints(edit, hintLevel):
                 + context
         )
 
-        tmp = cv.deepcopy()
+        # Only start gets replaced and apply_change doesn't modify the vector, so a shallow copy is enough
+        tmp = copy.copy(cv)
         tmp.start = startTree
         t = tmp.apply_change()
         tmpS = State()
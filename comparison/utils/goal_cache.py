@@ -0,0 +1,90 @@
+"""An on-disk cache of prepared goal states, so the goal code of an exercise is only canonicalized once.
+Entries are pickles, and unpickling runs whatever code the file asks for, so the cache directory must only be
+writable by the users running the hints."""
+import hashlib
+import os
+import pickle
+import sys
+
+from comparison.canonicalize.canon import canonical_form_version
+from comparison.utils.normalize import normalizer_version
+from comparison.utils.tools import log
+
+cache_suffix = ".goal"
+# Pickled ast nodes only load on the interpreter version that pickled them
+python_version = sys.implementation.cache_tag
+
+
+def dump_state(path: str, state) -> None:
+    """Pickle state to path, replacing the file in one step so readers never see half of it"""
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as file:
+        pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, path)
+
+
+def load_state(path: str):
+    """Unpickle the state at path, only call this on files from a trusted directory"""
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
+class GoalCache:
+    """Prepared goal states pickled into a directory, one file per goal.
+    Each file is named after the hash of the goal's source, the canonicalizer version, the normalizer version and
+    the Python version, so a change to any of them misses the old entries. Reading a file marks it as recently
+    used, and the least recently used files are evicted once the directory grows past max_bytes."""
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, source: str, canonicalize: bool) -> str:
+        versions = f"{canonical_form_version}\0{normalizer_version()}\0{python_version}\0{canonicalize}\0"
+        return hashlib.sha256((versions + source).encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + cache_suffix)
+
+    def get(self, key: str):
+        """The goal state stored under key, or None on a miss"""
+        path = self.path(key)
+        try:
+            state = load_state(path)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:  # a truncated or outdated file, drop it
+            log(f"Dropping unreadable goal cache entry {path}: {e!r}", "bug")
+            self.remove(path)
+            return None
+        return state
+
+    def put(self, key: str, state) -> None:
+        dump_state(self.path(key), state)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(cache_suffix):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+    @staticmethod
+    def remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
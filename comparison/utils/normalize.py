@@ -0,0 +1,97 @@
+"""Formatting of code before it is parsed, so that the line and column numbers in hints are consistent"""
+import hashlib
+import io
+import tokenize
+from collections import OrderedDict
+
+normalize_modes = ["none", "fast", "autopep8"]
+# autopep8 is the default because hints point at lines and columns of the formatted code
+normalize_mode = "autopep8"
+memo_size = 1024
+# Normalized code by (mode, hash of the input), the most recently used last
+normalized_memo: OrderedDict = OrderedDict()
+indent_unit = "    "
+
+
+def set_normalize_mode(mode: str):
+    global normalize_mode
+    if mode not in normalize_modes:
+        raise ValueError(f"Unknown normalize mode {mode}, expected one of {', '.join(normalize_modes)}")
+    normalize_mode = mode
+
+
+def normalizer_version(mode: str = None) -> str:
+    """Identifies what the mode's output looks like, for caches of work done on normalized code"""
+    mode = mode or normalize_mode
+    if mode == "autopep8":
+        import autopep8
+        return f"autopep8-{autopep8.__version__}"
+    return f"{mode}-1"
+
+
+def autopep8_normalize(code: str) -> str:
+    import autopep8
+    return autopep8.fix_code(code)
+
+
+def fast_normalize(code: str) -> str:
+    """Re-indent every statement by four spaces per block and strip trailing whitespace.
+    Code that does not tokenize is returned as it is, parsing it reports the error."""
+    lines = code.split("\n")  # the same lines tokenize reads
+    depth = 0
+    statement_start = True
+    # Lines inside a string token spanning several lines must be left alone, and the line it starts on keeps its end
+    string_lines = set()
+    string_start_lines = set()
+    new_indents = {}
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type == tokenize.INDENT:
+                depth += 1
+            elif token.type == tokenize.DEDENT:
+                depth -= 1
+            elif token.type in (tokenize.NEWLINE, tokenize.NL):
+                statement_start = statement_start or token.type == tokenize.NEWLINE
+            elif token.type not in (tokenize.COMMENT, tokenize.ENDMARKER):
+                if statement_start:
+                    new_indents[token.start[0]] = indent_unit * depth
+                    statement_start = False
+                if token.start[0] != token.end[0]:
+                    string_start_lines.add(token.start[0])
+                    string_lines.update(range(token.start[0] + 1, token.end[0] + 1))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return code
+    normalized = []
+    for number, line in enumerate(lines, start=1):
+        if number in string_lines:
+            normalized.append(line)
+        elif number in string_start_lines:
+            normalized.append(new_indents[number] + line.lstrip() if number in new_indents else line)
+        elif number in new_indents:
+            normalized.append(new_indents[number] + line.strip())
+        else:
+            normalized.append(line.rstrip())
+    while normalized and not normalized[-1]:
+        normalized.pop()
+    return "\n".join(normalized) + "\n"
+
+
+normalizers = {
+    "none": lambda code: code,
+    "fast": fast_normalize,
+    "autopep8": autopep8_normalize,
+}
+
+
+def normalize(code: str, mode: str = None) -> str:
+    """Format code with the given mode, or the current normalize_mode. Results are memoized by content hash."""
+    mode = mode or normalize_mode
+    key = (mode, hashlib.blake2b(code.encode("utf-8"), digest_size=16).digest())
+    if key in normalized_memo:
+        normalized_memo.move_to_end(key)
+        return normalized_memo[key]
+    normalized = normalizers[mode](code)
+    normalized_memo[key] = normalized
+    if len(normalized_memo) > memo_size:
+        normalized_memo.popitem(last=False)
+    return normalized
@@ -0,0 +1,99 @@
+"""Opt-in instrumentation of the hint pipeline: wall time per stage, counts of hot calls and peak memory.
+Nothing is recorded unless a profile is active, so the hooks cost a global lookup the rest of the time."""
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# The profile that stages and counts are recorded in, None when not profiling
+active_profile: Optional["Profile"] = None
+
+
+class Profile:
+    def __init__(self):
+        self.stages = {}  # seconds and calls of each stage, in the order they first started
+        self.nested_seconds = []  # for each stage running, the seconds spent in the stages nested in it
+        self.counts = {}
+        self.total_seconds = 0.0
+        self.peak_memory_bytes: Optional[int] = None
+
+    def start_stage(self, name: str):
+        if name not in self.stages:
+            self.stages[name] = {"seconds": 0.0, "calls": 0}
+        self.nested_seconds.append(0.0)
+
+    def add_time(self, name: str, seconds: float):
+        if name not in self.stages:
+            self.stages[name] = {"seconds": 0.0, "calls": 0}
+        self.stages[name]["seconds"] += seconds
+        self.stages[name]["calls"] += 1
+
+    def report(self) -> dict:
+        return {
+            "total_seconds": self.total_seconds,
+            "stages": {name: dict(stage_time) for name, stage_time in self.stages.items()},
+            "counts": dict(self.counts),
+            "peak_memory_bytes": self.peak_memory_bytes,
+        }
+
+
+@contextmanager
+def profiling(trace_memory: bool = True):
+    """Profile everything run inside the block, the profile is yielded and filled in when the block exits.
+    Tracing memory makes every allocation slower, so stage times are inflated when it is on."""
+    global active_profile
+    import tracemalloc
+    previous_profile = active_profile
+    profile = active_profile = Profile()
+    tracing = trace_memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        profile.total_seconds = time.perf_counter() - start
+        if tracing:
+            profile.peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        active_profile = previous_profile
+
+
+@contextmanager
+def stage(name: str):
+    """Time the block as a stage of the active profile. The time of a stage nested in another is only counted
+    in the inner stage, so stage times never overlap."""
+    profile = active_profile
+    if profile is None:
+        yield
+        return
+    profile.start_stage(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        nested_seconds = profile.nested_seconds.pop()
+        if profile.nested_seconds:
+            profile.nested_seconds[-1] += seconds
+        profile.add_time(name, seconds - nested_seconds)
+
+
+def count(name: str, amount: int = 1):
+    profile = active_profile
+    if profile is not None:
+        profile.counts[name] = profile.counts.get(name, 0) + amount
+
+
+def format_report(report: dict) -> str:
+    """A plain text table of a profile report"""
+    total = report["total_seconds"]
+    lines = [f"{'stage':<14}{'calls':>7}{'ms':>11}{'%':>7}"]
+    for name, stage_time in report["stages"].items():
+        share = 100 * stage_time["seconds"] / total if total else 0
+        lines.append(f"{name:<14}{stage_time['calls']:>7}{1000 * stage_time['seconds']:>11.2f}{share:>7.1f}")
+    lines.append(f"{'total':<14}{'':>7}{1000 * total:>11.2f}")
+    for name, amount in report["counts"].items():
+        lines.append(f"{name:<21}{amount:>11}")
+    if report["peak_memory_bytes"] is not None:
+        lines.append(f"{'peak memory':<21}{report['peak_memory_bytes'] / 1024:>9.0f}KB")
+    return "\n".join(lines)
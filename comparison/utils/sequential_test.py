@@ -0,0 +1,80 @@
+"""Deciding whether the average score of a batch of attempts reaches a threshold without scoring all of them"""
+import math
+from typing import NamedTuple, Optional
+
+
+class AttemptEvaluation(NamedTuple):
+    score: float  # the average score of the attempts that were consumed
+    accepted: bool  # whether the average reaches the threshold
+    consumed: int  # how many attempts were scored, out of the ones that could have been
+    settled_early: bool  # whether the decision was made before every attempt was scored
+
+
+class SequentialMean:
+    """A running mean of scores in [0, 1] that knows when its comparison to a threshold is settled.
+
+    It is settled for certain once the attempts that are left can no longer move the final mean of all total
+    attempts across the threshold. With a delta it is also settled once the Hoeffding bound puts the mean of the
+    distribution the scores are drawn from on one side of the threshold, with probability at least 1 - delta.
+    The bound is checked after every attempt, so delta is split over those looks by a union bound: delta / total
+    per look, or delta / (n (n + 1)) at the nth scored attempt when the total is unknown.
+    Attempts without a score (None) are left out of the mean, like syntax errors are."""
+
+    def __init__(self, threshold: float = 0.85, total: Optional[int] = None, delta: Optional[float] = None):
+        self.threshold = threshold
+        self.total = total
+        self.delta = delta
+        self.consumed = 0
+        self.scored = 0
+        self.sum = 0.0
+
+    def add(self, score: Optional[float]):
+        self.consumed += 1
+        if score is not None:
+            self.scored += 1
+            self.sum += score
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.scored if self.scored else 0
+
+    def final_bounds(self):
+        """The lowest and highest mean all total attempts can end up with"""
+        left = self.total - self.consumed
+        if self.scored + left == 0:
+            return 0, 0
+        # A missing score leaves the mean alone, so the extremes come from every attempt left scoring 0 or 1
+        return self.sum / (self.scored + left), max(self.mean, (self.sum + left) / (self.scored + left))
+
+    def hoeffding_radius(self) -> float:
+        if self.scored == 0:
+            return math.inf
+        if self.total is not None:
+            look_delta = self.delta / self.total
+        else:
+            look_delta = self.delta / (self.scored * (self.scored + 1))
+        return math.sqrt(math.log(2 / look_delta) / (2 * self.scored))
+
+    def decision(self) -> Optional[bool]:
+        """True to accept, False to reject, None while it is not settled yet"""
+        if self.total is not None:
+            lowest, highest = self.final_bounds()
+            if lowest >= self.threshold:
+                return True
+            if highest < self.threshold:
+                return False
+            if self.consumed >= self.total:
+                return self.mean >= self.threshold
+        if self.delta is not None:
+            radius = self.hoeffding_radius()
+            if self.mean - radius >= self.threshold:
+                return True
+            if self.mean + radius < self.threshold:
+                return False
+        return None
+
+    def evaluation(self) -> AttemptEvaluation:
+        decision = self.decision()
+        accepted = decision if decision is not None else self.mean >= self.threshold
+        settled_early = decision is not None and self.total is not None and self.consumed < self.total
+        return AttemptEvaluation(self.mean, accepted, self.consumed, settled_early)
@@ -1,22 +1,108 @@
 """This is a file of useful functions used throughout the hint generation program"""
+import atexit
 import os
+import queue
+import threading
 import time
 
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-LOG_PATH = os.path.join(project_root, "logs")
+# AST_HINT_LOG_DIR moves the logs out of the source tree, the test suite points it at a temporary directory
+LOG_PATH = os.environ.get("AST_HINT_LOG_DIR") or os.path.join(project_root, "logs")
+
+# The same numbers as the logging module, OFF disables logging altogether
+log_levels = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "CRITICAL": 50, "OFF": 100}
+# The level of messages by the log file they go to, messages to any other file are INFO
+category_levels = {"bug": log_levels["WARNING"], "canonicalize": log_levels["WARNING"]}
+log_threshold = log_levels["DEBUG"]
+
+
+def set_log_level(level: str):
+    global log_threshold
+    if level.upper() not in log_levels:
+        raise ValueError(f"Unknown log level {level}, expected one of {'|'.join(log_levels)}")
+    log_threshold = log_levels[level.upper()]
+
+
+class LogWriter:
+    """Appends queued messages to their log files from a background thread, so logging costs the caller a queue put.
+    Each log file stays open, and everything queued for it since the last write goes out in a single write."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.pid = None
+
+    def start(self):
+        # A forked process inherits the queue and the handles of its parent, but not the thread that writes them
+        self.queue = queue.SimpleQueue()
+        self.handles = {}
+        self.second, self.stamp = None, ""
+        self.pid = os.getpid()
+        threading.Thread(target=self.run, name="log-writer", daemon=True).start()
+
+    def put(self, filename: str, msg: str, newline: bool):
+        if self.pid != os.getpid():
+            self.start()
+        self.queue.put((filename, time.time(), msg, newline))
+
+    def flush(self, timeout: float = 5):
+        """Wait until everything queued so far is written"""
+        if self.pid == os.getpid():
+            written = threading.Event()
+            self.queue.put(written)
+            written.wait(timeout)
+
+    def run(self):
+        while True:
+            pending, written = {}, []
+            item = self.queue.get()
+            while True:
+                if isinstance(item, threading.Event):
+                    written.append(item)
+                else:
+                    filename, timestamp, msg, newline = item
+                    pending.setdefault(filename, []).append(self.format(timestamp, msg, newline))
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            for filename, entries in pending.items():
+                self.write(filename, "".join(entries))
+            for event in written:
+                event.set()
+
+    def format(self, timestamp: float, msg: str, newline: bool) -> str:
+        if not newline:
+            return msg
+        if int(timestamp) != self.second:
+            self.second = int(timestamp)
+            self.stamp = time.strftime("%d %b %Y %H:%M:%S", time.localtime(timestamp))
+        return self.stamp + "\t" + msg + "\n"
+
+    def write(self, filename: str, text: str):
+        try:
+            if filename not in self.handles:
+                # Unbuffered, the entries are already batched and nothing is left behind for a fork to write again
+                self.handles[filename] = open(os.path.join(self.directory, filename + ".log"), "ab", buffering=0)
+            self.handles[filename].write(text.encode("utf-8"))
+        except OSError:
+            self.handles.pop(filename, None)
+
+
+log_writer = LogWriter(LOG_PATH)
+atexit.register(log_writer.flush)
+
+
+def log_enabled(filename="main", level=None) -> bool:
+    """Whether log would write a message to this file, check it before building a message that is costly to make"""
+    if log_threshold > log_levels["CRITICAL"]:
+        return False
+    return (level or category_levels.get(filename, log_levels["INFO"])) >= log_threshold
 
 
-def log(msg, filename="main", newline=True):
-    txt = ""
-    if newline:
-        t = time.strftime("%d %b %Y %H:%M:%S")
-        txt += t + "\t"
-    txt += msg
-    if newline:
-        txt += "\n"
-    f = open(os.path.join(LOG_PATH, filename + ".log"), "a")
-    f.write(txt)
-    f.close()
+def log(msg, filename="main", newline=True, level=None):
+    if not log_enabled(filename, level):
+        return
+    log_writer.put(filename, msg, newline)
 
 
 def parse_table(filename):
@@ -90,10 +176,10 @@ def isStrictSubset(s1, s2):
 
 def isSubset(s1, s2):
     """Returns whether s1 is a subset of s2"""
-    if len(s1) == 0:
-        return True
-    if s1[0] in s2:
-        i = s2.index(s1[0])
-        return isSubset(s1[1:], s2[:i] + s2[i + 1:])
-    else:
-        return False
+    remaining = list(s2)
+    for item in s1:
+        if item not in remaining:
+            return False
+        # Each item of s2 can only match one item of s1
+        remaining.remove(item)
+    return True
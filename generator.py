@@ -1,78 +1,125 @@
+import asyncio
 import logging
 import os
 from typing import Tuple
 
-from dotenv import load_dotenv
-from openai import OpenAI
+from compare import AttemptScorer
+from comparison.utils.sequential_test import AttemptEvaluation, SequentialMean
 
-from compare import validate_student_attempts
-
-teacher_attempt_count = 0
 max_teacher_attempts = 3
-best_scoring_hint = ""
-best_score = 0.0
-
-
-def generate_ai_hint(problem_description: str, student_code: str, edit: str, goal_code: str) -> str:
+student_attempt_count = 10
+# How many requests to the model may be in flight at once
+max_concurrent_requests = 10
+# The average score the simulated students must reach with a hint
+acceptance_threshold = 0.85
+# With early stopping, how likely the decision may differ from the one all attempts would lead to
+early_stopping_delta = 0.05
+completions_path = "completions.txt"
+
+
+def generate_ai_hint(problem_description: str, student_code: str, edit: str, goal_code: str,
+                     early_stopping: bool = False) -> str:
+    from dotenv import load_dotenv
+    from openai import AsyncOpenAI
     load_dotenv()
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
     if client is None:
         raise Exception("OpenAI client not initialized.")
-    return internal_generate_ai_hint(problem_description, student_code, edit, goal_code, client)
-
-
-def internal_generate_ai_hint(problem_description: str, student_code: str, edit: str, goal_code: str,
-                              client: OpenAI) -> str:
-    global teacher_attempt_count
-    global max_teacher_attempts
-    global best_scoring_hint
-    global best_score
-    if teacher_attempt_count > max_teacher_attempts:
-        return best_scoring_hint
-    teacher_attempt_count += 1
-    filled_template = populate_teacher_template(problem_description, student_code, edit)
-    teacher_interaction = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0.2,
-        messages=[
-            {"role": "system", "content": f"{teacher_fine_tune}"},
-            {"role": "user", "content": f"{filled_template}"},
-        ],
-    )
-    hints = extract_hints(teacher_interaction.choices[0].message.content)
-    if hints is None:
-        raise Exception("No hints were generated by the AI.")
-    long_form_hint, short_form_hint = hints
-    # Log the hints
-    logging.log(logging.INFO, f"Long-form hint: {long_form_hint}")
-    logging.log(logging.INFO, f"Short-form hint: {short_form_hint}")
-
-    filled_student_template = populate_student_template(long_form_hint, student_code)
-    completions = []
-    for _ in range(10):
-        completion_student = client.chat.completions.create(
+    return asyncio.run(internal_generate_ai_hint(problem_description, student_code, edit, goal_code, client,
+                                                 early_stopping=early_stopping))
+
+
+async def internal_generate_ai_hint(problem_description: str, student_code: str, edit: str, goal_code: str,
+                                    client, batched: bool = False, early_stopping: bool = False) -> str:
+    """Ask the teacher model for a hint until the simulated students score well enough with it.
+    client is an AsyncOpenAI, or anything with the same chat.completions.create coroutine. With batched the
+    student attempts are asked for in one request with n completions, otherwise in concurrent requests.
+    With early_stopping a round stops waiting for attempts once its outcome is settled, see SequentialMean."""
+    best_scoring_hint = ""
+    best_score = 0.0
+    semaphore = asyncio.Semaphore(max_concurrent_requests)
+    scorer = AttemptScorer(goal_code, student_code)
+    for _ in range(max_teacher_attempts + 1):
+        filled_template = populate_teacher_template(problem_description, student_code, edit)
+        async with semaphore:
+            teacher_interaction = await client.chat.completions.create(
+                model="gpt-4o-mini",
+                temperature=0.2,
+                messages=[
+                    {"role": "system", "content": f"{teacher_fine_tune}"},
+                    {"role": "user", "content": f"{filled_template}"},
+                ],
+            )
+        hints = extract_hints(teacher_interaction.choices[0].message.content)
+        if hints is None:
+            raise Exception("No hints were generated by the AI.")
+        long_form_hint, short_form_hint = hints
+        # Log the hints
+        logging.log(logging.INFO, f"Long-form hint: {long_form_hint}")
+        logging.log(logging.INFO, f"Short-form hint: {short_form_hint}")
+
+        filled_student_template = populate_student_template(long_form_hint, student_code)
+        completions, evaluation = await score_student_completions(client, filled_student_template, scorer,
+                                                                  semaphore, batched, early_stopping)
+        logging.log(logging.INFO, f"Scored {evaluation.consumed} of {student_attempt_count} attempts: "
+                                  f"{evaluation.score}")
+        # Write the completions to a file.
+        with open(completions_path, "w") as f:
+            for completion in completions:
+                f.write(f"{completion}\n")
+        # We want a solution that is at least 85% similar to the goal code.
+        if best_score < evaluation.score:
+            best_score = evaluation.score
+            best_scoring_hint = short_form_hint
+        if evaluation.accepted:
+            return short_form_hint
+    return best_scoring_hint
+
+
+async def request_student_completions(client, filled_student_template: str, semaphore: asyncio.Semaphore,
+                                      n: int = 1) -> list:
+    async with semaphore:
+        completion_student = await client.chat.completions.create(
             model="gpt-3.5-turbo",
             temperature=0.3,
+            n=n,
             messages=[
                 {"role": "system", "content": f"{student_fine_tune}"},
                 {"role": "user", "content": f"{filled_student_template}"},
             ],
         )
-        completions.append(completion_student.choices[0].message.content)
-    # Write the completions to a file.
-    with open("completions.txt", "w") as f:
-        for completion in completions:
-            f.write(f"{completion}\n")
-    # Now to compare the completions to the goal code.
-    average_score = validate_student_attempts(completions, goal_code, student_code)
-    # We want a solution that is at least 85% similar to the goal code.
-    if best_score < average_score:
-        best_score = average_score
-        best_scoring_hint = short_form_hint
-    if average_score < 0.85:
-        # We will handle the recursive attempt here.
-        return internal_generate_ai_hint(problem_description, student_code, edit, goal_code, client)
-    return short_form_hint
+    return [choice.message.content for choice in completion_student.choices]
+
+
+async def score_student_completions(client, filled_student_template: str, scorer: AttemptScorer,
+                                    semaphore: asyncio.Semaphore, batched: bool,
+                                    early_stopping: bool = False) -> Tuple[list, AttemptEvaluation]:
+    """Collect the simulated student attempts and score each one as soon as it arrives.
+    Scoring runs on the event loop, the scorer isn't thread safe, while the requests still in flight wait.
+    With early_stopping the requests still pending are dropped as soon as the decision is settled.
+    Returns the attempts in arrival order and their evaluation."""
+    if batched:
+        requests = [request_student_completions(client, filled_student_template, semaphore, student_attempt_count)]
+    else:
+        requests = [request_student_completions(client, filled_student_template, semaphore)
+                    for _ in range(student_attempt_count)]
+    pending = {asyncio.ensure_future(request) for request in requests}
+    running_mean = SequentialMean(acceptance_threshold, student_attempt_count,
+                                  early_stopping_delta if early_stopping else None)
+    completions = []
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for completion in task.result():
+                    completions.append(completion)
+                    running_mean.add(scorer.score(completion))
+                    if early_stopping and running_mean.decision() is not None:
+                        return completions, running_mean.evaluation()
+    finally:
+        for task in pending:
+            task.cancel()
+    return completions, running_mean.evaluation()
 
 
 def populate_teacher_template(problem_description, student_code, edit):
@@ -0,0 +1,162 @@
+"""Precompiled goal artifacts for a bank of problems, so serving a hint never has to parse the goal code"""
+import ast
+import hashlib
+import json
+import os
+from typing import Dict, NamedTuple, Optional
+
+from compare import prepare_goal
+from comparison.canonicalize.canon import canonical_form_version
+from comparison.utils.goal_cache import dump_state, load_state, python_version
+from comparison.utils.normalize import normalizer_version
+
+goal_file = "goal_code.py"
+description_file = "description.txt"
+manifest_file = "manifest.json"
+index_version = 1
+
+
+class BuildReport(NamedTuple):
+    built: list
+    unchanged: list
+    removed: list
+    failed: dict
+
+
+def default_index_dir(problems_dir: str) -> str:
+    return os.path.join(problems_dir, ".index")
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def goal_functions(goal_code_state) -> list:
+    """The names of the functions defined in the goal, as the instructor wrote them"""
+    reverse_map = goal_code_state.reverse_map or {}
+    return [reverse_map.get(node.name, node.name) for node in ast.walk(goal_code_state.tree)
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]
+
+
+def build_artifact(problem_id: str, problem_dir: str) -> dict:
+    with open(os.path.join(problem_dir, goal_file), "r", encoding="utf-8") as file:
+        goal_code = file.read()
+    goal_code_state = prepare_goal(goal_code, True)
+    if goal_code_state is None:
+        raise SyntaxError(f"{problem_id}/{goal_file} has syntax errors")
+    description = None
+    description_path = os.path.join(problem_dir, description_file)
+    if os.path.exists(description_path):
+        with open(description_path, "r", encoding="utf-8") as file:
+            description = file.read()
+    return {"problem_id": problem_id, "goal": goal_code_state, "functions": goal_functions(goal_code_state),
+            "name_map": goal_code_state.reverse_map, "description": description}
+
+
+def read_manifest(index_dir: str) -> dict:
+    """The manifest of the index, or an empty one if it is missing or was built by another version"""
+    try:
+        with open(os.path.join(index_dir, manifest_file), "r") as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+    version = [index_version, canonical_form_version, normalizer_version(), python_version]
+    if manifest.get("version") != version:
+        return {"version": version, "problems": {}}
+    return manifest
+
+
+def write_manifest(index_dir: str, manifest: dict):
+    temporary_path = os.path.join(index_dir, f"{manifest_file}.{os.getpid()}.tmp")
+    with open(temporary_path, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(temporary_path, os.path.join(index_dir, manifest_file))
+
+
+def source_fingerprint(problem_dir: str) -> Dict[str, list]:
+    """The mtime and size of every file that goes into a problem's artifact"""
+    fingerprint = {}
+    for name in [goal_file, description_file]:
+        path = os.path.join(problem_dir, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            fingerprint[name] = [stat.st_mtime_ns, stat.st_size]
+    return fingerprint
+
+
+def source_hashes(problem_dir: str, fingerprint: dict) -> Dict[str, str]:
+    return {name: file_sha256(os.path.join(problem_dir, name)) for name in fingerprint}
+
+
+def build_index(problems_dir: str, index_dir: Optional[str] = None, force: bool = False) -> BuildReport:
+    """Compile the goal of every problem directory into an artifact and record them in the manifest.
+    A problem is only rebuilt when its files changed, files whose mtime changed are hashed to make sure."""
+    index_dir = index_dir or default_index_dir(problems_dir)
+    os.makedirs(index_dir, exist_ok=True)
+    manifest = read_manifest(index_dir)
+    old_entries = manifest["problems"]
+    entries = {}
+    report = BuildReport([], [], [], {})
+    for problem_id in sorted(os.listdir(problems_dir)):
+        problem_dir = os.path.join(problems_dir, problem_id)
+        if not os.path.isfile(os.path.join(problem_dir, goal_file)):
+            continue
+        entry = old_entries.get(problem_id)
+        artifact_path = os.path.join(index_dir, f"{problem_id}.goal")
+        fingerprint = source_fingerprint(problem_dir)
+        if not force and entry is not None and os.path.exists(artifact_path):
+            if entry["fingerprint"] == fingerprint:
+                entries[problem_id] = entry
+                report.unchanged.append(problem_id)
+                continue
+            hashes = source_hashes(problem_dir, fingerprint)
+            if entry["hashes"] == hashes:
+                entries[problem_id] = dict(entry, fingerprint=fingerprint)
+                report.unchanged.append(problem_id)
+                continue
+        else:
+            hashes = source_hashes(problem_dir, fingerprint)
+        try:
+            dump_state(artifact_path, build_artifact(problem_id, problem_dir))
+        except (OSError, SyntaxError, ValueError) as e:  # ValueError covers a goal file that isn't UTF-8
+            report.failed[problem_id] = str(e)
+            continue
+        entries[problem_id] = {"artifact": os.path.basename(artifact_path), "fingerprint": fingerprint,
+                               "hashes": hashes}
+        report.built.append(problem_id)
+    for problem_id, entry in old_entries.items():
+        if problem_id not in entries:
+            # A goal that no longer compiles is dropped too, rather than serving its outdated artifact
+            if problem_id not in report.failed:
+                report.removed.append(problem_id)
+            try:
+                os.remove(os.path.join(index_dir, entry["artifact"]))
+            except FileNotFoundError:
+                pass
+    manifest["problems"] = entries
+    write_manifest(index_dir, manifest)
+    return report
+
+
+class ProblemIndex:
+    """Looks problems up in a built index, each artifact is loaded once and then kept in memory"""
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.entries = read_manifest(index_dir)["problems"]
+        self.artifacts = {}
+
+    def __contains__(self, problem_id: str) -> bool:
+        return problem_id in self.entries
+
+    def artifact(self, problem_id: str) -> dict:
+        if problem_id not in self.artifacts:
+            if problem_id not in self.entries:
+                raise KeyError(f"Unknown problem {problem_id}")
+            artifact_path = os.path.join(self.index_dir, self.entries[problem_id]["artifact"])
+            self.artifacts[problem_id] = load_state(artifact_path)
+        return self.artifacts[problem_id]
+
+    def goal(self, problem_id: str):
+        return self.artifact(problem_id)["goal"]
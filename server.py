@@ -0,0 +1,228 @@
+"""A long-running hint server, goal states stay prepared between requests instead of per process"""
+import ast
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import compare
+from compare import compare_to_goal, prepare_goal, student_syntax_error_hint, solution_syntax_error_hint
+from comparison.utils import normalize
+from comparison.utils.tools import log
+from problem_index import ProblemIndex
+
+max_body_size = 1024 * 1024
+reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+# The state of a server worker process, set up once by init_server_worker
+worker_goals: OrderedDict = OrderedDict()
+worker_goal_capacity: int = 128
+worker_index: Optional[ProblemIndex] = None
+
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str):
+        # Both go in args, so the error survives the trip back from a worker process
+        super().__init__(status, message)
+        self.status = status
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+def init_server_worker(index_dir: Optional[str], goal_capacity: int, goal_cache_dir: Optional[str],
+                       goal_cache_bytes: int, normalize_mode: str, log_threshold: int, time_budget: Optional[float]):
+    global worker_index, worker_goal_capacity
+    # Workers start in the default modes, and the index only loads when its normalizer version matches the mode
+    compare.apply_worker_settings(normalize_mode, log_threshold, time_budget)
+    compare.use_goal_cache(goal_cache_dir, goal_cache_bytes)
+    worker_goal_capacity = goal_capacity
+    worker_goals.clear()
+    worker_index = ProblemIndex(index_dir) if index_dir else None
+
+
+def warm_goal(solution_code: str, canonicalize: bool):
+    """The prepared goal of the solution, the most recently used goals are kept in memory"""
+    key = hashlib.sha256(f"{canonicalize}\0{normalize.normalize_mode}\0{solution_code}".encode("utf-8")).hexdigest()
+    if key in worker_goals:
+        worker_goals.move_to_end(key)
+        return worker_goals[key]
+    goal_code_state = prepare_goal(solution_code, canonicalize)
+    worker_goals[key] = goal_code_state
+    if len(worker_goals) > worker_goal_capacity:
+        worker_goals.popitem(last=False)
+    return goal_code_state
+
+
+def server_compare(student_code: str, solution_code: Optional[str], problem_id: Optional[str],
+                   canonicalize: bool, time_budget: Optional[float] = None) -> dict:
+    """compare_solutions for a server request, reporting how long each stage took in milliseconds"""
+    timings = {}
+    start = time.perf_counter()
+    student_code = normalize.normalize(student_code)
+    timings["format"] = (time.perf_counter() - start) * 1000
+    try:
+        ast.parse(student_code)
+    except Exception:
+        return {"hint": student_syntax_error_hint, "ephemeral_goal": "", "complete": True, "estimated": False,
+                "timings": timings}
+
+    start = time.perf_counter()
+    if problem_id is not None:
+        if worker_index is None or problem_id not in worker_index:
+            raise RequestError(404, f"Unknown problem {problem_id}")
+        goal_code_state = worker_index.goal(problem_id)
+    else:
+        goal_code_state = warm_goal(solution_code, canonicalize)
+    timings["goal"] = (time.perf_counter() - start) * 1000
+    if goal_code_state is None:
+        return {"hint": solution_syntax_error_hint, "ephemeral_goal": "", "complete": True, "estimated": False,
+                "timings": timings}
+
+    start = time.perf_counter()
+    hint, ephemeral_goal = compare_to_goal(student_code, goal_code_state, canonicalize, formatted=True,
+                                           budget=time_budget)
+    timings["compare"] = (time.perf_counter() - start) * 1000
+    return {"hint": hint, "ephemeral_goal": ephemeral_goal, "complete": compare.hint_complete,
+            "estimated": compare.hint_estimated, "timings": timings}
+
+
+def parse_compare_request(body: bytes) -> dict:
+    try:
+        request = json.loads(body)
+    except ValueError as e:
+        raise RequestError(400, f"Invalid JSON: {e}")
+    if not isinstance(request, dict) or not isinstance(request.get("student_code"), str):
+        raise RequestError(400, "student_code is required")
+    if not isinstance(request.get("solution_code"), str) and not isinstance(request.get("problem_id"), str):
+        raise RequestError(400, "solution_code or problem_id is required")
+    canonicalize = request.get("canonicalize", True)
+    if type(canonicalize) is not bool:
+        raise RequestError(400, "canonicalize must be true or false")
+    if isinstance(request.get("problem_id"), str) and not canonicalize:
+        # Index goals are always canonicalized, a student that isn't would be compared against anonymized names
+        raise RequestError(400, "canonicalize can't be false with a problem_id")
+    time_budget = request.get("time_budget")
+    if time_budget is not None and (type(time_budget) not in (int, float) or time_budget <= 0):
+        raise RequestError(400, "time_budget must be a positive number of seconds")
+    return {"student_code": request["student_code"], "solution_code": request.get("solution_code"),
+            "problem_id": request.get("problem_id"), "canonicalize": canonicalize,
+            "time_budget": time_budget}
+
+
+class HintServer:
+    """Serves hints over HTTP, on a TCP port or a Unix socket.
+    POST /compare takes {"student_code", "solution_code" or "problem_id", "canonicalize", "time_budget"} and answers
+    {"hint", "ephemeral_goal", "complete", "estimated", "timings"}, GET /health answers {"status": "ok"}."""
+
+    def __init__(self, workers: int = 1, index_dir: Optional[str] = None, goal_capacity: int = 128):
+        goal_cache = compare.goal_cache
+        # Forked workers would inherit the sockets of open connections and keep them from closing
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context(start_method), initializer=init_server_worker,
+            initargs=(index_dir, goal_capacity, goal_cache.directory if goal_cache else None,
+                      goal_cache.max_bytes if goal_cache else 0, *compare.worker_settings()))
+        self.server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765, unix_socket: Optional[str] = None):
+        # Start the workers now, rather than making the first request wait for them
+        await asyncio.get_running_loop().run_in_executor(self.executor, os.getpid)
+        if unix_socket:
+            self.server = await asyncio.start_unix_server(self.handle_connection, path=unix_socket)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(cancel_futures=True)
+
+    async def compare(self, body: bytes) -> dict:
+        request = parse_compare_request(body)
+        start = time.perf_counter()
+        response = await asyncio.get_running_loop().run_in_executor(
+            self.executor, server_compare, request["student_code"], request["solution_code"],
+            request["problem_id"], request["canonicalize"], request["time_budget"])
+        total = (time.perf_counter() - start) * 1000
+        timings = response["timings"]
+        timings["queue"] = max(total - sum(timings.values()), 0)
+        timings["total"] = total
+        return response
+
+    async def respond(self, method: str, path: str, body: bytes) -> dict:
+        if path == "/health":
+            return {"status": "ok"}
+        if path != "/compare":
+            raise RequestError(404, f"Unknown path {path}")
+        if method != "POST":
+            raise RequestError(405, "Use POST for /compare")
+        return await self.compare(body)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                    length = int(headers.get("content-length", 0))
+                    if length > max_body_size:
+                        keep_alive = False
+                        raise RequestError(413, "Request body too large")
+                    body = await reader.readexactly(length)
+                    status, response = 200, await self.respond(method, path, body)
+                except RequestError as e:
+                    status, response = e.status, {"error": str(e)}
+                except ValueError:
+                    status, response, keep_alive = 400, {"error": "Malformed request"}, False
+                except Exception as e:
+                    log(f"Hint server request failed: {e!r}", "bug")
+                    status, response = 500, {"error": f"{type(e).__name__}: {e}"}
+                payload = json.dumps(response).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {reasons[status]}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(payload)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}"
+                             f"\r\n\r\n".encode("latin-1") + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host: str, port: int, unix_socket: Optional[str], workers: int, index_dir: Optional[str],
+                on_start=None):
+    hint_server = HintServer(workers, index_dir)
+    server = await hint_server.start(host, port, unix_socket)
+    if on_start is not None:
+        on_start(unix_socket or ", ".join(f"{s.getsockname()[0]}:{s.getsockname()[1]}" for s in server.sockets))
+    stop = asyncio.Event()
+    if os.name != "nt":  # Windows event loops have no signal handlers
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await hint_server.close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
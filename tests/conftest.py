@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Set before anything imports comparison.utils.tools, and inherited by the worker processes the tests start,
+# so running the suite never writes logs into comparison/logs
+log_directory = tempfile.TemporaryDirectory(prefix="ast-hint-logs-")
+os.environ["AST_HINT_LOG_DIR"] = log_directory.name
@@ -38,6 +38,43 @@ class TestAstTools(unittest.TestCase):
         result = compare_trees(list_a, list_b)
         self.assertNotEqual(result, 0)
 
+    # structural_hash tests
+    def test_structural_hash_equal_trees(self):
+        self.assertEqual(structural_hash(ast.parse("a = b + 1")), structural_hash(ast.parse("a = b + 1")))
+
+    def test_structural_hash_different_trees(self):
+        self.assertNotEqual(structural_hash(ast.parse("a = b + 1")), structural_hash(ast.parse("a = b + 2")))
+
+    def test_structural_hash_ignores_context(self):
+        load_name = ast.Name(id="a", ctx=ast.Load())
+        store_name = ast.Name(id="a", ctx=ast.Store())
+        self.assertEqual(structural_hash(load_name), structural_hash(store_name))
+
+    def test_structural_hash_is_cleared(self):
+        tree = ast.parse("a = 1")
+        structural_hash(tree)
+        clear_subtree_properties(tree)
+        self.assertFalse(hasattr(tree, "structuralHash"))
+
+    def test_compareASTs_equality_uses_hash(self):
+        self.assertEqual(0, compare_trees(ast.parse("a = b + 1"), ast.parse("a = b + 1"), check_equality=True))
+        self.assertNotEqual(0, compare_trees(ast.parse("a = b + 1"), ast.parse("a = c + 1"), check_equality=True))
+
+    def test_compareASTs_tells_apart_colliding_ints(self):
+        # hash(-1) == hash(-2), and ints equal mod 2**61 - 1 share a hash() too
+        self.assertNotEqual(0, compare_trees(ast.Constant(-1), ast.Constant(-2), check_equality=True))
+        self.assertNotEqual(0, compare_trees(ast.Constant(1), ast.Constant(2 ** 61), check_equality=True))
+        self.assertEqual(0, compare_trees(ast.Constant(0.0), ast.Constant(-0.0), check_equality=True))
+
+    # depth_of_ast tests
+    def test_depth_of_ast_is_cached(self):
+        tree = ast.parse("a = b + 1")
+        self.assertEqual(5, depth_of_ast(tree))
+        self.assertEqual(4, tree.body[0].treeDepth)
+
+    def test_compareASTs_orders_deeper_trees_first(self):
+        self.assertLess(compare_trees(ast.parse("a = b + 1"), ast.parse("a = 1")), 0)
+
     # cmp tests
     def test_cmp_complex_numbers(self):
         self.assertEqual(cmp(complex(1, 1), complex(1, 1)), 0)
@@ -0,0 +1,45 @@
+import os
+import unittest
+from unittest import mock
+
+import compare
+from compare import AttemptScorer, validate_student_attempts
+
+
+class TestAttemptScorer(unittest.TestCase):
+    def setUp(self):
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with open(os.path.join(project_root, "problems", "p1", "goal_code.py")) as file:
+            self.goal_code = file.read()
+        with open(os.path.join(project_root, "problems", "p1", "student_code.py")) as file:
+            self.student_code = file.read()
+        self.attempts = [self.goal_code, "def (:", self.student_code, self.goal_code]
+
+    def test_scores_each_attempt(self):
+        result = AttemptScorer(self.goal_code, self.student_code).score_all(self.attempts)
+        self.assertEqual(len(result.scores), 4)
+        self.assertIsNone(result.scores[1])
+        self.assertEqual(result.scores[0], result.scores[3])
+        self.assertNotEqual(result.scores[0], result.scores[2])
+        self.assertAlmostEqual(result.average, (2 * result.scores[0] + result.scores[2]) / 3)
+        self.assertEqual(validate_student_attempts(self.attempts, self.goal_code, self.student_code), result.average)
+
+    def test_canonicalizes_fixed_code_once(self):
+        with mock.patch.object(compare, "create_canonical_intermediate_state",
+                               wraps=compare.create_canonical_intermediate_state) as canonicalize:
+            AttemptScorer(self.goal_code, self.student_code).score_all(self.attempts)
+        # The student and goal code, then the three distinct attempts
+        self.assertEqual(canonicalize.call_count, 5)
+
+    def test_process_pool_gives_the_same_scores(self):
+        expected = AttemptScorer(self.goal_code, self.student_code).score_all(self.attempts)
+        self.assertEqual(AttemptScorer(self.goal_code, self.student_code).score_all(self.attempts, workers=2),
+                         expected)
+
+    def test_broken_fixed_code_scores_nothing(self):
+        result = AttemptScorer("def (:", self.student_code).score_all(self.attempts)
+        self.assertEqual(result, ([None] * 4, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import ast
+import unittest
+
+from comparison.canonicalize.canon import give_ids
+from comparison.canonicalize.deanonymizer import DeanonymizeNames
+
+
+class TestGiveIds(unittest.TestCase):
+    def test_numbers_nodes_densely(self):
+        tree = ast.parse("def foo(a):\n    return a + 1")
+        node_index = give_ids(tree)
+        self.assertEqual(node_index[0], tree)
+        for i, node in enumerate(node_index):
+            self.assertEqual(node.global_id, tree.global_id + i)
+        self.assertFalse(any(isinstance(node, (ast.Load, ast.Store)) for node in node_index))
+        self.assertEqual(len(node_index), len([n for n in ast.walk(tree) if not isinstance(n, (ast.Load, ast.Store))]))
+
+    def test_copies_aliased_children(self):
+        tree = ast.parse("x = 1\ny = 2")
+        tree.body[1] = tree.body[0]
+        node_index = give_ids(tree)
+        self.assertIsNot(tree.body[0], tree.body[1])
+        self.assertEqual(len({id(node) for node in node_index}), len(node_index))
+
+    def test_deanonymizer_uses_node_index(self):
+        tree = ast.parse("def foo(a):\n    return a")
+        node_index = give_ids(tree)
+        original_name = ast.Name(id="a", ctx=ast.Load())
+        original_name.global_id = tree.body[0].body[0].value.global_id
+        node_index[original_name.global_id - tree.global_id] = original_name
+        tree.body[0].body[0].value.id = "foo_param0"
+        DeanonymizeNames(node_index=node_index).visit(tree)
+        self.assertEqual(tree.body[0].body[0].value.id, "a")
+
+    def test_trees_do_not_share_ids(self):
+        student_index = give_ids(ast.parse("def foo(a):\n    return a"))
+        goal_tree = ast.parse("def bar(b):\n    return b")
+        goal_index = give_ids(goal_tree)
+        self.assertFalse({node.global_id for node in student_index} & {node.global_id for node in goal_index})
+        # A goal node must not be renamed after the student node numbered like it in its own tree
+        goal_name = goal_tree.body[0].body[0].value
+        DeanonymizeNames(node_index=student_index).visit(goal_name)
+        self.assertEqual(goal_name.id, "b")
+        DeanonymizeNames(original_tree=student_index[0]).visit(goal_name)
+        self.assertEqual(goal_name.id, "b")
+
+
+if __name__ == '__main__':
+    unittest.main()
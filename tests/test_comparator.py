@@ -30,6 +30,18 @@ class TestComparator(unittest.TestCase):
         weight = get_weight(self.student_code_state.tree)
         self.assertEqual(weight, 34)
 
+    def test_get_weight_weighs_every_node(self):
+        tree = ast.parse("def f(a):\n    return a + 1")
+        get_weight(tree)
+        for node in ast.walk(tree):
+            self.assertTrue(hasattr(node, "treeWeight"))
+
+    def test_get_weight_without_counting_tokens(self):
+        tree = ast.parse("x = '~program~'")
+        self.assertEqual(3, get_weight(tree))
+        self.assertEqual(2, get_weight(tree, count_tokens=False))
+        self.assertEqual(3, get_weight(tree))
+
     # match_lists tests
     def test_match_list_match_exact_lines(self):
         list_x = ["a", "b", "c"]
@@ -52,6 +64,24 @@ class TestComparator(unittest.TestCase):
         expected = {0: 2, 1: 1, 2: 0}
         self.assertEqual(expected, result)
 
+    def test_match_list_inserted_and_moved_lines(self):
+        list_x = [ast.parse("x" + str(i) + " = " + str(i)).body[0] for i in range(100)]
+        list_y = list_x[:50] + [ast.parse("y = 0").body[0]] + list_x[50:]
+        list_y.append(list_y.pop(10))
+        result = match_lists(list_x, list_y)
+        expected = {j: j for j in range(10)}
+        expected.update({j: j + 1 for j in range(10, 49)})
+        expected.update({j: j for j in range(50, 100)})
+        expected.update({100: 10, 49: -1})
+        self.assertEqual(expected, result)
+
+    def test_match_list_duplicate_lines_keep_order(self):
+        list_x = ["a", "b", "a", "b"]
+        list_y = ["c", "a", "b", "a", "b"]
+        result = match_lists(list_x, list_y)
+        expected = {1: 0, 2: 1, 3: 2, 4: 3, 0: -1}
+        self.assertEqual(expected, result)
+
     # generate_move_pairs tests
 
     def test_generate_move_pairs_should_return_empty_for_empty_lists(self):
@@ -82,6 +112,16 @@ class TestComparator(unittest.TestCase):
         result = generate_move_pairs([1, 2, 3, 4], [4, 3, 2, 1])
         self.assertEqual(result, [("swap", 1, 4), ("swap", 2, 3)])
 
+    def test_generate_move_pairs_should_move_fewest_lines(self):
+        result = generate_move_pairs([1, 2, 3, 4, 5, 6], [2, 6, 3, 4, 1, 5])
+        self.assertEqual(result, [("move", 1), ("move", 6)])
+
+    def test_generate_move_pairs_should_handle_long_lists(self):
+        start_list = list(range(5000))
+        end_list = start_list[1:2500] + [0] + start_list[2500:]
+        result = generate_move_pairs(start_list, end_list)
+        self.assertEqual(result, [("move", 0)])
+
     # find_move_vector tests
 
     def test_fmv_should_return_empty_for_empty_lists(self):
@@ -235,6 +275,28 @@ class TestComparator(unittest.TestCase):
         dist, _ = result
         self.assertEqual(0.67, round(dist, 2))
 
+    def test_distance_diff_cache(self):
+        state = CodeState(tree=ast.parse("a = 1"), goal=IntermediateState(tree=ast.parse("b = 2")))
+        diff_cache = {}
+        _, changes = distance(state, state.goal, diff_cache=diff_cache)
+        _, cached_changes = distance(state, state.goal, diff_cache=diff_cache)
+        self.assertIs(changes, cached_changes)
+        self.assertIn((id(state.tree), id(state.goal.tree)), diff_cache)
+        # The assignments are matched by their distance, so their diff is remembered too
+        self.assertIn((id(state.tree.body[0]), id(state.goal.tree.body[0])), diff_cache)
+
+    def test_diff_cache_keeps_the_changes(self):
+        resource_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources")
+        with open(os.path.join(resource_path, "multi_func_steps", "multi_func0.py")) as file:
+            student_tree = ast.parse(file.read())
+        with open(os.path.join(resource_path, "multi_func_solution.py")) as file:
+            goal_tree = ast.parse(file.read())
+        diff_cache = {}
+        for _ in range(2):
+            cached_changes = diff_asts(student_tree, goal_tree, diff_cache)
+            self.assertEqual([str(change) for change in diff_asts(student_tree, goal_tree)],
+                             [str(change) for change in cached_changes])
+
     # get_changes_weight tests
     def test_get_changes_weight_no_changes(self):
         changes = []
@@ -0,0 +1,100 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+import generator
+
+
+class FakeCompletions:
+    """Answers like the OpenAI chat completions endpoint, after a fixed delay"""
+
+    def __init__(self, delay, teacher_reply, student_reply):
+        self.delay = delay
+        self.teacher_reply = teacher_reply
+        self.student_reply = student_reply
+        self.requests = []
+
+    async def create(self, model, temperature, messages, n=1):
+        self.requests.append((model, n))
+        await asyncio.sleep(self.delay)
+        reply = self.teacher_reply if model == "gpt-4o-mini" else self.student_reply
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply)) for _ in range(n)])
+
+
+class FakeClient:
+    def __init__(self, delay, teacher_reply, student_reply):
+        self.chat = SimpleNamespace(completions=FakeCompletions(delay, teacher_reply, student_reply))
+
+
+class TestGenerator(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        original_path = generator.completions_path
+        generator.completions_path = os.path.join(directory.name, "completions.txt")
+        self.addCleanup(setattr, generator, "completions_path", original_path)
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with open(os.path.join(project_root, "problems", "p1", "goal_code.py")) as file:
+            self.goal_code = file.read()
+        with open(os.path.join(project_root, "problems", "p1", "student_code.py")) as file:
+            self.student_code = file.read()
+
+    def generate(self, client, batched=False, early_stopping=False):
+        return asyncio.run(generator.internal_generate_ai_hint("Add two numbers", self.student_code, "edit",
+                                                               self.goal_code, client, batched, early_stopping))
+
+    def test_student_completions_run_concurrently(self):
+        delay = 0.2
+        client = FakeClient(delay, "Long-form hint:\nlong\nShort-form hint:\nshort", self.goal_code)
+        start = time.perf_counter()
+        self.assertEqual(self.generate(client), "short")
+        elapsed = time.perf_counter() - start
+        # One teacher request followed by the ten student requests at once, rather than eleven in a row
+        self.assertEqual(len(client.chat.completions.requests), 1 + generator.student_attempt_count)
+        self.assertLess(elapsed, delay * 5)
+
+    def test_batched_student_completions(self):
+        client = FakeClient(0, "Long-form hint:\nlong\nShort-form hint:\nshort", self.goal_code)
+        self.assertEqual(self.generate(client, batched=True), "short")
+        self.assertEqual(client.chat.completions.requests,
+                         [("gpt-4o-mini", 1), ("gpt-3.5-turbo", generator.student_attempt_count)])
+        with open(generator.completions_path) as file:
+            self.assertEqual(file.read().count("def twoSum"), generator.student_attempt_count)
+
+    def test_gives_up_with_the_best_hint(self):
+        client = FakeClient(0, "Long-form hint:\nlong\nShort-form hint:\nshort",
+                            "def twoSum(a, b):\n    return None")
+        self.assertEqual(self.generate(client, batched=True), "short")
+        self.assertEqual(len(client.chat.completions.requests), 2 * (generator.max_teacher_attempts + 1))
+
+    def test_early_stopping_drops_the_remaining_attempts(self):
+        generator.max_concurrent_requests = 2
+        self.addCleanup(setattr, generator, "max_concurrent_requests", 10)
+        client = FakeClient(0.05, "Long-form hint:\nlong\nShort-form hint:\nshort", "x = 1")
+        self.assertEqual(self.generate(client, early_stopping=True), "")
+        requests = client.chat.completions.requests
+        rounds = generator.max_teacher_attempts + 1
+        self.assertEqual(len([request for request in requests if request[0] == "gpt-4o-mini"]), rounds)
+        self.assertLess(len(requests), rounds * (1 + generator.student_attempt_count) / 2)
+
+    def test_attempts_are_scored_on_the_event_loop_thread(self):
+        scoring_threads = set()
+        original_score = generator.AttemptScorer.score
+
+        def score(scorer, generative_attempt):
+            scoring_threads.add(threading.get_ident())
+            return original_score(scorer, generative_attempt)
+
+        generator.AttemptScorer.score = score
+        self.addCleanup(setattr, generator.AttemptScorer, "score", original_score)
+        client = FakeClient(0.01, "Long-form hint:\nlong\nShort-form hint:\nshort", self.goal_code)
+        self.assertEqual(self.generate(client), "short")
+        self.assertEqual(scoring_threads, {threading.get_ident()})
+
+
+if __name__ == '__main__':
+    unittest.main()
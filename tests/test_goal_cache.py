@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import compare
+from compare import compare_solutions, prepare_goal, use_goal_cache
+from comparison.utils.goal_cache import GoalCache
+
+
+class TestGoalCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(use_goal_cache, None)
+        resources = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources")
+        with open(os.path.join(resources, "multi_func_solution.py")) as file:
+            self.solution_code = file.read()
+        with open(os.path.join(resources, "multi_func_steps", "multi_func0.py")) as file:
+            self.student_code = file.read()
+
+    def test_cached_goal_gives_the_same_hint(self):
+        expected_hint = compare_solutions(self.student_code, self.solution_code, True)
+        use_goal_cache(self.directory.name)
+        self.assertEqual(compare_solutions(self.student_code, self.solution_code, True), expected_hint)
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+        cached_state = compare.goal_cache.get(compare.goal_cache.key(self.solution_code, True))
+        self.assertEqual(cached_state.anonymized_code, prepare_goal(self.solution_code, True).anonymized_code)
+        self.assertIsNotNone(cached_state.tree.structuralHash)
+        self.assertEqual(compare_solutions(self.student_code, self.solution_code, True), expected_hint)
+
+    def test_key_depends_on_source_and_canonicalize(self):
+        cache = GoalCache(self.directory.name)
+        self.assertNotEqual(cache.key("x = 1", True), cache.key("x = 2", True))
+        self.assertNotEqual(cache.key("x = 1", True), cache.key("x = 1", False))
+
+    def test_key_depends_on_python_version(self):
+        cache = GoalCache(self.directory.name)
+        key = cache.key("x = 1", True)
+        with unittest.mock.patch("comparison.utils.goal_cache.python_version", "cpython-00"):
+            self.assertNotEqual(cache.key("x = 1", True), key)
+
+    def test_evicts_least_recently_used(self):
+        cache = GoalCache(self.directory.name, max_bytes=2500)
+        for i, key in enumerate(["a", "b", "c"]):
+            cache.put(key, "x" * 1000)
+            os.utime(cache.path(key), (i, i))
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), "x" * 1000)
+        os.utime(cache.path("b"), (5, 5))
+        cache.put("d", "x" * 1000)
+        self.assertIsNone(cache.get("c"))
+        self.assertIsNotNone(cache.get("b"))
+
+    def test_unreadable_entry_is_a_miss(self):
+        cache = GoalCache(self.directory.name)
+        with open(cache.path("broken"), "wb") as file:
+            file.write(b"not a pickle")
+        self.assertIsNone(cache.get("broken"))
+        self.assertFalse(os.path.exists(cache.path("broken")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import ast
+import os
+import unittest
+
+from comparison.utils import normalize
+
+
+class TestNormalize(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(normalize.set_normalize_mode, normalize.normalize_mode)
+        normalize.normalized_memo.clear()
+
+    def test_fast_normalize_reindents_and_strips(self):
+        code = "def f(x):\n\tif x:   \n\t\treturn [1,\n\t\t  2]\n\ty = '''a  \n  b  '''\n\n\n"
+        expected = "def f(x):\n    if x:\n        return [1,\n\t\t  2]\n    y = '''a  \n  b  '''\n"
+        self.assertEqual(normalize.fast_normalize(code), expected)
+
+    def test_fast_normalize_keeps_the_tree(self):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "multi_func_solution.py")
+        with open(path) as file:
+            code = file.read()
+        self.assertEqual(ast.dump(ast.parse(normalize.fast_normalize(code))), ast.dump(ast.parse(code)))
+
+    def test_fast_normalize_leaves_broken_code(self):
+        self.assertEqual(normalize.fast_normalize("x = (\n  "), "x = (\n  ")
+
+    def test_memoizes_by_content(self):
+        calls = []
+        normalize.normalizers["test"] = lambda code: calls.append(code) or code.upper()
+        self.addCleanup(normalize.normalizers.pop, "test")
+        self.assertEqual(normalize.normalize("x = 1", "test"), "X = 1")
+        self.assertEqual(normalize.normalize("".join(["x = ", "1"]), "test"), "X = 1")
+        self.assertEqual(calls, ["x = 1"])
+        self.assertEqual(normalize.normalize("x = 1", "none"), "x = 1")
+
+    def test_uses_the_current_mode(self):
+        normalize.set_normalize_mode("none")
+        self.assertEqual(normalize.normalize("x=1"), "x=1")
+        normalize.set_normalize_mode("autopep8")
+        self.assertEqual(normalize.normalize("x=1"), "x = 1\n")
+        self.assertRaises(ValueError, normalize.set_normalize_mode, "black")
+
+
+if __name__ == '__main__':
+    unittest.main()
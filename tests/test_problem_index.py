@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from compare import compare_solutions, compare_to_goal
+from problem_index import ProblemIndex, build_index, default_index_dir
+
+
+class TestProblemIndex(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.problems_dir = os.path.join(directory.name, "problems")
+        shutil.copytree(os.path.join(project_root, "problems"), self.problems_dir)
+        self.index_dir = default_index_dir(self.problems_dir)
+
+    def read(self, *path):
+        with open(os.path.join(self.problems_dir, *path)) as file:
+            return file.read()
+
+    def write(self, content, *path):
+        with open(os.path.join(self.problems_dir, *path), "w") as file:
+            file.write(content)
+
+    def test_indexed_goal_gives_the_same_hint(self):
+        report = build_index(self.problems_dir)
+        self.assertEqual(report.built, ["p1"])
+        index = ProblemIndex(self.index_dir)
+        self.assertIn("p1", index)
+        self.assertEqual(index.artifact("p1")["functions"], ["twoSum"])
+        student_code = self.read("p1", "student_code.py")
+        hint, _ = compare_to_goal(student_code, index.goal("p1"), True)
+        self.assertEqual(hint, compare_solutions(student_code, self.read("p1", "goal_code.py"), True))
+
+    def test_rebuilds_only_changed_problems(self):
+        os.mkdir(os.path.join(self.problems_dir, "p2"))
+        self.write("def f():\n    return 1\n", "p2", "goal_code.py")
+        self.assertEqual(build_index(self.problems_dir).built, ["p1", "p2"])
+        self.assertEqual(build_index(self.problems_dir).unchanged, ["p1", "p2"])
+        # Same content with a new mtime is only rehashed
+        self.write(self.read("p1", "goal_code.py"), "p1", "goal_code.py")
+        self.write("def f():\n    return 2\n", "p2", "goal_code.py")
+        report = build_index(self.problems_dir)
+        self.assertEqual(report.built, ["p2"])
+        self.assertEqual(report.unchanged, ["p1"])
+
+    def test_drops_removed_and_broken_problems(self):
+        os.mkdir(os.path.join(self.problems_dir, "p2"))
+        self.write("def f():\n    return 1\n", "p2", "goal_code.py")
+        build_index(self.problems_dir)
+        shutil.rmtree(os.path.join(self.problems_dir, "p2"))
+        self.write("def twoSum(:\n", "p1", "goal_code.py")
+        report = build_index(self.problems_dir)
+        self.assertEqual(report.removed, ["p2"])
+        self.assertEqual(list(report.failed), ["p1"])
+        index = ProblemIndex(self.index_dir)
+        self.assertNotIn("p1", index)
+        self.assertNotIn("p2", index)
+        self.assertEqual(os.listdir(self.index_dir), ["manifest.json"])
+
+    def test_reads_descriptions_as_utf8(self):
+        with open(os.path.join(self.problems_dir, "p1", "description.txt"), "w", encoding="utf-8") as file:
+            file.write("Trouvez deux indices dont la somme vaut la cible, ou renvoyez « aucun ».")
+        build_index(self.problems_dir)
+        self.assertTrue(ProblemIndex(self.index_dir).artifact("p1")["description"].endswith("« aucun »."))
+
+    def test_reports_undecodable_goal(self):
+        os.mkdir(os.path.join(self.problems_dir, "p2"))
+        with open(os.path.join(self.problems_dir, "p2", "goal_code.py"), "wb") as file:
+            file.write(b"def f():\n    return '\xff'\n")
+        report = build_index(self.problems_dir)
+        self.assertEqual(report.built, ["p1"])
+        self.assertEqual(list(report.failed), ["p2"])
+        index = ProblemIndex(self.index_dir)
+        self.assertIn("p1", index)
+        self.assertNotIn("p2", index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import time
+import unittest
+
+from compare import compare_solutions
+from comparison.utils import profiling
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        resource_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources")
+        with open(os.path.join(resource_path, "multi_func_steps", "multi_func0.py")) as file:
+            self.student_code = file.read()
+        with open(os.path.join(resource_path, "multi_func_solution.py")) as file:
+            self.solution_code = file.read()
+
+    def test_reports_stages_and_counts(self):
+        expected_hint = compare_solutions(self.student_code, self.solution_code, True)
+        with profiling.profiling() as profile:
+            hint = compare_solutions(self.student_code, self.solution_code, True)
+        self.assertEqual(hint, expected_hint)
+        report = profile.report()
+        self.assertEqual(list(report["stages"]), ["format", "parse", "canonicalize", "weigh", "diff", "search",
+                                                  "validate", "select", "deanonymize", "hints"])
+        self.assertEqual(report["stages"]["canonicalize"]["calls"], 2)
+        stage_seconds = sum(stage_time["seconds"] for stage_time in report["stages"].values())
+        self.assertLessEqual(stage_seconds, report["total_seconds"])
+        self.assertEqual(report["stages"]["validate"]["calls"], report["counts"]["candidates"])
+        for name in ["candidates", "apply_change", "compare_trees", "deepcopy"]:
+            self.assertGreater(report["counts"][name], 0)
+        self.assertGreater(report["peak_memory_bytes"], 0)
+        self.assertIn("search", profiling.format_report(report))
+
+    def test_records_nothing_outside_a_profile(self):
+        with profiling.profiling(trace_memory=False) as profile:
+            pass
+        compare_solutions(self.student_code, self.solution_code, True)
+        self.assertIsNone(profiling.active_profile)
+        self.assertEqual(profile.report()["stages"], {})
+        self.assertIsNone(profile.report()["peak_memory_bytes"])
+
+    def test_nested_stages_do_not_overlap(self):
+        with profiling.profiling(trace_memory=False) as profile:
+            with profiling.stage("outer"):
+                with profiling.stage("inner"):
+                    time.sleep(0.02)
+        stages = profile.report()["stages"]
+        self.assertLess(stages["outer"]["seconds"], 0.01)
+        self.assertGreaterEqual(stages["inner"]["seconds"], 0.02)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import ast
+import unittest
+
+from comparison.canonicalize.canon import canonical_rules
+from comparison.canonicalize.rewriter import RewritePipeline
+
+
+class TestRewritePipeline(unittest.TestCase):
+    def test_runs_all_canonical_rules_in_one_traversal(self):
+        code = """
+def foo(a, b):
+    if 1 < 2:
+        c = 2 + 3
+    x = 1 if True else 2
+    return not (a and b)
+    d = 4
+"""
+        tree = canonical_rules.run(ast.parse(code))
+        self.assertEqual(ast.unparse(tree), "def foo(a, b):\n    c = 5\n    x = 1\n    return not a or not b")
+
+    def test_rewrites_replacements_to_a_fixpoint(self):
+        tree = canonical_rules.run(ast.parse("x = not (a and (not (b or c)))"))
+        self.assertEqual(ast.unparse(tree), "x = not a or (not not b or not not c)")
+        tree = canonical_rules.run(ast.parse("x = not (a or (b and c))"))
+        self.assertEqual(ast.unparse(tree), "x = not a and (not b or not c)")
+
+    def test_failing_rule_only_leaves_its_own_node(self):
+        def fail_on_name(node, context):
+            if node.id == "bad":
+                raise ValueError("bad name")
+            if node.id.isupper():
+                return node
+            return ast.Name(id=node.id.upper(), ctx=node.ctx)
+
+        pipeline = RewritePipeline()
+        pipeline.register([ast.Name], fail_on_name)
+        tree = pipeline.run(ast.parse("x = bad + y"))
+        self.assertEqual(ast.unparse(tree), "X = bad + Y")
+
+    def test_module_level_loops_do_not_block_other_rules(self):
+        code = """
+for i in range(3):
+    print(i)
+def foo():
+    return 1
+    a = 2
+"""
+        tree = canonical_rules.run(ast.parse(code))
+        self.assertNotIn("a = 2", ast.unparse(tree))
+
+    def test_return_does_not_reach_past_its_function(self):
+        code = """
+def f(x):
+    return x
+DAYS = [31, 28, 31]
+total = 0
+for d in DAYS[1:]:
+    total += d
+def g():
+    if total:
+        return 1
+    return 2
+    unused = 3
+limit = 10
+"""
+        transformed_code = ast.unparse(canonical_rules.run(ast.parse(code)))
+        for statement in ["DAYS = [31, 28, 31]", "total = 0", "limit = 10"]:
+            self.assertIn(statement, transformed_code)
+        self.assertNotIn("unused = 3", transformed_code)
+
+    def test_return_does_not_reach_past_its_block(self):
+        code = """
+def f(x):
+    if x:
+        return 1
+    y = 2
+    return y
+"""
+        transformed_code = ast.unparse(canonical_rules.run(ast.parse(code)))
+        self.assertIn("y = 2", transformed_code)
+
+    def test_return_in_body_keeps_else_branch(self):
+        code = """
+def f(x):
+    if x:
+        return 1
+    else:
+        y = 2
+        return y
+        z = 3
+"""
+        transformed_code = ast.unparse(canonical_rules.run(ast.parse(code)))
+        self.assertIn("y = 2", transformed_code)
+        self.assertNotIn("z = 3", transformed_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
+import multiprocessing
 import os
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 
-from compare import compare_solutions
+import compare
+from compare import compare_solutions, compare_batch
+from comparison.utils import tools
 from path_construction.state_creator import create_state
 
 
@@ -85,3 +89,46 @@ class TestSamples(unittest.TestCase):
         broken_code, solution_code = self.open_broken_and_solution(step_number=7)
         some_state = create_state(broken_code, solution_code, True)
         self.assertEqual(some_state.anonymized_code, some_state.anonymized_code)
+
+    def test_swapped_statements_with_folded_constants(self):
+        broken_code = "def f(x):\n    x.append(5 - 6)\n    x.append(5 - 7)\n"
+        solution_code = "def f(x):\n    x.append(5 - 7)\n    x.append(5 - 6)\n"
+        hint = compare_solutions(broken_code, solution_code, True)
+        self.assertTrue(hint.startswith("At line 2, column 4 swap x.append(-1)"))
+
+    def test_multi_func_batch_matches_single_comparisons(self):
+        broken_codes = [self.open_broken_and_solution(step_number=step)[0] for step in range(8)]
+        _, solution_code = self.open_broken_and_solution(step_number=0)
+        expected_hints = [compare_solutions(broken_code, solution_code, True) for broken_code in broken_codes]
+        # Run the steps twice, so the shared goal is reused after every kind of hint
+        results = list(compare_batch(broken_codes + broken_codes, solution_code, True))
+        self.assertEqual(expected_hints + expected_hints, [result.hint for result in results])
+
+    def test_batch_with_broken_solution(self):
+        broken_code, _ = self.open_broken_and_solution(step_number=0)
+        results = list(compare_batch([broken_code, broken_code], "def broken(:", True))
+        expected_hint = "The solution code has syntax errors. Please contact your instructor."
+        self.assertEqual([expected_hint, expected_hint], [result.hint for result in results])
+
+    def test_parallel_batch_keeps_submission_order(self):
+        broken_codes = [self.open_broken_and_solution(step_number=step)[0] for step in range(8)]
+        _, solution_code = self.open_broken_and_solution(step_number=0)
+        sequential = list(compare_batch(broken_codes, solution_code, True))
+        parallel = list(compare_batch(broken_codes, solution_code, True, workers=2))
+        self.assertEqual(sequential, parallel)
+
+    def test_spawned_batch_workers_get_the_settings(self):
+        self.addCleanup(compare.apply_worker_settings, *compare.worker_settings())
+        compare.apply_worker_settings("none", tools.log_levels["ERROR"], 2.5)
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=compare.init_batch_worker,
+                                 initargs=(None, True, *compare.worker_settings())) as executor:
+            self.assertEqual(("none", tools.log_levels["ERROR"], 2.5),
+                             executor.submit(compare.worker_settings).result())
+
+    def test_parallel_batch_reports_failures(self):
+        broken_code, solution_code = self.open_broken_and_solution(step_number=0)
+        results = list(compare_batch([broken_code, None, broken_code], solution_code, True, workers=2))
+        self.assertIsNone(results[0].error)
+        self.assertIsNotNone(results[1].error)
+        self.assertEqual(results[0], results[2])
@@ -0,0 +1,56 @@
+import math
+import unittest
+
+from comparison.utils.sequential_test import SequentialMean
+
+
+class TestSequentialMean(unittest.TestCase):
+    def test_rejects_once_the_threshold_is_out_of_reach(self):
+        running_mean = SequentialMean(0.85, total=10)
+        running_mean.add(0.0)
+        self.assertIsNone(running_mean.decision())
+        running_mean.add(0.0)
+        self.assertFalse(running_mean.decision())
+        self.assertEqual(running_mean.evaluation(), (0.0, False, 2, True))
+
+    def test_accepts_once_the_threshold_is_certain(self):
+        running_mean = SequentialMean(0.85, total=10)
+        for _ in range(8):
+            running_mean.add(1.0)
+        self.assertIsNone(running_mean.decision())
+        running_mean.add(1.0)
+        self.assertTrue(running_mean.decision())
+
+    def test_missing_scores_do_not_count(self):
+        running_mean = SequentialMean(0.85, total=3)
+        running_mean.add(None)
+        running_mean.add(0.9)
+        self.assertIsNone(running_mean.decision())
+        running_mean.add(None)
+        self.assertEqual(running_mean.evaluation(), (0.9, True, 3, False))
+
+    def test_hoeffding_bound_settles_long_runs(self):
+        running_mean = SequentialMean(0.85, total=1000, delta=0.05)
+        consumed = 0
+        while running_mean.decision() is None:
+            running_mean.add(0.5)
+            consumed += 1
+        self.assertFalse(running_mean.decision())
+        self.assertLess(consumed, 60)
+        self.assertIsNone(SequentialMean(0.85, total=1000).decision())
+
+    def test_hoeffding_bound_pays_for_every_look(self):
+        # The bound is checked after each attempt, so it must be wider than a single look at delta would need
+        running_mean = SequentialMean(0.85, delta=0.05)
+        for _ in range(20):
+            running_mean.add(0.5)
+        single_look_radius = math.sqrt(math.log(2 / 0.05) / (2 * 20))
+        self.assertLess(running_mean.mean + single_look_radius, 0.85)
+        self.assertIsNone(running_mean.decision())
+        running_mean = SequentialMean(0.85, total=10, delta=0.05)
+        running_mean.add(0.5)
+        self.assertAlmostEqual(running_mean.hoeffding_radius(), math.sqrt(math.log(2 / 0.005) / 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
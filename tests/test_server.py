@@ -0,0 +1,131 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import compare
+from compare import compare_solutions
+from comparison.utils import normalize
+from problem_index import build_index
+from server import HintServer
+
+
+class TestHintServer(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.problems_dir = os.path.join(cls.directory.name, "problems")
+        shutil.copytree(os.path.join(project_root, "problems"), cls.problems_dir)
+        cls.index_dir = os.path.join(cls.directory.name, "index")
+        build_index(cls.problems_dir, cls.index_dir)
+        with open(os.path.join(cls.problems_dir, "p1", "goal_code.py")) as file:
+            cls.solution_code = file.read()
+        with open(os.path.join(cls.problems_dir, "p1", "student_code.py")) as file:
+            cls.student_code = file.read()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    async def asyncSetUp(self):
+        self.hint_server = HintServer(workers=1, index_dir=self.index_dir)
+        server = await self.hint_server.start(port=0)
+        self.port = server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        await self.hint_server.close()
+
+    async def request(self, method, path, body=None):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n"
+                     .encode("latin-1") + payload)
+        response = await reader.read()
+        writer.close()
+        head, _, content = response.partition(b"\r\n\r\n")
+        return int(head.split(b" ")[1]), json.loads(content)
+
+    async def test_compare_gives_the_cli_hint_with_timings(self):
+        expected_hint = compare_solutions(self.student_code, self.solution_code, True)
+        expected_complete, expected_estimated = compare.hint_complete, compare.hint_estimated
+        for _ in range(2):
+            status, response = await self.request("POST", "/compare", {"student_code": self.student_code,
+                                                                       "solution_code": self.solution_code})
+            self.assertEqual(status, 200)
+            self.assertEqual(response["hint"], expected_hint)
+            self.assertEqual(response["complete"], expected_complete)
+            self.assertEqual(response["estimated"], expected_estimated)
+            self.assertEqual(set(response["timings"]), {"format", "goal", "compare", "queue", "total"})
+
+    async def test_compare_by_problem_id(self):
+        status, response = await self.request("POST", "/compare", {"student_code": self.student_code,
+                                                                   "problem_id": "p1"})
+        self.assertEqual(status, 200)
+        self.assertEqual(response["hint"], compare_solutions(self.student_code, self.solution_code, True))
+        status, response = await self.request("POST", "/compare", {"student_code": self.student_code,
+                                                                   "problem_id": "p2"})
+        self.assertEqual(status, 404)
+        self.assertEqual(response["error"], "Unknown problem p2")
+        status, response = await self.request("POST", "/compare", {"student_code": self.student_code,
+                                                                   "problem_id": "p1", "canonicalize": False})
+        self.assertEqual(status, 400)
+
+    async def test_rejects_bad_requests(self):
+        self.assertEqual((await self.request("POST", "/compare", {"solution_code": "x = 1"}))[0], 400)
+        self.assertEqual((await self.request("POST", "/compare", {"student_code": "x = 1", "solution_code": "x = 2",
+                                                                  "time_budget": -1}))[0], 400)
+        self.assertEqual((await self.request("POST", "/compare", {"student_code": "x = 1", "solution_code": "x = 2",
+                                                                  "canonicalize": "false"}))[0], 400)
+        self.assertEqual((await self.request("GET", "/compare"))[0], 405)
+        self.assertEqual((await self.request("GET", "/nothing"))[0], 404)
+        self.assertEqual(await self.request("GET", "/health"), (200, {"status": "ok"}))
+
+    async def test_keeps_the_connection_alive(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        for _ in range(2):
+            writer.write(b"GET /health HTTP/1.1\r\n\r\n")
+            self.assertEqual(await reader.readline(), b"HTTP/1.1 200 OK\r\n")
+            while (await reader.readline()) != b"\r\n":
+                pass
+            self.assertEqual(json.loads(await reader.readexactly(16)), {"status": "ok"})
+        writer.close()
+
+
+class TestHintServerNormalizeMode(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(normalize.set_normalize_mode, normalize.normalize_mode)
+        normalize.set_normalize_mode("fast")
+        problems_dir = os.path.join(directory.name, "problems")
+        shutil.copytree(os.path.join(project_root, "problems"), problems_dir)
+        index_dir = os.path.join(directory.name, "index")
+        build_index(problems_dir, index_dir)
+        with open(os.path.join(problems_dir, "p1", "goal_code.py")) as file:
+            self.solution_code = file.read()
+        with open(os.path.join(problems_dir, "p1", "student_code.py")) as file:
+            self.student_code = file.read()
+        self.hint_server = HintServer(workers=1, index_dir=index_dir)
+        server = await self.hint_server.start(port=0)
+        self.port = server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        await self.hint_server.close()
+
+    async def test_serves_an_index_built_in_another_mode(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        payload = json.dumps({"student_code": self.student_code, "problem_id": "p1"}).encode("utf-8")
+        writer.write(f"POST /compare HTTP/1.1\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n"
+                     .encode("latin-1") + payload)
+        head, _, content = (await reader.read()).partition(b"\r\n\r\n")
+        writer.close()
+        self.assertEqual(int(head.split(b" ")[1]), 200)
+        self.assertEqual(json.loads(content)["hint"], compare_solutions(self.student_code, self.solution_code, True))
+
+
+if __name__ == '__main__':
+    unittest.main()
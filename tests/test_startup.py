@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+import unittest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+resource_path = os.path.join(project_root, "tests", "resources")
+# Cold-start import budget of `astHint compare`, in milliseconds
+startup_budget_ms = float(os.environ.get("AST_HINT_STARTUP_BUDGET_MS", 400))
+
+
+def import_times(*args):
+    """Run astHint with -X importtime, returns the cumulative import time in microseconds of each module it
+    imported and how much of it was spent on top level imports"""
+    python_path = os.pathsep.join([project_root, os.path.join(project_root, "comparison")])
+    environment = dict(os.environ, PYTHONPATH=python_path)
+    result = subprocess.run([sys.executable, "-X", "importtime", os.path.join(project_root, "astHint.py"), *args],
+                            capture_output=True, text=True, env=environment, cwd=project_root)
+    modules, total = {}, 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative)
+        if not name.startswith("  "):
+            total += int(cumulative)
+    return result, modules, total
+
+
+class TestStartup(unittest.TestCase):
+    def test_logo_imports_no_comparator(self):
+        result, modules, _ = import_times("logo")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertNotIn("compare", modules)
+
+    def test_compare_cold_start(self):
+        student = os.path.join(resource_path, "multi_func_steps", "multi_func0.py")
+        solution = os.path.join(resource_path, "multi_func_solution.py")
+        result, modules, total = import_times("compare", student, solution)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("compare", modules)
+        for heavy_module in ["openai", "dotenv", "generator", "server", "problem_index", "multiprocessing"]:
+            self.assertNotIn(heavy_module, modules)
+        self.assertLess(total / 1000, startup_budget_ms)
+
+
+if __name__ == '__main__':
+    unittest.main()
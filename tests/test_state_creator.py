@@ -1,7 +1,11 @@
 import ast
+import time
 import unittest
 
-from comparison.path_construction.state_creator import map_differences
+from comparison.path_construction.comparator import distance, get_changes_weight, get_weight
+from comparison.path_construction.state_creator import map_differences, get_all_combinations, create_state, \
+    desirability, desirability_bound, estimate_desirability, get_next_state
+from comparison.utils.tools import isSubset, isStrictSubset
 
 
 class TestStateCreator(unittest.TestCase):
@@ -31,3 +35,102 @@ class TestStateCreator(unittest.TestCase):
                                              'len': 2,
                                              'pos': [1, 0]}}}
                          )
+
+    # get_all_combinations tests
+    def create_state_with_changes(self):
+        student_code_state = create_state("a = 1\nb = 2\nc = 3\nd = 4\ne = 5\nf = 6",
+                                          "a = 2\nb = 3\nc = 4\nd = 5\ne = 6\nf = 7", False)
+        student_code_state.distance_to_goal, changes = distance(student_code_state, student_code_state.goal)
+        return student_code_state, changes
+
+    def test_get_all_combinations_tries_every_single_change(self):
+        student_code_state, changes = self.create_state_with_changes()
+        combinations = get_all_combinations(student_code_state, changes)
+        singles = [subset[0] for subset, _, _ in combinations if len(subset) == 1]
+        self.assertEqual(changes, singles)
+
+    def test_get_all_combinations_respects_node_budget(self):
+        student_code_state, changes = self.create_state_with_changes()
+        combinations = get_all_combinations(student_code_state, changes, node_budget=3)
+        self.assertEqual(3, len(combinations))
+
+    def test_get_all_combinations_no_changes(self):
+        student_code_state, _ = self.create_state_with_changes()
+        self.assertEqual([], get_all_combinations(student_code_state, []))
+
+    def test_get_all_combinations_flags_the_node_budget(self):
+        student_code_state, changes = self.create_state_with_changes()
+        get_all_combinations(student_code_state, changes, node_budget=3)
+        self.assertFalse(student_code_state.search_complete)
+
+    def test_get_all_combinations_flags_the_beam(self):
+        single_change_state = create_state("a = 1\nb = 2", "a = 1\nb = 3", False)
+        _, changes = distance(single_change_state, single_change_state.goal)
+        get_all_combinations(single_change_state, changes)
+        self.assertTrue(single_change_state.search_complete)
+        self.assertFalse(single_change_state.search_estimated)
+        student_code_state, changes = self.create_state_with_changes()
+        get_all_combinations(student_code_state, changes, beam_width=2)
+        self.assertFalse(student_code_state.search_complete)
+
+    def test_get_all_combinations_flags_estimated_subsets(self):
+        # Larger subsets are skipped on an estimate that isn't a bound, which doesn't count as a cut
+        student_code_state, changes = self.create_state_with_changes()
+        get_all_combinations(student_code_state, changes, beam_width=64)
+        self.assertTrue(student_code_state.search_complete)
+        self.assertTrue(student_code_state.search_estimated)
+
+    def test_desirability_bound_bounds_the_candidates(self):
+        student_code_state, changes = self.create_state_with_changes()
+        student_weight = get_weight(student_code_state.tree)
+        for subset_changes, _, score in get_all_combinations(student_code_state, changes):
+            if score is not None:
+                self.assertLessEqual(score, desirability_bound(get_changes_weight(subset_changes), student_weight))
+
+    def test_get_all_combinations_scores_the_valid_candidates(self):
+        student_code_state, changes = self.create_state_with_changes()
+        for _, candidate_state, score in get_all_combinations(student_code_state, changes):
+            if score is not None:
+                self.assertEqual(desirability(student_code_state, candidate_state, student_code_state.goal), score)
+
+    def test_get_next_state_stops_at_the_deadline(self):
+        complete_state = create_state("a = 1\nb = 2", "a = 1\nb = 3", False)
+        get_next_state(complete_state)
+        self.assertTrue(complete_state.search_complete)
+        student_code_state = create_state("a = 1\nb = 2\nc = 3\nd = 4\ne = 5\nf = 6",
+                                          "a = 2\nb = 3\nc = 4\nd = 5\ne = 6\nf = 7", False)
+        # A deadline that has already passed doesn't even diff the student and the goal
+        get_next_state(student_code_state, deadline=time.perf_counter())
+        self.assertFalse(student_code_state.search_complete)
+        self.assertIsNone(student_code_state.next)
+        self.assertEqual(-1, student_code_state.distance_to_goal)
+
+    def test_is_subset_counts_duplicates(self):
+        self.assertTrue(isSubset([], []))
+        self.assertTrue(isSubset([1, 2, 1], [1, 3, 1, 2]))
+        self.assertFalse(isSubset([1, 1], [1, 2]))
+        self.assertTrue(isSubset(list(range(5000)), list(reversed(range(5000)))))
+        self.assertFalse(isStrictSubset([1, 2], [2, 1]))
+        self.assertTrue(isStrictSubset([1, 2], [2, 3, 1]))
+
+    def test_estimate_desirability_prefers_smaller_edits(self):
+        self.assertGreater(estimate_desirability(1, 10, 20), estimate_desirability(2, 10, 20))
+        self.assertEqual(1.0, estimate_desirability(0, 0, 20))
+
+    # apply_change tests
+    def test_apply_change_leaves_start_untouched(self):
+        student_code_state, changes = self.create_state_with_changes()
+        before = ast.dump(student_code_state.tree)
+        for change in changes:
+            change.apply_change()
+        self.assertEqual(before, ast.dump(student_code_state.tree))
+
+    def test_apply_change_shares_untouched_subtrees(self):
+        student_code_state, changes = self.create_state_with_changes()
+        change = changes[0]
+        new_tree = change.apply_change()
+        self.assertIsNot(student_code_state.tree, new_tree)
+        changed_line = change.path[-2]
+        for i, statement in enumerate(new_tree.body):
+            if i != changed_line:
+                self.assertIs(student_code_state.tree.body[i], statement)
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+from comparison.utils import tools
+
+
+class TestLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(setattr, tools, "log_threshold", tools.log_threshold)
+        self.addCleanup(setattr, tools, "log_writer", tools.log_writer)
+        tools.log_writer = tools.LogWriter(self.directory.name)
+
+    def read(self, filename):
+        tools.log_writer.flush()
+        path = os.path.join(self.directory.name, filename + ".log")
+        if not os.path.exists(path):
+            return None
+        with open(path) as file:
+            return file.read()
+
+    def test_appends_in_order(self):
+        for i in range(100):
+            tools.log(f"message {i}", "test")
+        tools.log("no stamp", "test", newline=False)
+        lines = self.read("test").split("\n")
+        self.assertEqual([line.split("\t")[1] for line in lines[:100]], [f"message {i}" for i in range(100)])
+        self.assertEqual(lines[100], "no stamp")
+
+    def test_filters_by_level(self):
+        tools.set_log_level("warning")
+        tools.log("dropped")
+        tools.log("kept", "bug")
+        tools.log("kept too", "test", level=tools.log_levels["ERROR"])
+        self.assertIsNone(self.read("main"))
+        self.assertTrue(self.read("bug").endswith("\tkept\n"))
+        self.assertTrue(self.read("test").endswith("\tkept too\n"))
+        self.assertRaises(ValueError, tools.set_log_level, "LOUD")
+
+    def test_off_writes_nothing(self):
+        tools.set_log_level("OFF")
+        tools.log("dropped", "bug", level=tools.log_levels["CRITICAL"])
+        self.assertIsNone(tools.log_writer.pid)
+        self.assertIsNone(self.read("bug"))
+
+    def test_enabled_matches_the_filter(self):
+        tools.set_log_level("error")
+        self.assertFalse(tools.log_enabled("bug"))
+        self.assertTrue(tools.log_enabled("bug", level=tools.log_levels["CRITICAL"]))
+        tools.set_log_level("warning")
+        self.assertTrue(tools.log_enabled("bug"))
+        self.assertFalse(tools.log_enabled())
+
+
+if __name__ == '__main__':
+    unittest.main()